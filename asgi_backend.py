@@ -0,0 +1,980 @@
+#!/usr/bin/env python3
+"""
+JARVIS Unified Backend - ASGI entry point
+
+Serves the same routes as unified_backend:app on an asyncio server. /ws
+connections and their outbound queues, and POST /api/content/generate
+(including its upstream provider calls), run as coroutines on the event loop,
+so an idle dashboard or a slow LLM call no longer pins an OS thread. Every
+other route runs the Flask app in a thread pool.
+
+State is shared with the WSGI app: the broadcast hub, provider health, rate
+limits, the generation cache and request metrics are the same objects, so
+both serving modes can run side by side on one host. Calls into the state
+store and the generation cache may wait on SQLite locks held by other
+workers, so they run in a thread pool; only the limiter's waits are
+awaited on the loop.
+
+Run: uvicorn asgi_backend:app --port 8000 [--workers 4]
+     python asgi_backend.py    (PORT and WEB_CONCURRENCY are honoured)
+"""
+
+import asyncio
+import functools
+import io
+import json
+import os
+import ssl
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import unified_backend as backend
+from unified_backend import ProviderError, RateLimited
+
+# Threads running the Flask app for routes without a native handler
+WSGI_WORKERS = int(os.environ.get('ASGI_WSGI_WORKERS', 32))
+# Threads for state store and generation cache calls (SQLite locks can block for seconds)
+STATE_WORKERS = int(os.environ.get('ASGI_STATE_WORKERS', 16))
+# Errors from the async transport that mean the connection failed
+TRANSPORT_ERRORS = (OSError, EOFError)
+
+wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_WORKERS, thread_name_prefix="asgi-wsgi")
+state_executor = ThreadPoolExecutor(max_workers=STATE_WORKERS, thread_name_prefix="asgi-state")
+
+
+async def off_loop(func, *args, **kwargs):
+    """Run blocking state work in state_executor so it never stalls the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(state_executor,
+                                                            functools.partial(func, *args, **kwargs))
+
+
+# ============================================================================
+# ASYNC HTTP CLIENT
+# ============================================================================
+
+class AsyncResponse:
+    """An HTTP/1.1 response whose body is read incrementally from the connection"""
+
+    def __init__(self, reader: asyncio.StreamReader, status: int, headers: Dict[str, str], timeout: float):
+        self.reader = reader
+        self.status = status
+        self.headers = headers
+        self.timeout = timeout
+        self.chunked = headers.get("transfer-encoding", "").lower() == "chunked"
+        self.remaining = None if self.chunked or "content-length" not in headers else int(headers["content-length"])
+        self.will_close = headers.get("connection", "").lower() == "close" or \
+            (not self.chunked and self.remaining is None)
+        self.complete = self.remaining == 0
+        self._buffer = b""
+
+    async def _read_some(self) -> bytes:
+        """The next piece of the body; b"" once it has been read completely"""
+        if self.complete:
+            return b""
+        if self.chunked:
+            size_line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            if not size_line:
+                raise ConnectionResetError("connection closed mid-body")
+            size = int(size_line.split(b";")[0].strip(), 16)
+            if size == 0:
+                # Skip trailers up to the blank line that ends the message
+                while (await self.reader.readline()).strip():
+                    pass
+                self.complete = True
+                return b""
+            data = await asyncio.wait_for(self.reader.readexactly(size + 2), self.timeout)
+            return data[:-2]
+        data = await asyncio.wait_for(self.reader.read(min(65536, self.remaining or 65536)), self.timeout)
+        if self.remaining is None:
+            self.complete = not data
+            return data
+        if not data:
+            raise ConnectionResetError("connection closed mid-body")
+        self.remaining -= len(data)
+        self.complete = self.remaining == 0
+        return data
+
+    async def read(self) -> bytes:
+        parts = [self._buffer]
+        self._buffer = b""
+        while True:
+            data = await self._read_some()
+            if not data:
+                return b"".join(parts)
+            parts.append(data)
+
+    async def readline(self) -> bytes:
+        while b"\n" not in self._buffer:
+            data = await self._read_some()
+            if not data:
+                line, self._buffer = self._buffer, b""
+                return line
+            self._buffer += data
+        line, _, self._buffer = self._buffer.partition(b"\n")
+        return line + b"\n"
+
+
+class AsyncConnectionPool:
+    """Keep-alive HTTP(S) connections to one host for the event loop, at most ``max_connections`` at a time.
+
+    The async counterpart of unified_backend.ConnectionPool: idle
+    connections are reused LIFO and a reused connection the server already
+    closed is replaced once, transparently.
+    """
+
+    def __init__(self, base_url: str, max_connections: int = backend.PROVIDER_MAX_CONNECTIONS,
+                 timeout: float = backend.PROVIDER_TIMEOUT):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.netloc = parts.netloc
+        self.base_path = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._slots = asyncio.Semaphore(max_connections)
+        self._idle: List[tuple] = []
+        self.opened = 0
+        self.reused = 0
+
+    async def _connect(self) -> tuple:
+        self.opened += 1
+        context = ssl.create_default_context() if self.scheme == 'https' else None
+        return await asyncio.wait_for(asyncio.open_connection(self.host, self.port, ssl=context), self.timeout)
+
+    async def _send(self, conn: tuple, method: str, path: str, body: bytes,
+                    headers: Dict[str, str]) -> AsyncResponse:
+        reader, writer = conn
+        lines = [f"{method} {self.base_path}{path} HTTP/1.1", f"Host: {self.netloc}",
+                 f"Content-Length: {len(body)}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write("\r\n".join(lines).encode("latin-1") + b"\r\n\r\n" + body)
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), self.timeout)
+        if not status_line:
+            raise ConnectionResetError("server closed the connection")
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            raise ConnectionResetError(f"malformed status line: {status_line[:100]!r}")
+        response_headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), self.timeout)
+            if not line.strip():
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        return AsyncResponse(reader, status, response_headers, self.timeout)
+
+    async def open(self, method: str, path: str, body: bytes = b"",
+                   headers: Optional[Dict[str, str]] = None) -> tuple:
+        """Send a request and return (connection, response) with the body unread.
+
+        The caller must hand the connection back through ``release()``.
+        """
+        await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        reused = bool(self._idle)
+        conn = None
+        try:
+            if reused:
+                conn = self._idle.pop()
+                self.reused += 1
+            else:
+                conn = await self._connect()
+            try:
+                response = await self._send(conn, method, path, body, headers or {})
+            except TRANSPORT_ERRORS:
+                if not reused:
+                    raise
+                # The server dropped an idle keep-alive connection; retry once on a fresh one
+                conn[1].close()
+                conn = await self._connect()
+                response = await self._send(conn, method, path, body, headers or {})
+        except BaseException:
+            if conn is not None:
+                conn[1].close()
+            self._slots.release()
+            raise
+        return conn, response
+
+    def release(self, conn: tuple, response: AsyncResponse):
+        if response.complete and not response.will_close:
+            self._idle.append(conn)
+        else:
+            conn[1].close()
+        self._slots.release()
+
+    async def request(self, method: str, path: str, body: bytes = b"",
+                      headers: Optional[Dict[str, str]] = None) -> tuple:
+        """Send a request and return (status, body bytes)"""
+        conn, response = await self.open(method, path, body, headers)
+        try:
+            data = await response.read()
+        finally:
+            self.release(conn, response)
+        return response.status, data
+
+    def close(self):
+        while self._idle:
+            self._idle.pop()[1].close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "host": self.host,
+            "max_connections": self.max_connections,
+            "idle": len(self._idle),
+            "opened": self.opened,
+            "reused": self.reused
+        }
+
+
+class AsyncProviderPools:
+    """One async connection pool per provider, created on the event loop on first use"""
+
+    def __init__(self):
+        self._pools: Dict[str, AsyncConnectionPool] = {}
+
+    def get(self, provider: backend.ChatProvider) -> AsyncConnectionPool:
+        pool = self._pools.get(provider.name)
+        if pool is None:
+            pool = self._pools[provider.name] = AsyncConnectionPool(provider.base_url)
+        return pool
+
+    def close(self):
+        for pool in self._pools.values():
+            pool.close()
+
+
+provider_pools = AsyncProviderPools()
+
+
+async def iter_sse(response: AsyncResponse):
+    """Yield (event, data) pairs from a Server-Sent Events response"""
+    event, data = None, []
+    while True:
+        line = await response.readline()
+        if not line:
+            break
+        line = line.decode('utf-8', errors='replace').rstrip('\r\n')
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = None, []
+        elif line.startswith('event:'):
+            event = line[6:].strip()
+        elif line.startswith('data:'):
+            data.append(line[5:].lstrip())
+    if data:
+        yield event, "\n".join(data)
+
+
+# ============================================================================
+# ASYNC PROVIDER CALLS
+# ============================================================================
+
+def request_headers(provider: backend.ChatProvider, **extra: str) -> Dict[str, str]:
+    return dict(provider._headers(), **{"Content-Type": "application/json"}, **extra)
+
+
+async def provider_post(provider: backend.ChatProvider, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        status, data = await provider_pools.get(provider).request("POST", path, json.dumps(payload).encode(),
+                                                                  request_headers(provider))
+    except TRANSPORT_ERRORS as e:
+        raise ProviderError(provider.name, f"connection failed: {e}", retryable=True) from e
+    if status >= 400:
+        raise ProviderError(provider.name, f"HTTP {status}: {data[:500].decode(errors='replace')}",
+                            status=status, retryable=status == 429 or status >= 500)
+    return json.loads(data)
+
+
+async def provider_stream(provider: backend.ChatProvider, path: str, payload: Dict[str, Any]):
+    """POST a streaming request and yield its SSE (event, data) pairs"""
+    pool = provider_pools.get(provider)
+    try:
+        conn, response = await pool.open("POST", path, json.dumps(payload).encode(),
+                                         request_headers(provider, Accept="text/event-stream"))
+    except TRANSPORT_ERRORS as e:
+        raise ProviderError(provider.name, f"connection failed: {e}", retryable=True) from e
+    try:
+        if response.status >= 400:
+            body = await response.read()
+            raise ProviderError(provider.name, f"HTTP {response.status}: {body[:500].decode(errors='replace')}",
+                                status=response.status, retryable=response.status == 429 or response.status >= 500)
+        async for event, data in iter_sse(response):
+            yield event, data
+    except TRANSPORT_ERRORS as e:
+        raise ProviderError(provider.name, f"stream interrupted: {e}", retryable=True) from e
+    finally:
+        pool.release(conn, response)
+
+
+async def provider_chat(provider: backend.ChatProvider, system_prompt: str, prompt: str, model: Optional[str],
+                        temperature: float, max_tokens: int) -> Dict[str, Any]:
+    """ChatProvider.chat() over the async transport"""
+    path, payload, model = provider.chat_request(system_prompt, prompt, model, temperature, max_tokens)
+    return provider.parse_chat(await provider_post(provider, path, payload), model)
+
+
+async def provider_stream_chat(provider: backend.ChatProvider, system_prompt: str, prompt: str,
+                               model: Optional[str], temperature: float, max_tokens: int):
+    """ChatProvider.stream_chat() over the async transport"""
+    path, payload, model = provider.chat_request(system_prompt, prompt, model, temperature, max_tokens, stream=True)
+    usage = {"model": model, "input_tokens": 0, "output_tokens": 0}
+    async for event, data in provider_stream(provider, path, payload):
+        for chunk in provider.parse_stream_event(usage, event, data):
+            yield chunk
+    yield {"model": usage.pop("model"), "usage": usage}
+
+
+def advance_lease(steps) -> tuple:
+    """One step of RateLimiter.acquire_steps(): (seconds to wait, None) or (None, lease)"""
+    try:
+        return next(steps), None
+    except StopIteration as done:
+        # Returned rather than raised: a StopIteration cannot be set on a future
+        return None, done.value
+
+
+async def acquire_lease(name: str, tokens: int) -> backend.ProviderLease:
+    """RateLimiter.acquire() with its state steps in state_executor and its waits awaited"""
+    steps = backend.rate_limiter.acquire_steps(name, tokens)
+    loop = asyncio.get_running_loop()
+    step = None
+    try:
+        while True:
+            step = loop.run_in_executor(state_executor, advance_lease, steps)
+            # Shielded so a cancelled caller leaves the step to finish before the generator is closed
+            wait_seconds, lease = await asyncio.shield(step)
+            if lease is not None:
+                return lease
+            await asyncio.sleep(wait_seconds)
+    finally:
+        # Closing gives back any in-flight slot an unfinished acquisition holds
+        if step is not None and not step.done():
+            step.add_done_callback(lambda _: state_executor.submit(steps.close))
+        else:
+            state_executor.submit(steps.close)
+
+
+class AsyncProviderRouter:
+    """ProviderRouter's failover and hedging with upstream calls as coroutines.
+
+    Plans, provider health and rate limits are those of the threaded router,
+    so both serving modes share latency and error history.
+    """
+
+    def __init__(self, router: backend.ProviderRouter):
+        self.router = router
+
+    async def _call(self, name: str, model: Optional[str], system_prompt: str, prompt: str,
+                    temperature: float, max_tokens: int) -> Dict[str, Any]:
+        provider = backend.provider_registry.get(name)
+        lease = await acquire_lease(name, backend.estimate_tokens(system_prompt + prompt) + max_tokens)
+        started = time.perf_counter()
+        try:
+            response = await provider_chat(provider, system_prompt, prompt, model, temperature, max_tokens)
+        except BaseException as e:
+            if isinstance(e, Exception):
+                self.router._record(name, "chat", time.perf_counter() - started, False)
+                await off_loop(backend.rate_limiter.release, lease)
+            else:
+                # Cancelled: release without awaiting, the task is being torn down
+                state_executor.submit(backend.rate_limiter.release, lease)
+            raise
+        await off_loop(backend.rate_limiter.release, lease, response["input_tokens"] + response["output_tokens"])
+        elapsed = time.perf_counter() - started
+        self.router._record(name, "chat", elapsed, True)
+        return dict(response, provider=name, latency_ms=round(elapsed * 1000, 1), queued_ms=round(lease.waited_ms, 1),
+                    cost=provider.cost(response["input_tokens"], response["output_tokens"]))
+
+    async def chat(self, system_prompt: str, prompt: str, model_id: Optional[str] = None,
+                   temperature: float = 0.7, max_tokens: int = 1500):
+        """Generate through the best available provider; returns (response, routing)"""
+        requested = model_id or await off_loop(backend.get_active_model)
+        remaining = self.router.plan(requested)
+        if not remaining:
+            raise ProviderError("router", f"no configured provider for model {requested}")
+        started = time.perf_counter()
+        attempts = []
+        pending = {}
+        hedged = False
+        last_error = None
+
+        def launch():
+            name, model = remaining.pop(0)
+            task = asyncio.ensure_future(self._call(name, model, system_prompt, prompt, temperature, max_tokens))
+            pending[task] = (name, model)
+
+        launch()
+        while pending:
+            timeout = None
+            if not hedged and remaining and len(pending) == 1:
+                timeout = self.router._hedge_after(next(iter(pending.values()))[0])
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                launch()
+                continue
+            for task in done:
+                name, model = pending.pop(task)
+                try:
+                    response = task.result()
+                except Exception as e:
+                    last_error = e
+                    attempts.append({"provider": name, "status": "error", "error": str(e)})
+                    continue
+                attempts.append({"provider": name, "status": "ok", "latency_ms": response["latency_ms"],
+                                 "queued_ms": response["queued_ms"]})
+                for loser in pending:
+                    attempts.append({"provider": pending[loser][0], "status": "abandoned"})
+                    loser.add_done_callback(lambda task: state_executor.submit(self.router._charge_loser, task))
+                return response, {
+                    "requested_model": requested,
+                    "provider": name,
+                    "model": response["model"],
+                    "hedged": hedged,
+                    "failover": any(attempt["status"] == "error" for attempt in attempts),
+                    "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+                    "attempts": attempts
+                }
+            if not pending and remaining:
+                launch()
+        raise last_error
+
+    async def stream(self, system_prompt: str, prompt: str, model_id: Optional[str] = None,
+                     temperature: float = 0.7, max_tokens: int = 1500):
+        """Stream through the best available provider, failing over until the first token"""
+        requested = model_id or await off_loop(backend.get_active_model)
+        remaining = self.router.plan(requested)
+        if not remaining:
+            raise ProviderError("router", f"no configured provider for model {requested}")
+        attempts = []
+        last_error = None
+        for name, model in remaining:
+            provider = backend.provider_registry.get(name)
+            try:
+                lease = await acquire_lease(name, backend.estimate_tokens(system_prompt + prompt) + max_tokens)
+            except RateLimited as e:
+                last_error = e
+                attempts.append({"provider": name, "status": "error", "error": str(e)})
+                continue
+            started = time.perf_counter()
+            first_token = None
+            used_tokens = None
+            try:
+                async for chunk in provider_stream_chat(provider, system_prompt, prompt, model,
+                                                        temperature, max_tokens):
+                    if "text" in chunk:
+                        if first_token is None:
+                            first_token = time.perf_counter()
+                        yield chunk
+                        continue
+                    elapsed = time.perf_counter() - started
+                    self.router._record(name, "stream", elapsed, True)
+                    latency_ms = elapsed * 1000
+                    attempts.append({"provider": name, "status": "ok", "latency_ms": round(latency_ms, 1),
+                                     "queued_ms": round(lease.waited_ms, 1)})
+                    usage = chunk["usage"]
+                    used_tokens = usage["input_tokens"] + usage["output_tokens"]
+                    yield dict(chunk, provider=name,
+                               cost=provider.cost(usage["input_tokens"], usage["output_tokens"]),
+                               routing={
+                                   "requested_model": requested,
+                                   "provider": name,
+                                   "model": chunk["model"],
+                                   "hedged": False,
+                                   "failover": len(attempts) > 1,
+                                   "latency_ms": round(latency_ms, 1),
+                                   "attempts": attempts
+                               })
+                    return
+            except Exception as e:
+                self.router._record(name, "stream", time.perf_counter() - started, False)
+                if first_token is not None:
+                    raise
+                last_error = e
+                attempts.append({"provider": name, "status": "error", "error": str(e)})
+            finally:
+                # Not awaited: this also runs when the stream is closed or cancelled mid-way
+                state_executor.submit(backend.rate_limiter.release, lease, used_tokens)
+        raise last_error
+
+
+provider_router = AsyncProviderRouter(backend.provider_router)
+
+
+# ============================================================================
+# CONTENT GENERATION
+# ============================================================================
+
+# Identical concurrent generations in this worker share one upstream call
+generation_flights: Dict[str, asyncio.Future] = {}
+# Background ws-mode publishers; referenced so they are not garbage collected mid-stream
+publish_tasks = set()
+
+
+async def generate_text(prompt: str, persona: str) -> tuple:
+    """unified_backend.generate_text() with the upstream call awaited on the loop"""
+    try:
+        model_id = await off_loop(backend.get_active_model)
+        if not backend.provider_router.plan(model_id):
+            return backend.demo_generation(prompt, persona), 200
+        system_prompt = backend.PERSONA_PROMPTS.get(persona, "You are a helpful AI assistant.")
+        cache_key = backend.generation_cache_key(model_id, system_prompt, prompt,
+                                                 backend.GENERATION_TEMPERATURE, backend.GENERATION_MAX_TOKENS)
+        cached = await off_loop(backend.generation_cache.get, cache_key)
+        if cached is not None:
+            return backend.cached_generation_body(cached, persona), 200
+
+        async def generate():
+            response, routing = await provider_router.chat(system_prompt, prompt, model_id,
+                                                           temperature=backend.GENERATION_TEMPERATURE,
+                                                           max_tokens=backend.GENERATION_MAX_TOKENS)
+            await off_loop(backend.add_cost, "ai_apis", response["cost"])
+            if backend.generation_cacheable(routing):
+                await off_loop(backend.generation_cache.put, cache_key, response["text"], response["model"],
+                               response["input_tokens"], response["output_tokens"], response["cost"])
+            return dict(response, routing=routing)
+
+        flight = generation_flights.get(cache_key)
+        shared = flight is not None
+        if flight is None:
+            flight = generation_flights[cache_key] = asyncio.ensure_future(generate())
+            flight.add_done_callback(lambda _: generation_flights.pop(cache_key, None))
+        # A caller that disconnects must not cancel the call other callers share
+        result = await asyncio.shield(flight)
+        return backend.generation_body(result, persona, shared), 200
+
+    except Exception as e:
+        return backend.generation_failure(e), 500
+
+
+async def stream_generation(system_prompt: str, prompt: str, persona: str, request_id: str,
+                            cache_key: str, model_id: str):
+    """Yield the same start/token/done (or error) events as unified_backend.stream_generation()"""
+    started = time.perf_counter()
+    ttft_ms = None
+    parts = []
+    yield {"event": "start", "request_id": request_id, "persona": persona, "model": model_id}
+    try:
+        async for chunk in provider_router.stream(system_prompt, prompt, model_id,
+                                                  temperature=backend.GENERATION_TEMPERATURE,
+                                                  max_tokens=backend.GENERATION_MAX_TOKENS):
+            if "text" in chunk:
+                if ttft_ms is None:
+                    ttft_ms = round((time.perf_counter() - started) * 1000, 1)
+                parts.append(chunk["text"])
+                yield {"event": "token", "text": chunk["text"]}
+                continue
+            usage = chunk["usage"]
+            await off_loop(backend.add_cost, "ai_apis", chunk["cost"])
+            if backend.generation_cacheable(chunk["routing"]):
+                await off_loop(backend.generation_cache.put, cache_key, "".join(parts), chunk["model"],
+                               usage["input_tokens"], usage["output_tokens"], chunk["cost"])
+            yield {
+                "event": "done",
+                "request_id": request_id,
+                "model": chunk["model"],
+                "tokens_used": usage["input_tokens"] + usage["output_tokens"],
+                "cost": round(chunk["cost"], 4),
+                "cached": False,
+                "routing": chunk["routing"],
+                "ttft_ms": ttft_ms,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+    except Exception as e:
+        yield {"event": "error", "request_id": request_id, "error": str(e)}
+
+
+async def replay_generation(entry: Dict[str, Any], persona: str, request_id: str):
+    for event in backend.replay_generation(entry, persona, request_id):
+        yield event
+
+
+async def publish_generation(events, topic: str):
+    """Publish generation events to WebSocket subscribers of ``topic``, coalescing tokens"""
+    pending, flush_at = [], 0.0
+    async for event in events:
+        if event["event"] == "token":
+            if not pending:
+                flush_at = time.monotonic() + backend.STREAM_FLUSH_MS / 1000
+            pending.append(event["text"])
+            if time.monotonic() < flush_at:
+                continue
+        if pending:
+            backend.broadcast_message({"source": "CONTENT", "event": "token", "text": "".join(pending)}, topic)
+            pending = []
+        if event["event"] != "token":
+            backend.broadcast_message(dict(event, source="CONTENT"), topic)
+
+
+async def content_generate(scope, receive, send):
+    """POST /api/content/generate: JSON, SSE (stream: true | "sse") or WebSocket (stream: "ws") results"""
+    body = await read_body(receive)
+    try:
+        validated_data = backend.ContentGenerateRequest(**json.loads(body or b"null"))
+        prompt = validated_data.prompt
+        persona = validated_data.persona
+    except Exception as e:
+        return await send_json(scope, send, {"error": f"Invalid input: {str(e)}"}, 400)
+
+    if not validated_data.stream:
+        result, status = await generate_text(prompt, persona)
+        return await send_json(scope, send, result, status)
+
+    try:
+        model_id = await off_loop(backend.get_active_model)
+        if not backend.provider_router.plan(model_id):
+            return await send_json(scope, send, backend.demo_generation(prompt, persona), 200)
+        system_prompt = backend.PERSONA_PROMPTS.get(persona, "You are a helpful AI assistant.")
+        cache_key = backend.generation_cache_key(model_id, system_prompt, prompt,
+                                                 backend.GENERATION_TEMPERATURE, backend.GENERATION_MAX_TOKENS)
+        cached = await off_loop(backend.generation_cache.get, cache_key)
+
+        request_id = validated_data.request_id or uuid.uuid4().hex
+        if cached is not None:
+            events = replay_generation(cached, persona, request_id)
+        else:
+            events = stream_generation(system_prompt, prompt, persona, request_id, cache_key, model_id)
+    except Exception as e:
+        return await send_json(scope, send, backend.generation_failure(e), 500)
+
+    if validated_data.stream == "ws":
+        topic = f"{backend.CONTENT_STREAM_TOPIC}.{request_id}"
+        task = asyncio.ensure_future(publish_generation(events, topic))
+        publish_tasks.add(task)
+        task.add_done_callback(publish_tasks.discard)
+        return await send_json(scope, send, {"status": "streaming", "request_id": request_id, "topic": topic}, 202)
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream; charset=utf-8"), (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no")] + cors_headers(scope)
+    })
+    try:
+        async for event in events:
+            await send({"type": "http.response.body", "body": backend.sse_frame(event).encode(), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        # Stops the upstream stream early if the client went away
+        await events.aclose()
+
+
+# ============================================================================
+# WEBSOCKETS
+# ============================================================================
+
+class AsyncClientConnection(backend.ClientConnection):
+    """A WebSocket client whose outbound queue is drained by a task on the event loop.
+
+    The hub still enqueues from any thread, under the queue's condition;
+    each enqueue wakes the writer task through call_soon_threadsafe.
+    """
+
+    def __init__(self, send, loop: asyncio.AbstractEventLoop):
+        self._asgi_send = send
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        super().__init__(None)
+
+    def _start_writer(self):
+        # websocket_endpoint runs drain() as a task instead of a thread
+        self._writer = None
+
+    def _wake(self):
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            # The loop is already closed
+            pass
+
+    def send(self, payload, topic: str = ""):
+        queued = super().send(payload, topic)
+        self._wake()
+        return queued
+
+    def close(self):
+        super().close()
+        self._wake()
+
+    def _take_batch(self) -> list:
+        """Pop the next payload, plus queued payloads of the same type when batching"""
+        batch = [self._queue.popleft()[1]]
+        while self.batch_window and self._queue and len(batch) < backend.WS_MAX_BATCH \
+                and type(self._queue[0][1]) is type(batch[0]):
+            batch.append(self._queue.popleft()[1])
+        return batch
+
+    async def drain(self):
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                if self.batch_window and not self.closed:
+                    # Gather whatever else arrives within the batch window
+                    await asyncio.sleep(self.batch_window)
+                while True:
+                    with self._cond:
+                        if self.closed:
+                            return
+                        if not self._queue:
+                            break
+                        batch = self._take_batch()
+                    frame = batch[0] if len(batch) == 1 else backend.encode_batch(batch)
+                    key = "bytes" if isinstance(frame, bytes) else "text"
+                    await self._asgi_send({"type": "websocket.send", key: frame})
+                    self.sent += len(batch)
+        except Exception:
+            with self._cond:
+                self.closed = True
+        finally:
+            try:
+                await self._asgi_send({"type": "websocket.close"})
+            except Exception:
+                pass
+
+
+async def websocket_endpoint(scope, receive, send):
+    """/ws with the same query parameters and control protocol as the Flask endpoint"""
+    if (await receive())["type"] != "websocket.connect":
+        return
+    await send({"type": "websocket.accept"})
+    args = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+
+    def arg(name: str) -> Optional[str]:
+        return args[name][0] if name in args else None
+
+    client = AsyncClientConnection(send, asyncio.get_running_loop())
+    backend.configure_ws_client(client, arg('encoding'), arg('batch_ms'))
+    backend.broadcast_hub.add(client, backend.split_param(arg('topics')), backend.split_param(arg('levels')))
+    writer = asyncio.ensure_future(client.drain())
+    client.send(backend.ws_welcome_message())
+
+    try:
+        while not client.closed:
+            message = await receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            data = message.get("text")
+            if data is None and message.get("bytes") is not None:
+                data = message["bytes"].decode("utf-8", errors="replace")
+            if data and not backend.handle_ws_control(client, data):
+                # Echo back anything that is not a control message
+                client.send(backend.ws_echo_message(data))
+    finally:
+        backend.broadcast_hub.remove(client)
+        await writer
+
+
+# ============================================================================
+# WSGI BRIDGE
+# ============================================================================
+
+def header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def cors_headers(scope) -> List[tuple]:
+    """The CORS headers flask-cors adds for the Flask routes"""
+    origin = header(scope, b"origin")
+    if origin and origin in backend.ALLOWED_ORIGINS:
+        return [(b"access-control-allow-origin", origin.encode("latin-1")), (b"vary", b"Origin")]
+    return []
+
+
+async def read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+async def send_json(scope, send, body: Any, status: int = 200):
+    # Byte-for-byte what jsonify() produces outside debug mode
+    data = (backend.app.json.dumps(body, separators=(",", ":")) + "\n").encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(data)).encode())]
+        + cors_headers(scope)
+    })
+    await send({"type": "http.response.body", "body": data})
+
+
+def build_environ(scope, body: bytes) -> Dict[str, Any]:
+    """A PEP 3333 environ for an ASGI HTTP scope"""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def run_wsgi(environ: Dict[str, Any], loop: asyncio.AbstractEventLoop, send):
+    """Run the Flask app in a pool thread and hand its response to the event loop.
+
+    A response with a Content-Length goes out as one body message. Streamed
+    (SSE) responses are forwarded chunk by chunk, each waiting until the loop
+    has sent it, which keeps them flowing and applies backpressure to the
+    WSGI iterator.
+    """
+    response_start = {}
+
+    def start_response(status: str, headers: List[tuple], exc_info=None):
+        response_start.update(
+            type="http.response.start",
+            status=int(status[:3]),
+            headers=[(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+        )
+
+    def forward(message: Dict[str, Any]):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    body = backend.app(environ, start_response)
+    try:
+        chunks = iter(body)
+        first = next(chunks, b"")
+        if any(name == b"content-length" for name, _ in response_start["headers"]):
+            forward(response_start)
+            forward({"type": "http.response.body", "body": first + b"".join(chunks)})
+            return
+        forward(response_start)
+        if first:
+            forward({"type": "http.response.body", "body": first, "more_body": True})
+        for chunk in chunks:
+            if chunk:
+                forward({"type": "http.response.body", "body": chunk, "more_body": True})
+        forward({"type": "http.response.body", "body": b""})
+    except Exception:
+        # The client went away; stop producing the body
+        pass
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+
+async def call_wsgi(scope, receive, send):
+    environ = build_environ(scope, await read_body(receive))
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(wsgi_executor, run_wsgi, environ, loop, send)
+
+
+# ============================================================================
+# ASGI APP
+# ============================================================================
+
+async def metered(route: str, handler, scope, receive, send):
+    """Run a native route, recording it in the same request metrics as the Flask routes"""
+    started = time.perf_counter()
+    status, size = ["500"], [0]
+
+    async def metered_send(message: Dict[str, Any]):
+        if message["type"] == "http.response.start":
+            status[0] = str(message["status"])
+        elif message["type"] == "http.response.body":
+            size[0] += len(message.get("body", b""))
+        await send(message)
+
+    backend.request_metrics.start_request()
+    try:
+        await handler(scope, receive, metered_send)
+    finally:
+        backend.request_metrics.finish_request(scope["method"], route, status[0],
+                                               time.perf_counter() - started, size[0])
+
+
+# (method, path) -> coroutine handler; everything else goes to the Flask app
+NATIVE_ROUTES = {
+    ("POST", "/api/content/generate"): content_generate
+}
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            provider_pools.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI application"""
+    if scope["type"] == "http":
+        handler = NATIVE_ROUTES.get((scope["method"], scope["path"]))
+        if handler is not None:
+            return await metered(scope["path"], handler, scope, receive, send)
+        return await call_wsgi(scope, receive, send)
+    if scope["type"] == "websocket":
+        if scope["path"] == "/ws":
+            return await websocket_endpoint(scope, receive, send)
+        # Closing before accepting rejects the handshake
+        await send({"type": "websocket.close"})
+        return
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("The ASGI mode needs an ASGI server: pip install uvicorn")
+
+    port = int(os.environ.get('PORT', 8000))
+    print("=" * 60)
+    print("🚀 JARVIS Unified Backend Gateway (ASGI)")
+    print("=" * 60)
+    print(f"Port: {port}")
+    print(f"Health: http://0.0.0.0:{port}/api/health")
+    print(f"WebSocket: ws://0.0.0.0:{port}/ws")
+    print(f"Workspace: {backend.WORKSPACE_BASE}")
+    print("=" * 60)
+
+    uvicorn.run("asgi_backend:app", host="0.0.0.0", port=port,
+                workers=int(os.environ.get('WEB_CONCURRENCY', 1)), log_level="warning")
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Side-by-side benchmark of the WSGI and ASGI serving modes
+
+Runs the same scenarios against unified_backend:app under gunicorn (gthread
+workers) and asgi_backend:app under uvicorn, with the same number of worker
+processes, fixture workspace and stub provider, and prints one table:
+
+    idle /ws clients        connect --ws-clients dashboards; count how many
+                            are accepted within --connect-timeout
+    GET /api/health         latency while those dashboards stay connected
+                            (their client threads share this process, so
+                            compare the two columns rather than absolutes)
+    WS /ws fan-out          broadcast latency to every accepted client
+    POST /api/content/generate (slow upstream)
+                            uncached generations at --generate-concurrency
+                            against a provider that takes --provider-delay
+
+Usage:
+    python benchmarks/compare_servers.py --workers 2 --threads 32 --ws-clients 500 --provider-delay 1.0
+
+Needs gunicorn and uvicorn installed; neither server talks to a real provider.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from run_benchmarks import (HTTPClient, Scenario, backend_env, build_workspace, run_scenario, run_ws_fanout,
+                            start_gunicorn, start_stub_provider, start_uvicorn)
+
+
+def connect_clients(base_url: str, count: int, timeout: float) -> List[Any]:
+    """Open ``count`` /ws connections; returns those welcomed within ``timeout`` seconds"""
+    from simple_websocket import Client
+
+    ws_url = base_url.replace("http://", "ws://", 1).rstrip("/") + "/ws?topics=JARVIS.*"
+    connected = []
+    lock = threading.Lock()
+    expired = threading.Event()
+
+    def connect():
+        try:
+            ws = Client.connect(ws_url)
+            welcomed = ws.receive(timeout=timeout) is not None
+        except Exception:
+            return
+        with lock:
+            if welcomed and not expired.is_set():
+                connected.append(ws)
+                return
+        # Late handshakes would otherwise hold server threads through the later scenarios
+        ws.close()
+
+    # A handshake the server never answers blocks its thread, so these are daemons that are left behind
+    threads = [threading.Thread(target=connect, daemon=True) for _ in range(count)]
+    deadline = time.monotonic() + timeout
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.monotonic()))
+    with lock:
+        expired.set()
+        return list(connected)
+
+
+def close_clients(connections: List[Any]):
+    for ws in connections:
+        try:
+            ws.close()
+        except Exception:
+            pass
+
+
+def run_server(name: str, process, base_url: str, args) -> Dict[str, Any]:
+    print(f"{name}: {base_url}", flush=True)
+    client = HTTPClient(base_url)
+    results = {}
+    # Requests a starved server never answers count as errors instead of stalling the run
+    probe = HTTPClient(base_url, timeout=args.connect_timeout)
+    try:
+        idle = connect_clients(base_url, args.ws_clients, args.connect_timeout)
+        results["idle /ws clients"] = {"requests": args.ws_clients, "connected": len(idle),
+                                       "errors": args.ws_clients - len(idle)}
+        print(f"  {len(idle)}/{args.ws_clients} /ws clients connected", flush=True)
+
+        health = Scenario("GET /api/health", "GET", "/api/health")
+        results["GET /api/health (with idle /ws)"] = run_scenario(probe, health, args.requests, args.concurrency, 0)
+        close_clients(idle)
+        time.sleep(1)
+
+        if idle:
+            trigger = lambda: client.request("POST", "/api/models/switch", {"model": "gpt-4"})
+            results["WS /ws fan-out"] = run_ws_fanout(base_url, trigger, len(idle), args.ws_messages,
+                                                      args.ws_interval)
+
+        run_id = f"{name}-{int(time.time())}"
+        generate = Scenario("POST /api/content/generate (slow upstream)", "POST", "/api/content/generate",
+                            lambda i: {"prompt": f"compare {run_id} {i}", "persona": "Journalist"})
+        results[generate.name] = run_scenario(client, generate, args.generate_requests,
+                                              args.generate_concurrency, 0)
+        return results
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def print_comparison(results: Dict[str, Dict[str, Any]]):
+    servers = list(results)
+    rows = list(dict.fromkeys(row for server in servers for row in results[server]))
+    width = max(len(row) for row in rows)
+    print()
+    print(f"{'scenario':<{width}}  " + "  ".join(f"{server:>36}" for server in servers))
+    print(f"{'':<{width}}  " + "  ".join(f"{'ok/total':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8}"
+                                          for _ in servers))
+    for row in rows:
+        cells = []
+        for server in servers:
+            stats = results[server].get(row)
+            if stats is None:
+                cells.append(f"{'-':>36}")
+            elif "connected" in stats:
+                cells.append(f"{stats['connected']:>4}/{stats['requests']:<4} {'':>8} {'':>8} {'':>8}")
+            else:
+                ok = f"{stats['requests'] - stats['errors']}/{stats['requests']}"
+                cells.append(f"{ok:>9} {stats['rps']:>8.1f} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f}")
+        print(f"{row:<{width}}  " + "  ".join(cells))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2, help="worker processes for both servers")
+    parser.add_argument("--threads", type=int, default=32, help="gthread threads per gunicorn worker")
+    parser.add_argument("--ws-clients", type=int, default=200)
+    parser.add_argument("--connect-timeout", type=float, default=5.0)
+    parser.add_argument("--ws-messages", type=int, default=20)
+    parser.add_argument("--ws-interval", type=float, default=0.05, help="seconds between broadcasts")
+    parser.add_argument("--requests", type=int, default=100, help="GET /api/health requests")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--provider-delay", type=float, default=1.0, help="stub provider latency in seconds")
+    parser.add_argument("--generate-requests", type=int, default=400)
+    parser.add_argument("--generate-concurrency", type=int, default=200)
+    parser.add_argument("--servers", default="gunicorn,uvicorn", help="comma-separated subset to run")
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args()
+
+    scratch = Path(tempfile.mkdtemp(prefix="jarvis-compare-"))
+    try:
+        workspace = build_workspace(scratch / "workspace", 200, 200)
+        provider_url = start_stub_provider(args.provider_delay)
+        results = {}
+        for name in args.servers.split(","):
+            env = dict(backend_env(workspace, scratch / name, provider_url),
+                       # Neither server should be capped by the upstream connection pool
+                       PROVIDER_MAX_CONNECTIONS=str(args.generate_concurrency))
+            if name == "gunicorn":
+                process, base_url = start_gunicorn(args.workers, args.threads, env)
+                label = f"gunicorn {args.workers}x{args.threads} gthread"
+            elif name == "uvicorn":
+                process, base_url = start_uvicorn(args.workers, env)
+                label = f"uvicorn {args.workers}x asgi"
+            else:
+                parser.error(f"unknown server: {name}")
+            results[label] = run_server(name, process, base_url, args)
+
+        print_comparison(results)
+        if args.output:
+            Path(args.output).write_text(json.dumps({"args": vars(args), "results": results}, indent=2))
+        return 0
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    code = main()
+    sys.stdout.flush()
+    # Unanswered WebSocket handshakes leave threads behind; don't wait for them
+    os._exit(code)
@@ -0,0 +1,663 @@
+#!/usr/bin/env python3
+"""
+Latency and throughput benchmarks for unified_backend.py
+
+Every route is driven with a fixed number of requests at a fixed
+concurrency, and throughput plus p50/p95/p99 latency are reported per route.
+The backend runs against a generated fixture workspace (thousands of
+workflows and skills) and a local stub LLM provider, so the filesystem
+scanning paths and the generation pipeline are exercised without network
+access or API spend.
+
+Targets:
+    (default)        in-process, through the Flask test client
+    --gunicorn N     a local gunicorn with N workers, over HTTP
+    --uvicorn N      the ASGI entry point (asgi_backend:app) under uvicorn with N workers
+    --url URL        an already running server (its workspace and providers are its own)
+
+The /ws fan-out scenario connects N WebSocket clients to a real server (a
+threaded werkzeug server in in-process mode), triggers broadcasts and
+measures publish-to-receive latency at every client.
+
+Baselines:
+    python benchmarks/run_benchmarks.py --save-baseline
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json --tolerance 0.25
+
+A route regresses when its p95 grows by more than the tolerance (and by at
+least --min-delta-ms), or its throughput drops by more than the tolerance;
+the script then exits with status 1.
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+from urllib.parse import urlsplit
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+WORDS = ("data analysis pipeline writer research market video podcast comic story image audio "
+         "summary trading report design review search deploy notebook translate schedule").split()
+
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+def build_workspace(root: Path, workflows: int, skills: int, seed: int = 7) -> Path:
+    """Create a workspace tree shaped like /Volumes/AI_WORKSPACE"""
+    rng = random.Random(seed)
+    jarvis = root / "CORE" / "jarvis"
+    workflows_dir = jarvis / "workflows"
+    skills_dir = root / "SKILLS_LIBRARY" / "anthropic-skills"
+    config_dir = jarvis / "config"
+    for directory in (workflows_dir, skills_dir, config_dir, root / "CORE" / "council"):
+        directory.mkdir(parents=True, exist_ok=True)
+
+    # A small, fast workflow for the execute scenario
+    (workflows_dir / "bench-log.json").write_text(json.dumps({
+        "name": "Benchmark log workflow",
+        "description": "Single log step",
+        "steps": [{"id": "log", "type": "log", "message": "benchmark"}]
+    }))
+    for i in range(workflows):
+        steps = [{"id": f"s{j}", "type": "log", "message": " ".join(rng.sample(WORDS, 3))}
+                 for j in range(rng.randint(2, 12))]
+        (workflows_dir / f"workflow-{i:05d}.json").write_text(json.dumps({
+            "name": f"Workflow {i}",
+            "description": " ".join(rng.sample(WORDS, 8)),
+            "steps": steps,
+            "created": "2024-01-01T00:00:00"
+        }))
+
+    for i in range(skills):
+        skill_dir = skills_dir / f"skill-{i:05d}-{rng.choice(WORDS)}"
+        skill_dir.mkdir(exist_ok=True)
+        tags = ", ".join(rng.sample(WORDS, 3))
+        (skill_dir / "SKILL.md").write_text(
+            f"---\nname: skill-{i}\ndescription: {' '.join(rng.sample(WORDS, 10))}\ntags: [{tags}]\n---\n\n"
+            f"# Skill {i}\n\n" + " ".join(rng.choice(WORDS) for _ in range(200)) + "\n"
+        )
+
+    shutil.copy(REPO_ROOT / "config" / "ai_driver_config.json", config_dir / "ai_driver_config.json")
+    (root / "ANTIGRAVITY_CONFIG.json").write_text(json.dumps({"mode": "benchmark"}))
+    return root
+
+
+# ============================================================================
+# STUB PROVIDER
+# ============================================================================
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible /chat/completions (plain and streamed) with a fixed delay"""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; without this, Nagle plus
+    # delayed ACKs add ~40ms to every call
+    disable_nagle_algorithm = True
+    delay = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        time.sleep(self.delay)
+        usage = {"prompt_tokens": 40, "completion_tokens": 120}
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            events = [{"model": body["model"], "choices": [{"delta": {"content": f"token{i} "}}]} for i in range(20)]
+            events.append({"model": body["model"], "choices": [], "usage": usage})
+            for event in events:
+                self._chunk(f"data: {json.dumps(event)}\n\n".encode())
+            self._chunk(b"data: [DONE]\n\n")
+            self._chunk(b"")
+            return
+        data = json.dumps({
+            "model": body["model"],
+            "choices": [{"message": {"content": "benchmark reply " * 40}}],
+            "usage": usage
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+
+def start_stub_provider(delay: float) -> str:
+    StubProviderHandler.delay = delay
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubProviderHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-provider", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Keys the backend reads for real services; blanked so the benchmark can never reach them
+SERVICE_KEY_ENVS = ("ANTHROPIC_API_KEY", "GOOGLE_AI_STUDIO_API_KEY", "MISTRAL_API_KEY", "XAI_API_KEY",
+                    "MOONSHOT_API_KEY", "HUGGINGFACE_API_KEY", "ELEVENLABS_API_KEY", "LEONARDO_API_KEY",
+                    "STABILITY_API_KEY", "MIDJOURNEY_API_KEY")
+
+
+def backend_env(workspace: Path, data_dir: Path, provider_url: str) -> Dict[str, str]:
+    """Environment for a backend that uses the fixtures and the stub provider.
+
+    It is layered over os.environ, so every other service key is blanked and
+    the router is pinned to the (stubbed) OpenAI provider without hedging.
+    """
+    return dict(
+        {key: "" for key in SERVICE_KEY_ENVS},
+        JARVIS_WORKSPACE=str(workspace),
+        JARVIS_DATA_DIR=str(data_dir),
+        OPENAI_API_KEY="sk-benchmark-stub-key",
+        OPENAI_BASE_URL=provider_url,
+        ROUTER_FAILOVER_ORDER="openai",
+        ROUTER_HEDGE="0",
+        # The limiter would otherwise dominate the generate scenarios
+        OPENAI_RPM="0",
+        OPENAI_TPM="0",
+        OPENAI_MAX_IN_FLIGHT="0",
+        JARVIS_DEFAULT_MODEL="gpt-4",
+    )
+
+
+# ============================================================================
+# CLIENTS
+# ============================================================================
+
+class InProcessClient:
+    """Requests through Flask test clients (one per thread)"""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> int:
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body)
+        response.get_data()
+        return response.status_code
+
+
+class HTTPClient:
+    """Requests over keep-alive HTTP connections (one per thread)"""
+
+    def __init__(self, base_url: str, timeout: float = 60):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def request(self, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> int:
+        return self.fetch(method, path, body)[0]
+
+    def fetch(self, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> tuple:
+        """Send a request and return (status, response body)"""
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        for attempt in range(2):
+            conn = getattr(self._local, 'conn', None)
+            if conn is None:
+                conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                response = conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+        return 0, b""
+
+
+# ============================================================================
+# SCENARIOS
+# ============================================================================
+
+class Scenario:
+    def __init__(self, name: str, method: str, path: Union[Callable[[int], str], str],
+                 body: Optional[Callable[[int], Dict[str, Any]]] = None, requests: Optional[int] = None,
+                 expect: Optional[tuple] = None):
+        self.name = name
+        self.method = method
+        self.path = path if callable(path) else (lambda i, path=path: path)
+        self.body = body
+        self.requests = requests
+        # Statuses that count as success (default: any 2xx/3xx)
+        self.expect = expect
+
+    def succeeded(self, status: int) -> bool:
+        return status in self.expect if self.expect else 200 <= status < 400
+
+
+def discover_workflow_ids(client: HTTPClient) -> List[str]:
+    """Workflow ids listed by a running server (empty if it has none or the listing fails)"""
+    status, body = client.fetch("GET", "/api/workflows/list")
+    if status != 200:
+        return []
+    return [workflow["id"] for workflow in json.loads(body).get("workflows", [])]
+
+
+def build_scenarios(workflow_ids: List[str]) -> List[Scenario]:
+    run_id = f"{os.getpid()}-{int(time.time())}"
+    text = " ".join(WORDS) + ". " + ". ".join(WORDS[:8]) + "."
+
+    get = lambda path: Scenario(f"GET {path}", "GET", path)
+    scenarios = [
+        get("/api/health"),
+        get("/api/system/status"),
+        get("/api/antigravity/status"),
+        get("/api/workflows/list"),
+    ]
+    if workflow_ids:
+        scenarios.append(Scenario("GET /api/workflows/<id>", "GET",
+                                  lambda i: f"/api/workflows/{workflow_ids[i % len(workflow_ids)]}"))
+    return scenarios + [
+        get("/api/workflows/jobs"),
+        Scenario("GET /api/workflows/jobs/<id> (missing)", "GET", "/api/workflows/jobs/unknown-job", expect=(404,)),
+        get("/api/workflows/active"),
+        get("/api/skills/list"),
+        get("/api/skills/list?q=data"),
+        get("/api/models/list"),
+        get("/api/models"),
+        get("/api/dashboards/list"),
+        get("/api/metrics/history"),
+        get("/api/metrics/history?resolution=1m&limit=500"),
+        get("/api/costs/current"),
+        get("/api/videos/recent"),
+        get("/api/content/cache"),
+        get("/api/content/drafts"),
+        get("/api/providers/status"),
+        get("/api/providers/limits"),
+        get("/api/providers/routing"),
+        get("/api/settings/api-keys"),
+        get("/api/settings/integrations"),
+        get("/api/ws/stats"),
+        Scenario("POST /api/workflows/execute", "POST", "/api/workflows/execute",
+                 lambda i: {"workflow_id": "bench-log"}),
+        Scenario("POST /api/models/switch", "POST", "/api/models/switch", lambda i: {"model": "gpt-4"}),
+        Scenario("POST /api/video/generate", "POST", "/api/video/generate", lambda i: {"description": "bench"}),
+        Scenario("POST /api/comic/create", "POST", "/api/comic/create", lambda i: {}),
+        Scenario("POST /api/costs/track", "POST", "/api/costs/track", lambda i: {"category": "storage", "amount": 0}),
+        Scenario("POST /api/videos/track", "POST", "/api/videos/track", lambda i: {"title": "bench", "duration": 30}),
+        Scenario("POST /api/content/generate", "POST", "/api/content/generate",
+                 lambda i: {"prompt": f"benchmark {run_id} {i}", "persona": "Journalist"}),
+        Scenario("POST /api/content/generate (cached)", "POST", "/api/content/generate",
+                 lambda i: {"prompt": f"benchmark {run_id} cached", "persona": "Journalist"}),
+        Scenario("POST /api/content/generate (sse)", "POST", "/api/content/generate",
+                 lambda i: {"prompt": f"benchmark {run_id} stream {i}", "stream": "sse"}),
+        Scenario("POST /api/content/save", "POST", "/api/content/save",
+                 lambda i: {"content": text, "persona": "Poet"}),
+        Scenario("POST /api/tools/mythic", "POST", "/api/tools/mythic", lambda i: {"content": text}),
+        Scenario("POST /api/tools/condense", "POST", "/api/tools/condense", lambda i: {"content": text}),
+        Scenario("POST /api/podcast/convert", "POST", "/api/podcast/convert", lambda i: {"content": text}),
+        Scenario("POST /api/video/essay", "POST", "/api/video/essay", lambda i: {"content": text}),
+        Scenario("POST /api/batch", "POST", "/api/batch", lambda i: {"operations": [
+            {"op": op, "content": text} for op in ("tools.mythic", "tools.condense", "podcast.convert", "video.essay")
+        ] + [{"op": "content.generate", "prompt": f"benchmark {run_id} batch {i}"}]}),
+        Scenario("POST /api/workflows/sacred-circuits-substack", "POST", "/api/workflows/sacred-circuits-substack",
+                 lambda i: {"input_data": f"{text} {i}", "article_title": f"Bench {i}"}),
+        Scenario("POST /api/settings/integrations/<name>/toggle", "POST", "/api/settings/integrations/GitHub/toggle",
+                 lambda i: {}),
+    ]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def summarize(latencies_ms: List[float], elapsed: float, errors: int) -> Dict[str, Any]:
+    latencies_ms = sorted(latencies_ms)
+    return {
+        "requests": len(latencies_ms),
+        "errors": errors,
+        "rps": round(len(latencies_ms) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies_ms, 0.50), 3),
+        "p95_ms": round(percentile(latencies_ms, 0.95), 3),
+        "p99_ms": round(percentile(latencies_ms, 0.99), 3),
+        "max_ms": round(latencies_ms[-1], 3) if latencies_ms else 0.0,
+    }
+
+
+def run_scenario(client, scenario: Scenario, requests: int, concurrency: int, warmup: int) -> Dict[str, Any]:
+    for i in range(warmup):
+        client.request(scenario.method, scenario.path(-1 - i), scenario.body(-1 - i) if scenario.body else None)
+
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i: int):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            status = client.request(scenario.method, scenario.path(i), scenario.body(i) if scenario.body else None)
+        except Exception:
+            status = 0
+        latency = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(latency)
+            if not scenario.succeeded(status):
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def run_ws_fanout(base_url: str, trigger, clients: int, messages: int, interval: float) -> Dict[str, Any]:
+    """Connect ``clients`` WebSocket clients and time ``messages`` broadcasts to all of them"""
+    from simple_websocket import Client, ConnectionClosed
+
+    ws_url = base_url.replace("http://", "ws://", 1).rstrip("/") + "/ws?topics=JARVIS.*"
+    marker = "Switched to model"
+    latencies: List[float] = []
+    lock = threading.Lock()
+    all_received = threading.Event()
+    last_delivery = [0.0]
+    connections = [Client.connect(ws_url) for _ in range(clients)]
+    for ws in connections:
+        ws.receive(timeout=10)  # welcome message
+
+    def reader(ws, deadline: float):
+        while not all_received.is_set() and time.monotonic() < deadline:
+            try:
+                frame = ws.receive(timeout=0.5)
+            except ConnectionClosed:
+                return
+            if frame is None or isinstance(frame, bytes) or marker not in frame:
+                continue
+            arrived = time.time()
+            message = json.loads(frame)
+            with lock:
+                latencies.append((arrived - datetime.fromisoformat(message["timestamp"]).timestamp()) * 1000)
+                last_delivery[0] = time.perf_counter()
+                if len(latencies) >= clients * messages:
+                    all_received.set()
+
+    deadline = time.monotonic() + messages * interval + 30
+    readers = [threading.Thread(target=reader, args=(ws, deadline), daemon=True) for ws in connections]
+    for thread in readers:
+        thread.start()
+    started = time.perf_counter()
+    for _ in range(messages):
+        trigger()
+        time.sleep(interval)
+    all_received.wait(timeout=max(0.0, deadline - time.monotonic()))
+    for thread in readers:
+        thread.join()
+    elapsed = (last_delivery[0] or time.perf_counter()) - started
+    for ws in connections:
+        try:
+            ws.close()
+        except Exception:
+            pass
+
+    result = summarize(latencies, elapsed, clients * messages - len(latencies))
+    # Deliveries per second across all clients
+    result["rps"] = round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0
+    result["clients"] = clients
+    result["messages"] = messages
+    return result
+
+
+# ============================================================================
+# TARGETS
+# ============================================================================
+
+def wait_healthy(process: subprocess.Popen, base_url: str, name: str, timeout: float = 60) -> str:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if HTTPClient(base_url).request("GET", "/api/health") == 200:
+                return base_url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{name} did not become healthy within {timeout:.0f}s")
+
+
+def start_gunicorn(workers: int, threads: int, env: Dict[str, str]) -> tuple:
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--workers", str(workers), "--threads", str(threads),
+         "--bind", f"127.0.0.1:{port}", "--log-level", "warning", "unified_backend:app"],
+        cwd=REPO_ROOT, env=dict(os.environ, **env)
+    )
+    return process, wait_healthy(process, f"http://127.0.0.1:{port}", "gunicorn")
+
+
+def start_uvicorn(workers: int, env: Dict[str, str]) -> tuple:
+    """Serve asgi_backend:app (the asyncio entry point) with uvicorn"""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "asgi_backend:app"],
+        cwd=REPO_ROOT, env=dict(os.environ, **env)
+    )
+    return process, wait_healthy(process, f"http://127.0.0.1:{port}", "uvicorn")
+
+
+def load_backend(env: Dict[str, str]):
+    """Import unified_backend in this process, configured by ``env``"""
+    os.environ.update(env)
+    sys.path.insert(0, str(REPO_ROOT))
+    import unified_backend
+    return unified_backend
+
+
+def start_werkzeug(app) -> str:
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-server", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def wait_for_indexes(backend, workflows: int, skills: int, timeout: float = 120):
+    """Wait until the startup threads have indexed the fixture workspace"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if len(backend.workflow_index.listing()[0]) >= workflows and \
+                len(backend.get_available_skills()) >= skills:
+            return
+        time.sleep(0.2)
+
+
+# ============================================================================
+# REPORTING
+# ============================================================================
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_delta_ms: float) -> List[str]:
+    regressions = []
+    for name, current in results["routes"].items():
+        previous = baseline.get("routes", {}).get(name)
+        if not previous:
+            continue
+        if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance) and \
+                current["p95_ms"] - previous["p95_ms"] >= min_delta_ms:
+            regressions.append(f"{name}: p95 {previous['p95_ms']:.2f} -> {current['p95_ms']:.2f} ms")
+        if previous["rps"] and current["rps"] < previous["rps"] / (1 + tolerance):
+            regressions.append(f"{name}: throughput {previous['rps']:.1f} -> {current['rps']:.1f} req/s")
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{name}: errors {previous['errors']} -> {current['errors']}")
+    return regressions
+
+
+def print_table(results: Dict[str, Any]):
+    width = max(len(name) for name in results["routes"])
+    print(f"{'route':<{width}}  {'req':>6} {'err':>4} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, row in results["routes"].items():
+        print(f"{name:<{width}}  {row['requests']:>6} {row['errors']:>4} {row['rps']:>9.1f} "
+              f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--gunicorn", type=int, metavar="WORKERS", help="benchmark a local gunicorn with this many workers")
+    target.add_argument("--uvicorn", type=int, metavar="WORKERS", help="benchmark asgi_backend under uvicorn")
+    target.add_argument("--url", help="benchmark an already running server")
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests per route")
+    parser.add_argument("--workflows", type=int, default=2000, help="fixture workflows")
+    parser.add_argument("--skills", type=int, default=2000, help="fixture skills")
+    parser.add_argument("--provider-delay", type=float, default=0.0, help="stub provider latency in seconds")
+    parser.add_argument("--ws-clients", type=int, default=100)
+    parser.add_argument("--ws-messages", type=int, default=50)
+    parser.add_argument("--ws-interval", type=float, default=0.02, help="seconds between broadcasts")
+    parser.add_argument("--routes", help="only run routes whose name contains this substring")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write results to --baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="ignore p95 changes smaller than this")
+    parser.add_argument("--keep-fixtures", action="store_true")
+    args = parser.parse_args()
+
+    scratch = Path(tempfile.mkdtemp(prefix="jarvis-bench-"))
+    process = None
+    try:
+        mode = "url" if args.url else "gunicorn" if args.gunicorn else "uvicorn" if args.uvicorn else "inprocess"
+        backend = None
+        if mode != "url":
+            print(f"Building fixture workspace ({args.workflows} workflows, {args.skills} skills) in {scratch}")
+            workspace = build_workspace(scratch / "workspace", args.workflows, args.skills)
+            env = backend_env(workspace, scratch / "data", start_stub_provider(args.provider_delay))
+        if mode == "inprocess":
+            backend = load_backend(env)
+            wait_for_indexes(backend, args.workflows, args.skills)
+            client = InProcessClient(backend.app)
+            base_url = start_werkzeug(backend.app)
+        elif mode == "gunicorn":
+            # Every open /ws connection occupies a gthread thread for its lifetime
+            process, base_url = start_gunicorn(args.gunicorn, args.ws_clients + args.concurrency + 8, env)
+            client = HTTPClient(base_url)
+        elif mode == "uvicorn":
+            process, base_url = start_uvicorn(args.uvicorn, env)
+            client = HTTPClient(base_url)
+        else:
+            base_url = args.url.rstrip("/")
+            client = HTTPClient(base_url)
+
+        if mode == "url":
+            workflow_ids = discover_workflow_ids(client)
+            if not workflow_ids:
+                print("Server lists no workflows; skipping GET /api/workflows/<id>")
+        else:
+            workflow_ids = [f"workflow-{i:05d}" for i in range(max(args.workflows, 1))]
+        scenarios = build_scenarios(workflow_ids)
+        if args.routes:
+            scenarios = [scenario for scenario in scenarios if args.routes in scenario.name]
+        if backend is not None:
+            covered = {scenario.path(0).split("?")[0] for scenario in scenarios}
+            rules = [rule.rule for rule in backend.app.url_map.iter_rules()
+                     if "<" not in rule.rule and rule.rule.startswith("/api/") and rule.rule not in covered]
+            if rules and not args.routes:
+                print(f"Routes without a scenario: {', '.join(sorted(rules))}")
+
+        results = {
+            "meta": {
+                "mode": mode,
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "workflows": args.workflows,
+                "skills": args.skills,
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "timestamp": datetime.now().isoformat()
+            },
+            "routes": {}
+        }
+        for scenario in scenarios:
+            results["routes"][scenario.name] = run_scenario(
+                client, scenario, scenario.requests or args.requests, args.concurrency, args.warmup
+            )
+            print(f"  {scenario.name}: {results['routes'][scenario.name]['p95_ms']:.2f} ms p95", flush=True)
+
+        if not args.routes or "ws" in args.routes:
+            trigger = lambda: client.request("POST", "/api/models/switch", {"model": "gpt-4"})
+            results["routes"]["WS /ws fan-out"] = run_ws_fanout(
+                base_url, trigger, args.ws_clients, args.ws_messages, args.ws_interval
+            )
+
+        print()
+        print_table(results)
+        if args.output:
+            Path(args.output).write_text(json.dumps(results, indent=2))
+
+        if args.save_baseline:
+            args.baseline.write_text(json.dumps(results, indent=2))
+            print(f"\nBaseline written to {args.baseline}")
+            return 0
+        if not args.baseline.exists():
+            print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one")
+            return 0
+
+        baseline = json.loads(args.baseline.read_text())
+        mismatched = [key for key in ("mode", "requests", "concurrency", "workflows", "skills")
+                      if baseline.get("meta", {}).get(key) != results["meta"][key]]
+        if mismatched:
+            print(f"\nWarning: baseline was recorded with different settings ({', '.join(mismatched)})")
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"\nNo regressions against {args.baseline}")
+        return 0
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        if not args.keep_fixtures:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    code = main()
+    sys.stdout.flush()
+    # WebSocket client threads and the backend's workers are not daemons; don't wait for them
+    os._exit(code)
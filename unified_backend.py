@@ -7,19 +7,48 @@ Port: 8000 (Primary)
 Serves: AI Command Center, V0 AI Cockpit, Workflow Studio, Ultimate Hub
 """
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
 from flask_sock import Sock
+import atexit
+import bisect
+import fcntl
+import hashlib
+import hmac
+import http.client
+import itertools
 import json
 import psutil
+import queue
+import re
+import socket
 import subprocess
 import os
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Annotated, Dict, List, Any, Literal, Optional, Union
+from urllib.parse import urlsplit
 import threading
 import time
-from pydantic import BaseModel, Field, validator
+import sqlite3
+import struct
+import sys
+import tempfile
+import uuid
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError, validator
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -41,6 +70,8 @@ class ContentGenerateRequest(BaseModel):
     """Validation for content generation requests"""
     prompt: str = Field(..., min_length=1, max_length=10000)
     persona: str = Field(default="Technical Writer")
+    stream: Union[bool, Literal["sse", "ws"]] = Field(default=False)
+    request_id: Optional[str] = Field(default=None, max_length=64, pattern=r'^[A-Za-z0-9_-]+$')
 
     @validator('prompt')
     def sanitize_prompt(cls, v):
@@ -49,6 +80,13 @@ class ContentGenerateRequest(BaseModel):
             raise ValueError('Prompt cannot be empty')
         return v.strip()
 
+    @validator('request_id', always=True)
+    def require_ws_request_id(cls, v, values):
+        # The client must already be subscribed to the stream's topic, so it has to choose the id
+        if values.get('stream') == "ws" and not v:
+            raise ValueError('request_id is required with stream "ws"; subscribe to CONTENT.stream.<request_id> first')
+        return v
+
     @validator('persona')
     def validate_persona(cls, v):
         allowed_personas = ["Technical Writer", "Creative Storyteller", "Academic Researcher",
@@ -69,212 +107,4172 @@ class VideoGenerateRequest(BaseModel):
         return v.strip()
 
 # Paths
-WORKSPACE_BASE = Path("/Volumes/AI_WORKSPACE")
+WORKSPACE_BASE = Path(os.environ.get('JARVIS_WORKSPACE', "/Volumes/AI_WORKSPACE"))
 JARVIS_PATH = WORKSPACE_BASE / "CORE" / "jarvis"
 SKILLS_LIBRARY = WORKSPACE_BASE / "SKILLS_LIBRARY" / "anthropic-skills"
 WORKFLOWS_DIR = JARVIS_PATH / "workflows"
 COUNCIL_PATH = WORKSPACE_BASE / "CORE" / "council"
 CONFIG_PATH = JARVIS_PATH / "config"
 
-# WebSocket clients
+# WebSocket clients (ClientConnection instances)
 ws_clients = set()
 
 # Anti-Gravity configuration
 ANTIGRAVITY_CONFIG = WORKSPACE_BASE / "ANTIGRAVITY_CONFIG.json"
 
-# Historical metrics storage (in-memory for now, can be moved to SQLite later)
-metrics_history = []
-MAX_HISTORY_POINTS = 50
+# ============================================================================
+# SHARED STATE STORE
+# ============================================================================
 
-# Cost tracking
-total_cost = 0.0
-cost_breakdown = {
-    "infrastructure": 0.0,
-    "ai_apis": 0.0,
-    "storage": 0.0
-}
+# Runtime data shared by all gunicorn workers on this host
+DATA_DIR = Path(os.environ.get('JARVIS_DATA_DIR', Path(tempfile.gettempdir()) / "jarvis"))
+STATE_BACKEND = os.environ.get('JARVIS_STATE_BACKEND', 'memory')  # memory | sqlite (multi-worker deployments: see Procfile)
+STATE_DB_PATH = Path(os.environ.get('JARVIS_STATE_DB', DATA_DIR / "state.db"))
+
+
+class InMemoryStateStore:
+    """Process-local counters and bounded lists (each worker keeps its own copy)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._lists: Dict[str, deque] = {}
+        self._buckets: Dict[str, tuple] = {}
+        self._slots: Dict[str, Dict[str, float]] = {}
+
+    def incr(self, key: str, amount: float = 1) -> float:
+        """Atomically add to a counter and return the new value"""
+        with self._lock:
+            value = self._counters.get(key, 0) + amount
+            self._counters[key] = value
+            return value
+
+    def get(self, key: str, default: float = 0) -> float:
+        return self._counters.get(key, default)
+
+    def get_many(self, keys: List[str]) -> Dict[str, float]:
+        counters = self._counters
+        return {key: counters.get(key, 0) for key in keys}
+
+    def set(self, key: str, value: float):
+        with self._lock:
+            self._counters[key] = value
+
+    def append(self, name: str, item: Any, max_len: int):
+        """Append to a list, dropping the oldest entries beyond max_len"""
+        with self._lock:
+            items = self._lists.get(name)
+            if items is None or items.maxlen != max_len:
+                items = self._lists[name] = deque(items or (), maxlen=max_len)
+            items.append(item)
+
+    def tail(self, name: str, count: Optional[int] = None) -> List[Any]:
+        """Get the newest ``count`` items (all when None), oldest first"""
+        with self._lock:
+            items = list(self._lists.get(name, ()))
+        return items if count is None else items[-count:] if count > 0 else []
+
+    def length(self, name: str) -> int:
+        return len(self._lists.get(name, ()))
+
+    def take(self, buckets: List[tuple], force: bool = False) -> float:
+        """Atomically take from token buckets given as (key, amount, capacity, refill_per_second).
+
+        Takes nothing and returns the seconds until all would have enough
+        tokens, or takes from every bucket and returns 0. Negative amounts
+        return tokens. With ``force`` the amounts are always taken, leaving
+        a bucket in debt (below zero) if it had too few.
+        """
+        now = time.time()
+        with self._lock:
+            levels = []
+            for key, _, capacity, rate in buckets:
+                tokens, updated_at = self._buckets.get(key, (capacity, now))
+                levels.append(min(capacity, tokens + (now - updated_at) * rate))
+            wait = 0.0 if force else max([(amount - level) / rate for level, (_, amount, _, rate)
+                                          in zip(levels, buckets) if level < amount] or [0.0])
+            if not wait:
+                for level, (key, amount, capacity, _) in zip(levels, buckets):
+                    self._buckets[key] = (min(capacity, level - amount), now)
+            return wait
+
+    def bucket_level(self, key: str, capacity: float, rate: float) -> float:
+        tokens, updated_at = self._buckets.get(key, (capacity, time.time()))
+        return min(capacity, tokens + (time.time() - updated_at) * rate)
+
+    def acquire_slot(self, key: str, holder: str, limit: int, lease: float) -> bool:
+        """Take one of ``limit`` slots; slots not released within ``lease`` seconds expire"""
+        now = time.time()
+        with self._lock:
+            slots = self._slots.setdefault(key, {})
+            for expired in [h for h, expires_at in slots.items() if expires_at < now]:
+                del slots[expired]
+            if len(slots) >= limit:
+                return False
+            slots[holder] = now + lease
+            return True
+
+    def release_slot(self, key: str, holder: str):
+        with self._lock:
+            self._slots.get(key, {}).pop(holder, None)
+
+    def count_slots(self, key: str) -> int:
+        now = time.time()
+        return sum(1 for expires_at in list(self._slots.get(key, {}).values()) if expires_at >= now)
+
+
+class SQLiteStateStore:
+    """Counters and bounded lists in a SQLite database shared by all workers.
+
+    Runs in WAL mode with one connection per thread, so readers never block
+    writers and each operation is a single short transaction.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, value REAL NOT NULL);
+                CREATE TABLE IF NOT EXISTS lists (
+                    name TEXT NOT NULL, seq INTEGER NOT NULL, item TEXT NOT NULL,
+                    PRIMARY KEY (name, seq)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL);
+                CREATE TABLE IF NOT EXISTS slots (
+                    key TEXT NOT NULL, holder TEXT NOT NULL, expires_at REAL NOT NULL,
+                    PRIMARY KEY (key, holder)
+                ) WITHOUT ROWID;
+            """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def incr(self, key: str, amount: float = 1) -> float:
+        row = self._conn().execute(
+            "INSERT INTO counters (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value RETURNING value",
+            (key, amount)
+        ).fetchone()
+        return row[0]
+
+    def get(self, key: str, default: float = 0) -> float:
+        row = self._conn().execute("SELECT value FROM counters WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def get_many(self, keys: List[str]) -> Dict[str, float]:
+        placeholders = ",".join("?" * len(keys))
+        rows = self._conn().execute(
+            f"SELECT key, value FROM counters WHERE key IN ({placeholders})", list(keys)
+        ).fetchall()
+        values = dict(rows)
+        return {key: values.get(key, 0) for key in keys}
+
+    def set(self, key: str, value: float):
+        self._conn().execute(
+            "INSERT INTO counters (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+
+    def append(self, name: str, item: Any, max_len: int):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            seq = conn.execute(
+                "INSERT INTO lists (name, seq, item) "
+                "SELECT ?, COALESCE(MAX(seq), 0) + 1, ? FROM lists WHERE name = ? RETURNING seq",
+                (name, json.dumps(item), name)
+            ).fetchone()[0]
+            conn.execute("DELETE FROM lists WHERE name = ? AND seq <= ?", (name, seq - max_len))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def tail(self, name: str, count: Optional[int] = None) -> List[Any]:
+        rows = self._conn().execute(
+            "SELECT item FROM lists WHERE name = ? ORDER BY seq DESC LIMIT ?",
+            (name, -1 if count is None else count)
+        ).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def length(self, name: str) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM lists WHERE name = ?", (name,)).fetchone()[0]
+
+    def _transaction(self, work):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def take(self, buckets: List[tuple], force: bool = False) -> float:
+        def work(conn):
+            now = time.time()
+            levels = []
+            for key, _, capacity, rate in buckets:
+                row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+                levels.append(capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate))
+            wait = 0.0 if force else max([(amount - level) / rate for level, (_, amount, _, rate)
+                                          in zip(levels, buckets) if level < amount] or [0.0])
+            if not wait:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    [(key, min(capacity, level - amount), now)
+                     for level, (key, amount, capacity, _) in zip(levels, buckets)]
+                )
+            return wait
+        return self._transaction(work)
+
+    def bucket_level(self, key: str, capacity: float, rate: float) -> float:
+        row = self._conn().execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+        return capacity if row is None else min(capacity, row[0] + (time.time() - row[1]) * rate)
+
+    def acquire_slot(self, key: str, holder: str, limit: int, lease: float) -> bool:
+        def work(conn):
+            now = time.time()
+            conn.execute("DELETE FROM slots WHERE key = ? AND expires_at < ?", (key, now))
+            if conn.execute("SELECT COUNT(*) FROM slots WHERE key = ?", (key,)).fetchone()[0] >= limit:
+                return False
+            conn.execute("INSERT INTO slots (key, holder, expires_at) VALUES (?, ?, ?)", (key, holder, now + lease))
+            return True
+        return self._transaction(work)
+
+    def release_slot(self, key: str, holder: str):
+        self._conn().execute("DELETE FROM slots WHERE key = ? AND holder = ?", (key, holder))
+
+    def count_slots(self, key: str) -> int:
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM slots WHERE key = ? AND expires_at >= ?", (key, time.time())
+        ).fetchone()[0]
+
+
+def create_state_store():
+    """Create the state backend selected by JARVIS_STATE_BACKEND"""
+    if STATE_BACKEND == 'sqlite':
+        return SQLiteStateStore(STATE_DB_PATH)
+    return InMemoryStateStore()
+
+
+state = create_state_store()
+
+# Cost tracking (total is the sum of the categories)
+COST_CATEGORIES = ["infrastructure", "ai_apis", "storage"]
 
 # Video generation history
-video_history = []
 MAX_VIDEO_HISTORY = 20
 
 
+def add_cost(category: str, amount: float) -> float:
+    """Add to a cost category and return the new total cost"""
+    state.incr(f"cost.{category}", amount)
+    return get_total_cost()
+
+
+def get_cost_breakdown() -> Dict[str, float]:
+    values = state.get_many([f"cost.{category}" for category in COST_CATEGORIES])
+    return {category: float(values[f"cost.{category}"]) for category in COST_CATEGORIES}
+
+
+def get_total_cost() -> float:
+    return sum(get_cost_breakdown().values())
+
+
+def get_cost_savings() -> Dict[str, float]:
+    """Spend avoided by caching (reported alongside, not included in, the total)"""
+    return {"generation_cache": float(state.get("generation_cache.saved"))}
+
+
+# ============================================================================
+# CONFIG CACHE
+# ============================================================================
+
+CONFIG_CHECK_INTERVAL = float(os.environ.get('CONFIG_CHECK_INTERVAL', 1))
+
+
+class ConfigFile:
+    """A JSON config file parsed once and reloaded only when it changes.
+
+    ``build`` turns the parsed JSON (None when the file is missing) into the
+    validated value readers get. The file is stat'ed at most every
+    CONFIG_CHECK_INTERVAL seconds and re-read when its mtime or size
+    changes; the content hash then decides whether to re-parse. Each reload
+    swaps in a new snapshot in one assignment, so readers never lock. A file
+    that fails to parse keeps the previous snapshot.
+    """
+
+    def __init__(self, path: Path, build, check_interval: float = CONFIG_CHECK_INTERVAL):
+        self.path = path
+        self.build = build
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        # (value, (mtime_ns, size), digest, checked_at) swapped as one reference
+        self._current = None
+        self.reloads = 0
+
+    def get(self):
+        """Get the current snapshot (shared, do not mutate)"""
+        current = self._current
+        if current is not None and time.monotonic() - current[3] < self.check_interval:
+            return current[0]
+
+        if not self._lock.acquire(blocking=current is None):
+            return current[0]  # Another thread is checking the file
+        try:
+            return self._check()
+        finally:
+            self._lock.release()
+
+    def _check(self):
+        current = self._current
+        try:
+            stat = os.stat(self.path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            signature = None
+
+        if current is not None and current[1] == signature:
+            self._current = (current[0], signature, current[2], time.monotonic())
+            return current[0]
+
+        digest, value = None, None
+        try:
+            if signature is not None:
+                with open(self.path, 'rb') as f:
+                    raw = f.read()
+                digest = hashlib.sha256(raw).hexdigest()
+                if current is not None and digest == current[2]:
+                    value = current[0]
+                else:
+                    value = self.build(json.loads(raw))
+                    self.reloads += 1
+            else:
+                value = self.build(None)
+        except Exception as e:
+            print(f"Keeping previous config for {self.path}: {e}")
+            if current is not None:
+                self._current = (current[0], signature, current[2], time.monotonic())
+                return current[0]
+            value = self.build(None)
+
+        self._current = (value, signature, digest, time.monotonic())
+        return value
+
+
+ANTIGRAVITY_DEFAULTS = {
+    "antigravity_enabled": True,
+    "weightless_mode": True,
+    "optimization_level": "maximum",
+    "gravity_level": 0.1,
+    "performance_boost": 0.9
+}
+
+
+def build_antigravity_config(data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if data is None:
+        return dict(ANTIGRAVITY_DEFAULTS)
+    if not isinstance(data, dict):
+        raise ValueError("anti-gravity config must be a JSON object")
+    return data
+
+
+antigravity_config = ConfigFile(ANTIGRAVITY_CONFIG, build_antigravity_config)
+
+
 def load_antigravity_config():
     """Load anti-gravity configuration"""
-    if ANTIGRAVITY_CONFIG.exists():
-        with open(ANTIGRAVITY_CONFIG, 'r') as f:
-            return json.load(f)
-    return {
-        "antigravity_enabled": True,
-        "weightless_mode": True,
-        "optimization_level": "maximum",
-        "gravity_level": 0.1,
-        "performance_boost": 0.9
-    }
+    return antigravity_config.get()
+
+
+# ============================================================================
+# REQUEST METRICS
+# ============================================================================
 
+REQUEST_METRICS_DIR = Path(os.environ.get('JARVIS_REQUEST_METRICS_DIR', DATA_DIR / "request-metrics"))
+# How often each worker publishes its values for /metrics served by other workers
+REQUEST_METRICS_FLUSH_INTERVAL = float(os.environ.get('REQUEST_METRICS_FLUSH_INTERVAL', 5))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+FANOUT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1)
+SIZE_BUCKETS = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152)
+HTTP_METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"))
+ROUTE_ENVIRON_KEY = "jarvis.route"
+
+
+class MetricFamily:
+    """Name, type, help text and (for histograms) bucket bounds of one metric"""
+
+    def __init__(self, name: str, kind: str, help_text: str, buckets: tuple = ()):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.buckets = buckets
+        self.bucket_labels = [repr(float(bound)) for bound in buckets] + ["+Inf"]
+
+
+METRIC_FAMILIES = {family.name: family for family in (
+    MetricFamily("jarvis_http_requests_total", "counter", "HTTP requests by method, route and status"),
+    MetricFamily("jarvis_http_request_duration_seconds", "histogram",
+                 "Time from request arrival until the response body is sent", LATENCY_BUCKETS),
+    MetricFamily("jarvis_http_response_size_bytes", "histogram", "Response body size", SIZE_BUCKETS),
+    MetricFamily("jarvis_http_requests_in_flight", "gauge", "HTTP requests being served"),
+    MetricFamily("jarvis_ws_clients", "gauge", "Connected WebSocket clients"),
+    MetricFamily("jarvis_broadcast_fanout_seconds", "histogram",
+                 "Time to queue one broadcast for a worker's WebSocket clients", FANOUT_BUCKETS),
+    MetricFamily("jarvis_broadcast_deliveries_total", "counter", "Broadcast messages queued for WebSocket clients"),
+    MetricFamily("jarvis_provider_request_duration_seconds", "histogram",
+                 "Upstream LLM provider call duration by provider, mode and outcome", LATENCY_BUCKETS),
+)}
+
+
+def merge_metric_values(totals: Dict[tuple, Any], values: Dict[tuple, Any], gauges: bool = True) -> Dict[tuple, Any]:
+    """Add ``values`` into ``totals`` (histograms element-wise); returns ``totals``"""
+    for key, value in values.items():
+        if isinstance(value, list):
+            current = totals.get(key)
+            if current is None:
+                totals[key] = list(value)
+            else:
+                for i, count in enumerate(value):
+                    current[i] += count
+        elif gauges or getattr(METRIC_FAMILIES.get(key[0]), "kind", None) != "gauge":
+            totals[key] = totals.get(key, 0) + value
+    return totals
 
-def broadcast_message(message: Dict[str, Any]):
-    """Broadcast message to all WebSocket clients"""
-    message_json = json.dumps(message)
-    dead_clients = set()
 
-    for client in ws_clients:
+def read_metric_file(path: Path) -> Dict[tuple, Any]:
+    try:
+        return {(name, labels): value for name, labels, value in json.loads(path.read_text())}
+    except (OSError, ValueError, TypeError):
+        return {}
+
+
+def write_metric_file(path: Path, values: Dict[tuple, Any]):
+    tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+    tmp.write_text(json.dumps([[name, labels, value] for (name, labels), value in values.items()]))
+    os.replace(tmp, path)
+
+
+class MetricsRegistry:
+    """Request metrics for this worker, recorded without taking a lock.
+
+    Every thread records into its own dict; readers merge the per-thread
+    dicts and fold those of finished threads into a retired total. Each
+    worker writes its merged values to ``<pid>.json`` in a shared directory
+    every REQUEST_METRICS_FLUSH_INTERVAL seconds (and on exit), and
+    ``aggregate()`` sums the files of all workers on the host. Counters and
+    histograms of workers that exited are kept in ``retired.json`` so the
+    totals never go backwards; their gauges are dropped.
+    """
+
+    def __init__(self, directory: Path, families: Dict[str, MetricFamily]):
+        self.directory = directory
+        self.families = families
+        self._thread = None
+        self._reset()
+        # Values recorded before a fork belong to the parent
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards: List[tuple] = []
+        self._retired: Dict[tuple, Any] = {}
+        self.pid = os.getpid()
+
+    def _shard(self) -> Dict[tuple, Any]:
         try:
-            client.send(message_json)
-        except:
-            dead_clients.add(client)
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), values))
+            return values
+
+    def inc(self, name: str, labels: str = "", amount: float = 1):
+        """Add to a counter or gauge; ``labels`` is the rendered label list, e.g. 'provider="openai"'"""
+        shard = self._shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, labels: str = ""):
+        """Add a sample to a histogram, stored as per-bucket counts, the +Inf count, then the sum"""
+        shard = self._shard()
+        key = (name, labels)
+        buckets = self.families[name].buckets
+        counts = shard.get(key)
+        if counts is None:
+            counts = shard[key] = [0] * (len(buckets) + 1) + [0]
+        counts[bisect.bisect_left(buckets, value)] += 1
+        counts[-1] += value
+
+    def start_request(self):
+        self.inc("jarvis_http_requests_in_flight")
+
+    def finish_request(self, method: str, route: str, status: str, seconds: float, size: int):
+        """Count a request started with start_request()"""
+        labels = f'method="{method if method in HTTP_METHODS else "other"}",route="{route}"'
+        self.inc("jarvis_http_requests_in_flight", amount=-1)
+        self.inc("jarvis_http_requests_total", f'{labels},status="{status}"')
+        self.observe("jarvis_http_request_duration_seconds", seconds, labels)
+        self.observe("jarvis_http_response_size_bytes", size, labels)
+
+    def collect(self) -> Dict[tuple, Any]:
+        """Merged values of this worker's threads, plus its gauges"""
+        with self._lock:
+            live = []
+            for thread, values in self._shards:
+                if thread.is_alive():
+                    live.append((thread, values))
+                else:
+                    # A finished thread never writes again
+                    merge_metric_values(self._retired, values)
+            self._shards = live
+            totals = merge_metric_values({}, self._retired)
+        for _, values in live:
+            # dict() copies in one step under the GIL while the owner keeps writing
+            merge_metric_values(totals, dict(values))
+        totals[("jarvis_ws_clients", "")] = len(ws_clients)
+        return totals
+
+    def flush(self) -> Dict[tuple, Any]:
+        """Publish this worker's values for other workers and return them"""
+        values = self.collect()
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            write_metric_file(self.directory / f"{self.pid}.json", values)
+        except OSError:
+            pass
+        return values
 
-    # Remove dead clients
-    ws_clients.difference_update(dead_clients)
+    def aggregate(self) -> Dict[tuple, Any]:
+        """Sum of the values of every worker on this host, this worker's being current"""
+        totals = self.flush()
+        retired_path = self.directory / "retired.json"
+        try:
+            lock_file = open(self.directory / ".lock", 'a')
+        except OSError:
+            return totals
+        with lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                retired = read_metric_file(retired_path)
+                exited = []
+                for path in self.directory.glob("[0-9]*.json"):
+                    pid = int(path.stem)
+                    if pid == self.pid:
+                        continue
+                    if process_alive(pid):
+                        merge_metric_values(totals, read_metric_file(path))
+                    else:
+                        merge_metric_values(retired, read_metric_file(path), gauges=False)
+                        exited.append(path)
+                if exited:
+                    write_metric_file(retired_path, retired)
+                    for path in exited:
+                        path.unlink()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return merge_metric_values(totals, retired)
+
+    def _run(self):
+        while True:
+            time.sleep(REQUEST_METRICS_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+    def start(self):
+        """Start the background flush thread (idempotent)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="request-metrics", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+
+def render_prometheus(values: Dict[tuple, Any]) -> str:
+    """Render metric values in the Prometheus text exposition format"""
+    series_by_name: Dict[str, List[tuple]] = {}
+    for (name, labels), value in values.items():
+        series_by_name.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for family in METRIC_FAMILIES.values():
+        series = series_by_name.get(family.name)
+        if not series:
+            continue
+        lines.append(f"# HELP {family.name} {family.help}")
+        lines.append(f"# TYPE {family.name} {family.kind}")
+        for labels, value in sorted(series, key=lambda item: item[0]):
+            if family.kind != "histogram":
+                lines.append(f"{family.name}{{{labels}}} {value}" if labels else f"{family.name} {value}")
+                continue
+            prefix = f"{labels}," if labels else ""
+            cumulative = 0
+            for bound, count in zip(family.bucket_labels, value):
+                cumulative += count
+                lines.append(f'{family.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{family.name}_sum{suffix} {value[-1]}")
+            lines.append(f"{family.name}_count{suffix} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+class MeteredBody:
+    """Response iterable that counts the bytes sent and reports when the server closes it"""
+
+    def __init__(self, body, on_close):
+        self.body = body
+        self.on_close = on_close
+        self.size = 0
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.on_close(self.size)
 
 
-def get_system_metrics():
-    """Get real system metrics"""
-    cpu_percent = psutil.cpu_percent(interval=1)
-    memory = psutil.virtual_memory()
-
-    # Use root filesystem for production, workspace for local
-    disk_path = "/" if not WORKSPACE_BASE.exists() else str(WORKSPACE_BASE)
-    disk = psutil.disk_usage(disk_path)
-
-    # Calculate optimization level (inverse of resource usage)
-    optimization_level = 100 - ((cpu_percent + memory.percent) / 2)
-
-    metrics = {
-        "cpu_load": cpu_percent,
-        "memory_used_gb": round(memory.used / (1024**3), 1),
-        "memory_percent": memory.percent,
-        "disk_used_gb": round(disk.used / (1024**3), 1),
-        "disk_percent": disk.percent,
-        "optimization_level": round(optimization_level, 1),
-        "active_processes": len(psutil.pids())
-    }
+class RequestMetricsMiddleware:
+    """WSGI middleware timing each request from arrival until its body is sent.
+
+    Requests are labelled with the matched URL rule (set by
+    label_request_route), never the raw path. WebSocket upgrades pass
+    straight through; open sockets are counted by jarvis_ws_clients.
+    """
+
+    def __init__(self, wsgi_app, registry: MetricsRegistry):
+        self.wsgi_app = wsgi_app
+        self.registry = registry
+
+    def __call__(self, environ, start_response):
+        if environ.get('HTTP_UPGRADE', '').lower() == 'websocket':
+            return self.wsgi_app(environ, start_response)
+        started = time.perf_counter()
+        status = ["500"]
+
+        def capture_status(status_line, headers, exc_info=None):
+            status[0] = status_line[:3]
+            return start_response(status_line, headers, exc_info)
+
+        def finish(size: int):
+            self.registry.finish_request(environ.get('REQUEST_METHOD', ''), environ.get(ROUTE_ENVIRON_KEY, "unmatched"),
+                                         status[0], time.perf_counter() - started, size)
+
+        self.registry.start_request()
+        try:
+            body = self.wsgi_app(environ, capture_status)
+        except BaseException:
+            finish(0)
+            raise
+        return MeteredBody(body, finish)
+
+
+request_metrics = MetricsRegistry(REQUEST_METRICS_DIR, METRIC_FAMILIES)
+app.wsgi_app = RequestMetricsMiddleware(app.wsgi_app, request_metrics)
+
+
+@app.before_request
+def label_request_route():
+    """Label request metrics with the URL rule so /api/workflows/<id> is one series"""
+    if request.url_rule is not None:
+        request.environ[ROUTE_ENVIRON_KEY] = request.url_rule.rule
+
+
+# ============================================================================
+# SAMPLING PROFILER
+# ============================================================================
+
+# Admin-only endpoints (/api/admin/*) are disabled unless this is set
+ADMIN_TOKEN = os.environ.get('JARVIS_ADMIN_TOKEN', '')
+PROFILER_DEFAULT_INTERVAL_MS = float(os.environ.get('PROFILER_INTERVAL_MS', 10))
+PROFILER_MAX_DURATION = float(os.environ.get('PROFILER_MAX_DURATION', 600))
+PROFILER_MAX_STACKS = int(os.environ.get('PROFILER_MAX_STACKS', 50000))
+THREAD_NUMBER_PATTERN = re.compile(r"\d+")
+
+
+class StackProfiler:
+    """Wall-clock sampling profiler over every thread of this worker.
+
+    A session samples ``sys._current_frames()`` from its own thread every
+    ``interval_ms`` for at most ``duration`` seconds, counting identical
+    stacks. With a ``route`` it only samples while a request for that URL
+    rule is in flight, and roots the serving threads' stacks at the route;
+    other threads are rooted at their name. Request threads only ever
+    add or remove their id in a dict, so they are never blocked, and when
+    no session runs there is no sampler thread at all.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        # URL rule being profiled; request hooks check only this when idle
+        self.route: Optional[str] = None
+        self._requests: Dict[int, str] = {}
+        self._labels: Dict[Any, tuple] = {}
+        self.stacks: Dict[tuple, int] = {}
+        self.session: Optional[Dict[str, Any]] = None
+
+    def start(self, duration: float, interval_ms: float = PROFILER_DEFAULT_INTERVAL_MS,
+              route: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                raise ValueError("A profiling session is already running")
+            self._stop.clear()
+            self._requests.clear()
+            self.stacks = {}
+            self.session = {
+                "pid": os.getpid(),
+                "route": route,
+                "duration": duration,
+                "interval_ms": interval_ms,
+                "started_at": datetime.now().isoformat(),
+                "finished_at": None,
+                "samples": 0,
+                "truncated": 0
+            }
+            self.route = route
+            self._thread = threading.Thread(target=self._run, args=(time.monotonic() + duration, interval_ms / 1000),
+                                            name="stack-profiler", daemon=True)
+            self._thread.start()
+            return self.status()
+
+    def stop(self) -> Dict[str, Any]:
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+        return self.status()
+
+    def enter_request(self, route: str):
+        self._requests[threading.get_ident()] = route
+
+    def leave_request(self):
+        self._requests.pop(threading.get_ident(), None)
+
+    def _frame_label(self, code) -> tuple:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = (code.co_qualname, code.co_filename, code.co_firstlineno)
+        return label
+
+    def _sample(self, own_ident: int):
+        requests = dict(self._requests)
+        if self.route is not None and not requests:
+            return
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = self.stacks
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(self._frame_label(frame.f_code))
+                frame = frame.f_back
+            if ident in requests:
+                root = f"route {requests[ident]}"
+            else:
+                root = THREAD_NUMBER_PATTERN.sub("N", names.get(ident, "thread"))
+            key = (root, *reversed(frames))
+            if key not in stacks and len(stacks) >= PROFILER_MAX_STACKS:
+                self.session["truncated"] += 1
+                continue
+            stacks[key] = stacks.get(key, 0) + 1
+        self.session["samples"] += 1
+
+    def _run(self, deadline: float, interval: float):
+        own_ident = threading.get_ident()
+        try:
+            while not self._stop.wait(interval) and time.monotonic() < deadline:
+                self._sample(own_ident)
+        finally:
+            self.route = None
+            self._requests.clear()
+            self.session["finished_at"] = datetime.now().isoformat()
+
+    def status(self) -> Dict[str, Any]:
+        running = self._thread is not None and self._thread.is_alive()
+        if self.session is None:
+            return {"state": "idle", "pid": os.getpid()}
+        return dict(self.session, state="running" if running else "finished", stacks=len(self.stacks))
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        if isinstance(frame, str):
+            return frame
+        name, filename, line = frame
+        return f"{name} ({Path(filename).name}:{line})"
+
+    def collapsed(self) -> str:
+        """Stacks in the collapsed format read by flamegraph.pl, speedscope and others"""
+        lines = [
+            ";".join(self._frame_name(frame).replace(";", ":") for frame in stack) + f" {count}"
+            for stack, count in sorted(self.stacks.items())
+        ]
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self) -> Dict[str, Any]:
+        """The session as a speedscope sampled profile, weighted in milliseconds"""
+        frame_index: Dict[Any, int] = {}
+        frames = []
+        samples = []
+        weights = []
+        interval_ms = self.session["interval_ms"] if self.session else PROFILER_DEFAULT_INTERVAL_MS
+        for stack, count in self.stacks.items():
+            indexes = []
+            for frame in stack:
+                index = frame_index.get(frame)
+                if index is None:
+                    index = frame_index[frame] = len(frames)
+                    if isinstance(frame, str):
+                        frames.append({"name": frame})
+                    else:
+                        frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                indexes.append(index)
+            samples.append(indexes)
+            weights.append(count * interval_ms)
+        name = f"jarvis {os.getpid()} {(self.session or {}).get('route') or 'all routes'}"
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "jarvis-unified-backend",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights
+            }]
+        }
+
+
+stack_profiler = StackProfiler()
+
+
+@app.before_request
+def profile_request_route():
+    """Mark the thread serving the profiled route; a single attribute check otherwise"""
+    if stack_profiler.route is not None and request.url_rule is not None \
+            and request.url_rule.rule == stack_profiler.route:
+        stack_profiler.enter_request(request.url_rule.rule)
+
+
+@app.teardown_request
+def profile_request_done(error=None):
+    # Runs after a streamed body finishes, so streaming routes are covered end to end
+    if stack_profiler.route is not None:
+        stack_profiler.leave_request()
+
+
+def admin_error():
+    """An error response unless the request carries JARVIS_ADMIN_TOKEN as a bearer token"""
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Admin endpoints are disabled"}), 404
+    supplied = request.headers.get('Authorization', '')
+    if not supplied.startswith('Bearer ') or not hmac.compare_digest(supplied[7:].strip().encode(), ADMIN_TOKEN.encode()):
+        return jsonify({"error": "Admin token required"}), 401
+    return None
+
+
+# ============================================================================
+# BROADCAST HUB
+# ============================================================================
+
+# unix: fan out to every worker on this host through Unix datagram sockets
+# local: deliver only to this worker's clients
+BROADCAST_TRANSPORT = os.environ.get('JARVIS_BROADCAST_TRANSPORT', 'unix' if hasattr(socket, 'AF_UNIX') else 'local')
+HUB_DIR = Path(os.environ.get('JARVIS_HUB_DIR', DATA_DIR / "hub"))
+HUB_MAX_FRAME = 256 * 1024
+
+
+class LocalTransport:
+    """Transport with no peers; broadcasts reach only this worker"""
+
+    name = "local"
+
+    def start(self, deliver):
+        pass
+
+    def publish(self, frame: bytes):
+        pass
+
+
+class UnixSocketTransport:
+    """Fans frames out to every worker's datagram socket in a shared directory.
+
+    Each worker binds ``worker-<pid>.sock`` and runs a receiver thread that
+    hands incoming frames to the local delivery callback. Sends are
+    non-blocking; a peer whose buffer is full misses that frame rather than
+    stalling the publisher.
+    """
+
+    name = "unix"
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.path = directory / f"worker-{os.getpid()}.sock"
+        self._receiver = None
+        self._sender = None
+        self._peers: List[str] = []
+        self._peers_mtime = None
+        self.dropped = 0
+
+    def start(self, deliver):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            self.path.unlink()
+        self._receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._receiver.bind(str(self.path))
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+        atexit.register(self.close)
+
+        def receive_loop():
+            while True:
+                try:
+                    frame = self._receiver.recv(HUB_MAX_FRAME)
+                except OSError:
+                    return
+                try:
+                    deliver(frame.decode())
+                except Exception:
+                    pass
+
+        threading.Thread(target=receive_loop, name="broadcast-receiver", daemon=True).start()
+
+    def _peer_paths(self) -> List[str]:
+        """Peer socket paths, re-listed only when the directory changes"""
+        mtime = self.directory.stat().st_mtime_ns
+        if mtime != self._peers_mtime:
+            own = self.path.name
+            self._peers = [
+                str(self.directory / name) for name in os.listdir(self.directory)
+                if name.startswith("worker-") and name.endswith(".sock") and name != own
+            ]
+            self._peers_mtime = mtime
+        return self._peers
+
+    def publish(self, frame: bytes):
+        for peer in self._peer_paths():
+            try:
+                self._sender.sendto(frame, peer)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Worker exited without cleaning up
+                try:
+                    os.unlink(peer)
+                except OSError:
+                    pass
+            except OSError:
+                self.dropped += 1
+
+    def close(self):
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+
+
+def create_broadcast_transport():
+    """Create the transport selected by JARVIS_BROADCAST_TRANSPORT"""
+    if BROADCAST_TRANSPORT == 'unix':
+        return UnixSocketTransport(HUB_DIR)
+    return LocalTransport()
+
+
+# Outbound queue per WebSocket client; overflow policy is drop_oldest, coalesce_metrics or disconnect
+WS_QUEUE_SIZE = int(os.environ.get('WS_QUEUE_SIZE', 256))
+WS_OVERFLOW_POLICY = os.environ.get('WS_OVERFLOW_POLICY', 'drop_oldest')
+WS_MAX_BATCH = 64
+WS_MAX_BATCH_WINDOW_MS = 1000
+
+
+def encode_batch(payloads: list):
+    """Join pre-encoded messages into one JSON array or MessagePack array frame"""
+    if isinstance(payloads[0], str):
+        return "[" + ",".join(payloads) + "]"
+    count = len(payloads)
+    header = bytes([0x90 | count]) if count < 16 else b"\xdc" + count.to_bytes(2, "big")
+    return header + b"".join(payloads)
+
+
+class ClientConnection:
+    """A WebSocket client with a bounded outbound queue drained by its own writer thread.
+
+    Broadcasting only enqueues, so a slow or half-dead socket never blocks
+    the publisher. Under ``coalesce_metrics`` a queued metrics tick is
+    replaced by the newer one instead of piling up.
+    """
+
+    def __init__(self, ws, max_size: int = WS_QUEUE_SIZE, policy: str = WS_OVERFLOW_POLICY):
+        self.ws = ws
+        self.max_size = max_size
+        self.policy = policy
+        self.connected_at = time.time()
+        self.closed = False
+        self.topics = set()
+        self.implicit_topics = False  # On "*" only because it connected without topics
+        self.levels = None  # None accepts every level
+        self.encoding = "json"  # Encoding of compact metrics frames: json or msgpack
+        self.batch_window = 0.0  # Seconds to gather messages into one frame
+        self.queued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self._queue = deque()  # (topic, payload)
+        self._cond = threading.Condition()
+        self._start_writer()
+
+    def _start_writer(self):
+        self._writer = threading.Thread(target=self._drain, name="ws-writer", daemon=True)
+        self._writer.start()
+
+    def send(self, payload, topic: str = ""):
+        """Queue an already-serialized message; returns False once the client is closed"""
+        with self._cond:
+            if self.closed:
+                return False
+
+            if self.policy == 'coalesce_metrics' and topic.endswith(".metrics"):
+                for i, (queued_topic, _) in enumerate(self._queue):
+                    if queued_topic == topic:
+                        del self._queue[i]
+                        self.coalesced += 1
+                        break
+
+            if len(self._queue) >= self.max_size:
+                if self.policy == 'disconnect':
+                    self.dropped += len(self._queue) + 1
+                    self._queue.clear()
+                    self.closed = True
+                    self._cond.notify()
+                    return False
+                self._queue.popleft()
+                self.dropped += 1
+
+            self._queue.append((topic, payload))
+            self.queued += 1
+            self._cond.notify()
+            return True
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def _next_frame(self):
+        """Pop the next payload, batching same-typed payloads within the batch window"""
+        batch = [self._queue.popleft()[1]]
+        if self.batch_window:
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < WS_MAX_BATCH and not self.closed:
+                if not self._queue:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                    continue
+                if type(self._queue[0][1]) is not type(batch[0]):
+                    break
+                batch.append(self._queue.popleft()[1])
+        return batch
+
+    def _drain(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self.closed:
+                    self._cond.wait()
+                if self.closed:
+                    break
+                batch = self._next_frame()
+            try:
+                self.ws.send(batch[0] if len(batch) == 1 else encode_batch(batch))
+                self.sent += len(batch)
+            except Exception:
+                with self._cond:
+                    self.closed = True
+                break
+        try:
+            self.ws.close()
+        except Exception:
+            pass
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connected_at": datetime.fromtimestamp(self.connected_at).isoformat(),
+            "depth": self.depth,
+            "queued": self.queued,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "closed": self.closed,
+            "topics": sorted(self.topics),
+            "levels": sorted(self.levels) if self.levels is not None else None,
+            "encoding": self.encoding,
+            "batch_ms": round(self.batch_window * 1000)
+        }
+
+
+# Compact metrics channel: keyframes plus deltas of SYSTEM.metrics ticks
+METRICS_TOPIC = "SYSTEM.metrics"
+COMPACT_METRICS_TOPIC = "SYSTEM.metrics.compact"
+# Per-request generation streams; only delivered to clients subscribed to the exact topic
+CONTENT_STREAM_TOPIC = "CONTENT.stream"
+METRICS_KEYFRAME_INTERVAL = int(os.environ.get('METRICS_KEYFRAME_INTERVAL', 12))
+
+
+class CompactMetricsChannel:
+    """Re-encodes metrics ticks as keyframes and deltas for opted-in clients.
+
+    Frames are ``{"t": "k"|"d", "s": seq, "ts": epoch, "m": {field: value}}``;
+    a delta carries only the fields that changed since the previous frame.
+    Each worker decodes a tick once and encodes each frame once per encoding
+    in use, however many clients receive it. A client that sees a gap in
+    ``s`` can ask for a fresh keyframe with ``{"action": "keyframe"}``.
+    """
+
+    def __init__(self, keyframe_interval: int = METRICS_KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self._lock = threading.Lock()
+        self.sequence = 0
+        self.state: Dict[str, Any] = {}
+        self.timestamp = 0.0
+
+    @staticmethod
+    def encode(frame: Dict[str, Any], encoding: str):
+        if encoding == "msgpack" and msgpack is not None:
+            return msgpack.packb(frame)
+        return json.dumps(frame, separators=(",", ":"))
+
+    def keyframe(self) -> Optional[Dict[str, Any]]:
+        if not self.state:
+            return None
+        return {"t": "k", "s": self.sequence, "ts": self.timestamp, "m": dict(self.state)}
+
+    def relay(self, payload: str, recipients):
+        """Turn a full metrics message into a frame and queue it for compact clients"""
+        metrics = json.loads(payload).get("metrics") or {}
+        with self._lock:
+            self.sequence += 1
+            self.timestamp = round(time.time(), 3)
+            if self.sequence % self.keyframe_interval == 1 or not self.state:
+                frame = {"t": "k", "s": self.sequence, "ts": self.timestamp, "m": metrics}
+            else:
+                changed = {key: value for key, value in metrics.items() if self.state.get(key) != value}
+                frame = {"t": "d", "s": self.sequence, "ts": self.timestamp, "m": changed}
+            self.state = dict(metrics)
+
+        encoded = {}
+        dead_clients = []
+        for client in recipients:
+            if client.encoding not in encoded:
+                encoded[client.encoding] = self.encode(frame, client.encoding)
+            if not client.send(encoded[client.encoding], COMPACT_METRICS_TOPIC):
+                dead_clients.append(client)
+        return dead_clients
+
+    def send_keyframe(self, client):
+        frame = self.keyframe()
+        if frame is not None:
+            client.send(self.encode(frame, client.encoding), COMPACT_METRICS_TOPIC)
+
+
+class TopicIndex:
+    """Maps topics to subscribed clients.
+
+    Subscriptions are exact topics (``SYSTEM.metrics``), prefix wildcards
+    (``SACRED_CIRCUITS.*``) or ``*``. Per-request ``CONTENT.stream.<id>``
+    topics carry one user's generation and match exact subscriptions only.
+    Resolved recipient sets are cached per topic and the cache is dropped
+    whenever a subscription changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._exact: Dict[str, set] = {}
+        self._prefix: Dict[str, set] = {}
+        self._everyone = set()
+        self._resolved: Dict[str, frozenset] = {}
+
+    def _bucket(self, pattern: str, create: bool) -> Optional[set]:
+        if pattern == "*":
+            return self._everyone
+        table, key = (self._prefix, pattern[:-1]) if pattern.endswith(".*") else (self._exact, pattern)
+        if create:
+            return table.setdefault(key, set())
+        return table.get(key)
+
+    def subscribe(self, client, patterns: List[str]):
+        with self._lock:
+            for pattern in patterns:
+                self._bucket(pattern, create=True).add(client)
+            self._resolved = {}
+
+    def unsubscribe(self, client, patterns: List[str]):
+        with self._lock:
+            for pattern in patterns:
+                bucket = self._bucket(pattern, create=False)
+                if bucket is not None:
+                    bucket.discard(client)
+            self._resolved = {}
+
+    def remove(self, client):
+        with self._lock:
+            self._everyone.discard(client)
+            for table in (self._exact, self._prefix):
+                for bucket in table.values():
+                    bucket.discard(client)
+            self._resolved = {}
+
+    def exact(self, topic: str) -> frozenset:
+        """Get the clients that subscribed to exactly this topic (no wildcards)"""
+        return frozenset(self._exact.get(topic, ()))
+
+    def resolve(self, topic: str) -> frozenset:
+        """Get the clients subscribed to a topic"""
+        recipients = self._resolved.get(topic)
+        if recipients is not None:
+            return recipients
+
+        with self._lock:
+            if topic.startswith(CONTENT_STREAM_TOPIC + "."):
+                recipients = frozenset(self._exact.get(topic, ()))
+                self._resolved[topic] = recipients
+                return recipients
+            matched = set(self._everyone)
+            matched.update(self._exact.get(topic, ()))
+            parts = topic.split(".")
+            for i in range(1, len(parts)):
+                matched.update(self._prefix.get(".".join(parts[:i]) + ".", ()))
+            recipients = frozenset(matched)
+            self._resolved[topic] = recipients
+        return recipients
+
+
+class BroadcastHub:
+    """Publishes messages to the WebSocket clients of every worker.
+
+    A message is serialized once per publish; the same encoded frame goes to
+    each peer worker and the same string is queued for each local client.
+    Frames carry the topic and level on their first line so receivers can
+    route through the topic index without decoding the payload.
+    """
+
+    def __init__(self, clients: set, transport):
+        self.clients = clients
+        self.transport = transport
+        self.index = TopicIndex()
+        self.metrics_channel = CompactMetricsChannel()
+        self._lock = threading.Lock()
+        # Counters of clients that have already disconnected
+        self.retired = {"queued": 0, "sent": 0, "dropped": 0, "coalesced": 0, "clients": 0}
+
+    def start(self):
+        try:
+            self.transport.start(self._receive)
+        except OSError as e:
+            print(f"Broadcast hub falling back to local delivery: {e}")
+            self.transport = LocalTransport()
+
+    def publish(self, message: Dict[str, Any], topic: str):
+        payload = json.dumps(message)
+        level = message.get("level", "info")
+        self.transport.publish(f"{topic}\t{level}\n{payload}".encode())
+        self.deliver_local(payload, topic, level)
+
+    def publish_local(self, message: Dict[str, Any], topic: str):
+        """Deliver a message to this worker's clients only (for data every worker already has)"""
+        self.deliver_local(json.dumps(message), topic, message.get("level", "info"))
+
+    def _receive(self, frame: str):
+        header, _, payload = frame.partition("\n")
+        topic, _, level = header.partition("\t")
+        self.deliver_local(payload, topic, level or "info")
+
+    def deliver_local(self, payload: str, topic: str, level: str = "info"):
+        """Queue an already-serialized message for this worker's subscribed clients"""
+        started = time.perf_counter()
+        recipients = self.index.resolve(topic)
+        compact_clients = self.index.exact(COMPACT_METRICS_TOPIC) if topic == METRICS_TOPIC else ()
+        if compact_clients:
+            # Compact subscribers get full ticks only if they asked for SYSTEM.metrics by name, not via a wildcard
+            recipients = recipients - (compact_clients - self.index.exact(METRICS_TOPIC))
+        recipients = [client for client in recipients if client.levels is None or level in client.levels]
+        dead_clients = [client for client in recipients if not client.send(payload, topic)]
+        if compact_clients:
+            # Compact frames are opt-in only, wildcard subscribers never receive them
+            dead_clients += self.metrics_channel.relay(payload, compact_clients)
+
+        # Remove dead clients
+        for client in dead_clients:
+            self.remove(client)
+        request_metrics.observe("jarvis_broadcast_fanout_seconds", time.perf_counter() - started)
+        request_metrics.inc("jarvis_broadcast_deliveries_total", amount=len(recipients))
+
+    def add(self, client: ClientConnection, topics: Optional[List[str]] = None,
+            levels: Optional[List[str]] = None):
+        self.clients.add(client)
+        self.subscribe(client, topics or ["*"], levels)
+        client.implicit_topics = not topics
+
+    def subscribe(self, client: ClientConnection, topics: List[str], levels: Optional[List[str]] = None):
+        """Add topic patterns to a client; levels, when given, replace its level filter.
+
+        The first explicit subscription replaces the "*" a client gets for
+        connecting without topics.
+        """
+        topics = [topic for topic in topics if topic]
+        if topics and client.implicit_topics:
+            client.implicit_topics = False
+            self.unsubscribe(client, ["*"])
+        client.topics.update(topics)
+        if levels is not None:
+            client.levels = set(levels) or None
+        self.index.subscribe(client, topics)
+        if COMPACT_METRICS_TOPIC in topics:
+            self.metrics_channel.send_keyframe(client)
+
+    def unsubscribe(self, client: ClientConnection, topics: List[str]):
+        client.topics.difference_update(topics)
+        self.index.unsubscribe(client, topics)
+
+    def remove(self, client: ClientConnection):
+        client.close()
+        self.index.remove(client)
+        with self._lock:
+            if client not in self.clients:
+                return
+            self.clients.discard(client)
+            for key in ("queued", "sent", "dropped", "coalesced"):
+                self.retired[key] += getattr(client, key)
+            self.retired["clients"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue counters for this worker, totals include disconnected clients"""
+        clients = list(self.clients)
+        totals = dict(self.retired)
+        for client in clients:
+            for key in ("queued", "sent", "dropped", "coalesced"):
+                totals[key] += getattr(client, key)
+        return {
+            "pid": os.getpid(),
+            "transport": self.transport.name,
+            "transport_dropped": getattr(self.transport, "dropped", 0),
+            "overflow_policy": WS_OVERFLOW_POLICY,
+            "queue_size": WS_QUEUE_SIZE,
+            "connected_clients": len(clients),
+            "disconnected_clients": totals.pop("clients"),
+            "queue_depth": sum(client.depth for client in clients),
+            "totals": totals,
+            "clients": [client.stats() for client in clients]
+        }
+
+
+broadcast_hub = BroadcastHub(ws_clients, create_broadcast_transport())
+broadcast_hub.start()
+
+
+def message_topic(message: Dict[str, Any]) -> str:
+    """Derive a SOURCE.kind topic for a message"""
+    kind = "metrics" if "metrics" in message else "events"
+    return f"{message.get('source', 'SYSTEM')}.{kind}"
+
+
+def broadcast_message(message: Dict[str, Any], topic: Optional[str] = None):
+    """Broadcast message to all WebSocket clients on every worker"""
+    broadcast_hub.publish(message, topic or message_topic(message))
+
+
+# ============================================================================
+# METRICS TIME-SERIES STORE
+# ============================================================================
+
+# Points returned by /api/metrics/history when no range is given
+MAX_HISTORY_POINTS = 50
+MAX_HISTORY_QUERY_POINTS = int(os.environ.get('MAX_HISTORY_QUERY_POINTS', 2000))
+METRICS_LOG_DIR = Path(os.environ.get('JARVIS_METRICS_DIR', DATA_DIR / "metrics"))
+
+# resolution -> (bucket seconds, ring capacity); raw keeps ~1 day of 5s samples
+METRICS_RESOLUTIONS = {
+    "raw": (0, int(os.environ.get('METRICS_RAW_CAPACITY', 17280))),
+    "1m": (60, 7 * 24 * 60),
+    "1h": (3600, 90 * 24),
+    "1d": (86400, 10 * 366),
+}
+METRICS_FIELDS = ("cpu", "memory", "optimization")
+
+
+class RingColumns:
+    """Fixed-capacity ring of numeric rows stored column-wise in ``array('d')``.
+
+    Column 0 is the timestamp. Rows are appended in timestamp order, so range
+    lookups are binary searches over the ring.
+    """
+
+    def __init__(self, width: int, capacity: int):
+        self.width = width
+        self.capacity = capacity
+        self.columns = [array('d', bytes(8 * capacity)) for _ in range(width)]
+        self.start = 0
+        self.size = 0
+
+    def append(self, row):
+        if self.size < self.capacity:
+            index = (self.start + self.size) % self.capacity
+            self.size += 1
+        else:
+            index = self.start
+            self.start = (self.start + 1) % self.capacity
+        for column, value in zip(self.columns, row):
+            column[index] = value
+
+    def timestamp(self, position: int) -> float:
+        return self.columns[0][(self.start + position) % self.capacity]
+
+    @property
+    def last_timestamp(self) -> Optional[float]:
+        return self.timestamp(self.size - 1) if self.size else None
+
+    def bisect(self, ts: float, right: bool = False) -> int:
+        """Position of the first row with timestamp >= ts (> ts when right)"""
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = self.timestamp(mid)
+            if value < ts or (right and value == ts):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def rows(self, lo: int, hi: int) -> List[tuple]:
+        columns, start, capacity = self.columns, self.start, self.capacity
+        return [
+            tuple(column[(start + position) % capacity] for column in columns)
+            for position in range(lo, hi)
+        ]
+
+
+class RecordLog:
+    """Append-only file of fixed-size float records backing one ring"""
+
+    def __init__(self, path: Path, width: int, capacity: int):
+        self.path = path
+        self.record = struct.Struct(f"<{width}d")
+        self.capacity = capacity
+        self._file = None
+        self._size = 0  # Bytes in the file, tracked so appends need no stat
+
+    def load(self) -> List[tuple]:
+        """Read the newest ``capacity`` records"""
+        if not self.path.exists():
+            return []
+        size = self.record.size
+        with open(self.path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            length = f.tell() - f.tell() % size
+            offset = max(0, length - self.capacity * size)
+            f.seek(offset)
+            data = f.read(length - offset)
+        return list(self.record.iter_unpack(data))
+
+    def append(self, row):
+        """Append a record, compacting once the file holds twice what the ring keeps"""
+        if self._file is None:
+            self._file = open(self.path, 'ab', buffering=0)
+            self._size = self._file.tell()
+        if self._size > 2 * self.capacity * self.record.size:
+            self._compact()
+        self._file.write(self.record.pack(*row))
+        self._size += self.record.size
+
+    def _compact(self):
+        """Rewrite the log keeping only what the ring can hold"""
+        rows = self.load()
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(b"".join(self.record.pack(*row) for row in rows))
+        os.replace(tmp_path, self.path)
+        self._file.close()
+        self._file = open(self.path, 'ab', buffering=0)
+        self._size = self._file.tell()
+
+
+class MetricsTimeSeries:
+    """Metrics history with raw samples plus 1m/1h/1d average rollups.
+
+    Each resolution is a ring of array columns backed by its own append log,
+    so history survives restarts and range queries are index lookups.
+    """
+
+    def __init__(self, log_dir: Optional[Path] = METRICS_LOG_DIR):
+        self._lock = threading.Lock()
+        self.rings: Dict[str, RingColumns] = {}
+        self.logs: Dict[str, RecordLog] = {}
+        # resolution -> [bucket_start, sums..., count] of the bucket still filling
+        self._open_buckets: Dict[str, Optional[list]] = {}
+
+        if log_dir is not None:
+            try:
+                log_dir.mkdir(parents=True, exist_ok=True)
+            except OSError as e:
+                print(f"Metrics history will not persist: {e}")
+                log_dir = None
+
+        for resolution, (bucket, capacity) in METRICS_RESOLUTIONS.items():
+            width = 1 + len(METRICS_FIELDS) + (1 if bucket else 0)
+            self.rings[resolution] = RingColumns(width, capacity)
+            self._open_buckets[resolution] = None
+            if log_dir is not None:
+                self.logs[resolution] = RecordLog(log_dir / f"{resolution}.log", width, capacity)
+
+        self._replay()
+
+    def _replay(self):
+        for resolution, log in self.logs.items():
+            try:
+                for row in log.load():
+                    self._append_row(resolution, row)
+            except OSError as e:
+                print(f"Could not replay {log.path}: {e}")
+
+        # Re-open the rollup buckets from raw samples newer than their last closed bucket
+        raw = self.rings["raw"]
+        for resolution, (bucket, _) in METRICS_RESOLUTIONS.items():
+            if not bucket:
+                continue
+            last = self.rings[resolution].last_timestamp
+            lo = raw.bisect(last + bucket) if last is not None else 0
+            for row in raw.rows(lo, raw.size):
+                self._roll_up(resolution, bucket, row, persist=False)
+
+    def _append_row(self, resolution: str, row, persist: bool = False) -> bool:
+        ring = self.rings[resolution]
+        last = ring.last_timestamp
+        if last is not None and row[0] <= last:
+            return False  # Out-of-order or duplicate sample
+        ring.append(row)
+        if persist and resolution in self.logs:
+            try:
+                self.logs[resolution].append(row)
+            except OSError:
+                pass
+        return True
+
+    def _roll_up(self, resolution: str, bucket: int, row, persist: bool = True):
+        ts = row[0]
+        bucket_start = ts - ts % bucket
+        current = self._open_buckets[resolution]
+        if current is not None and current[0] != bucket_start:
+            count = current[-1]
+            closed = [current[0]] + [total / count for total in current[1:-1]] + [count]
+            self._append_row(resolution, closed, persist)
+            current = None
+        if current is None:
+            current = [bucket_start] + [0.0] * len(METRICS_FIELDS) + [0]
+            self._open_buckets[resolution] = current
+        for i, value in enumerate(row[1:], start=1):
+            current[i] += value
+        current[-1] += 1
+
+    def append(self, ts: float, cpu: float, memory: float, optimization: float, persist: bool = True):
+        """Record one raw sample and fold it into the rollups; only the sampling leader persists"""
+        row = (ts, cpu, memory, optimization)
+        with self._lock:
+            if not self._append_row("raw", row, persist):
+                return
+            for resolution, (bucket, _) in METRICS_RESOLUTIONS.items():
+                if bucket:
+                    self._roll_up(resolution, bucket, row, persist)
+
+    def query(self, start: Optional[float] = None, end: Optional[float] = None,
+              resolution: str = "raw", limit: int = MAX_HISTORY_QUERY_POINTS) -> List[Dict[str, Any]]:
+        """Get points in [start, end] at a resolution, newest ``limit`` points at most"""
+        if resolution not in self.rings:
+            raise ValueError(f"Invalid resolution. Must be one of: {list(self.rings)}")
+
+        with self._lock:
+            ring = self.rings[resolution]
+            lo = ring.bisect(start) if start is not None else 0
+            hi = ring.bisect(end, right=True) if end is not None else ring.size
+            lo = max(lo, hi - limit)
+            rows = ring.rows(lo, hi)
+
+            # Include the bucket still filling so rollups reach the present
+            current = self._open_buckets.get(resolution)
+            if current is not None and (start is None or current[0] >= start) and (end is None or current[0] <= end):
+                count = current[-1]
+                rows.append(tuple([current[0]] + [total / count for total in current[1:-1]] + [count]))
+                rows = rows[-limit:]
+
+        points = []
+        for row in rows:
+            point = {"timestamp": datetime.fromtimestamp(row[0]).isoformat()}
+            point.update((field, round(value, 1)) for field, value in zip(METRICS_FIELDS, row[1:]))
+            if len(row) > 1 + len(METRICS_FIELDS):
+                point["samples"] = int(row[-1])
+            points.append(point)
+        return points
+
+
+metrics_store = MetricsTimeSeries()
+
+
+# ============================================================================
+# LEADER ELECTION
+# ============================================================================
+
+LEADER_LOCK_DIR = DATA_DIR / "leader"
+
+
+class LeaderLease:
+    """Host-wide leadership for one background duty, held as an exclusive flock.
+
+    At most one process holds ``<name>.lock``. The kernel drops the lock when
+    the holder exits or dies, so another process's next ``try_acquire()``
+    takes over. The holder writes its pid into the file for status reports.
+    """
+
+    def __init__(self, name: str, directory: Path = LEADER_LOCK_DIR):
+        self.name = name
+        self.path = directory / f"{name}.lock"
+        self._file = None
+        self._reset()
+        # flocks belong to the open file, which a forked child shares; the child must not count as holder
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self.held = False
+        self.acquired_at = None
+
+    def try_acquire(self) -> bool:
+        """Take the lease if no live process holds it; True while this process is the leader"""
+        if self.held:
+            return True
+        try:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, 'a+')
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        except OSError as e:
+            # Without a lock file every worker leads, as if it were the only one
+            print(f"Leader election for {self.name} unavailable: {e}")
+            self.held = True
+            self.acquired_at = time.time()
+            return True
+        self._file.truncate(0)
+        self._file.write(str(os.getpid()))
+        self._file.flush()
+        self.held = True
+        self.acquired_at = time.time()
+        return True
+
+    def holder(self) -> Optional[int]:
+        """Pid of the live leader, if any"""
+        try:
+            pid = int(self.path.read_text().strip() or 0)
+        except (OSError, ValueError):
+            return None
+        return pid if pid and process_alive(pid) else None
+
+
+# ============================================================================
+# METRICS SAMPLER
+# ============================================================================
+
+METRICS_SAMPLE_INTERVAL = float(os.environ.get('METRICS_SAMPLE_INTERVAL', 5))
+# Followers check for a new leader snapshot (and for a dead leader) this often
+METRICS_FOLLOW_INTERVAL = float(os.environ.get('METRICS_FOLLOW_INTERVAL', 1))
+METRICS_SNAPSHOT_PATH = DATA_DIR / "metrics-snapshot.json"
+WORKER_STATS_DIR = DATA_DIR / "workers"
+
+
+class MetricsSampler:
+    """Host metrics snapshot sampled by one elected process and shared with the others.
+
+    The holder of the ``metrics-sampler`` lease samples every ``interval``
+    seconds, records history and writes each snapshot to a JSON file. Other
+    workers poll that file and adopt newer snapshots, so every worker serves
+    the same numbers without touching psutil. When the leader dies, the
+    next follower to poll takes the lease and carries on the sequence.
+
+    CPU load is computed from the delta between consecutive ``cpu_times()``
+    readings, so sampling never sleeps. A newly elected leader only primes
+    the reading and takes its first sample one interval later, so no
+    recorded sample covers a near-empty window.
+    """
+
+    def __init__(self, lease: LeaderLease, interval: float = METRICS_SAMPLE_INTERVAL,
+                 snapshot_path: Path = METRICS_SNAPSHOT_PATH):
+        self.lease = lease
+        self.interval = interval
+        self.snapshot_path = snapshot_path
+        self._sample_lock = threading.Lock()
+        self._updated = threading.Condition()
+        self._last_cpu_times = psutil.cpu_times()
+        # (metrics, sampled_at, sequence) swapped as one reference so readers need no lock
+        self._current = None
+        self._snapshot_mtime = None
+        self._thread = None
+
+    @property
+    def leading(self) -> bool:
+        return self.lease.held
+
+    def _prime(self):
+        """Start a fresh CPU measurement window"""
+        self._last_cpu_times = psutil.cpu_times()
+
+    def _cpu_percent(self, advance: bool = True) -> float:
+        """CPU busy percentage since the previous sample (``advance`` starts the next window)"""
+        now = psutil.cpu_times()
+        last = self._last_cpu_times
+        if advance:
+            self._last_cpu_times = now
+
+        def busy_and_total(times):
+            total = sum(times)
+            idle = times.idle + getattr(times, 'iowait', 0.0)
+            return total - idle, total
+
+        busy_now, total_now = busy_and_total(now)
+        busy_last, total_last = busy_and_total(last)
+        total_delta = total_now - total_last
+        if total_delta <= 0:
+            return self._current[0]["cpu_load"] if self._current else 0.0
+        return round(min(100.0, max(0.0, (busy_now - busy_last) / total_delta * 100)), 1)
+
+    def _measure(self, advance: bool = True) -> Dict[str, Any]:
+        cpu_percent = self._cpu_percent(advance)
+        memory = psutil.virtual_memory()
+
+        # Use root filesystem for production, workspace for local
+        disk_path = "/" if not WORKSPACE_BASE.exists() else str(WORKSPACE_BASE)
+        disk = psutil.disk_usage(disk_path)
+
+        # Calculate optimization level (inverse of resource usage)
+        optimization_level = 100 - ((cpu_percent + memory.percent) / 2)
+
+        return {
+            "cpu_load": cpu_percent,
+            "memory_used_gb": round(memory.used / (1024**3), 1),
+            "memory_percent": memory.percent,
+            "disk_used_gb": round(disk.used / (1024**3), 1),
+            "disk_percent": disk.percent,
+            "optimization_level": round(optimization_level, 1),
+            "active_processes": len(psutil.pids())
+        }
+
+    def sample(self) -> Dict[str, Any]:
+        """Take one non-blocking sample and publish it to every worker as the current snapshot"""
+        with self._sample_lock:
+            metrics = self._measure()
+            sampled_at = time.time()
+            sequence = self.sequence + 1
+            self._current = (metrics, sampled_at, sequence)
+            self._write_snapshot(metrics, sampled_at, sequence)
+
+        # Store in history for charts
+        store_metrics_history(metrics, sampled_at)
+        self._notify()
+        return metrics
+
+    def _write_snapshot(self, metrics: Dict[str, Any], sampled_at: float, sequence: int):
+        try:
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.snapshot_path.with_suffix(f'.{os.getpid()}.tmp')
+            tmp.write_text(json.dumps({"metrics": metrics, "sampled_at": sampled_at, "sequence": sequence,
+                                       "pid": os.getpid()}))
+            os.replace(tmp, self.snapshot_path)
+        except OSError:
+            pass
+
+    def follow(self) -> bool:
+        """Adopt the leader's published snapshot if it is newer than ours"""
+        try:
+            mtime = self.snapshot_path.stat().st_mtime_ns
+            if mtime == self._snapshot_mtime:
+                return False
+            published = json.loads(self.snapshot_path.read_text())
+            metrics, sampled_at, sequence = published["metrics"], published["sampled_at"], published["sequence"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        self._snapshot_mtime = mtime
+        with self._sample_lock:
+            if sequence <= self.sequence:
+                return False
+            self._current = (metrics, sampled_at, sequence)
+
+        # The leader persisted this sample; keep this worker's in-memory history in step
+        store_metrics_history(metrics, sampled_at, persist=False)
+        self._notify()
+        return True
+
+    def _notify(self):
+        with self._updated:
+            self._updated.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get the latest metrics annotated with when they were sampled"""
+        current = self._current
+        if current is None:
+            if not self.follow():
+                # Nothing published yet: measure locally without publishing, recording it
+                # or cutting short the leader's first CPU window
+                with self._sample_lock:
+                    if self._current is None:
+                        self._current = (self._measure(advance=False), time.time(), 0)
+            current = self._current
+
+        metrics, sampled_at, _ = current
+        snapshot = dict(metrics)
+        snapshot["sampled_at"] = datetime.fromtimestamp(sampled_at).isoformat()
+        snapshot["age_seconds"] = round(max(0.0, time.time() - sampled_at), 3)
+        return snapshot
+
+    @property
+    def sequence(self) -> int:
+        return self._current[2] if self._current else 0
+
+    def wait_for_sample(self, after_sequence: int, timeout: Optional[float] = None) -> bool:
+        """Block until a sample newer than ``after_sequence`` is published"""
+        with self._updated:
+            return self._updated.wait_for(lambda: self.sequence > after_sequence, timeout)
+
+    def _run(self):
+        next_stats = 0.0
+        while True:
+            try:
+                if self.lease.held:
+                    self.sample()
+                elif self.lease.try_acquire():
+                    # Promoted: continue the previous leader's sequence from the next interval
+                    self.follow()
+                    self._prime()
+                else:
+                    self.follow()
+                if time.monotonic() >= next_stats:
+                    worker_stats.publish("leader" if self.leading else "follower")
+                    next_stats = time.monotonic() + self.interval
+            except Exception:
+                pass
+            time.sleep(self.interval if self.leading else min(self.interval, METRICS_FOLLOW_INTERVAL))
+
+    def start(self):
+        """Start the background sampling (or following) thread (idempotent)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="metrics-sampler", daemon=True)
+            self._thread.start()
+
+
+class WorkerStats:
+    """This worker's own process stats, published to ``<pid>.json`` for /api/system/workers"""
+
+    def __init__(self, directory: Path = WORKER_STATS_DIR):
+        self.directory = directory
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.started_at = time.time()
+        self._process = psutil.Process(self.pid)
+        self._last_cpu = (time.monotonic(), self._cpu_seconds())
+
+    def _cpu_seconds(self) -> float:
+        times = self._process.cpu_times()
+        return times.user + times.system
+
+    def sample(self, role: str) -> Dict[str, Any]:
+        """Process CPU since the previous sample, memory, threads and connections of this worker"""
+        now, cpu_seconds = time.monotonic(), self._cpu_seconds()
+        (last_at, last_cpu_seconds), self._last_cpu = self._last_cpu, (now, cpu_seconds)
+        elapsed = now - last_at
+        return {
+            "pid": self.pid,
+            "role": role,
+            "cpu_percent": round(max(0.0, (cpu_seconds - last_cpu_seconds) / elapsed * 100), 1) if elapsed > 0 else 0.0,
+            "rss_mb": round(self._process.memory_info().rss / (1024**2), 1),
+            "threads": threading.active_count(),
+            "ws_clients": len(ws_clients),
+            "requests_in_flight": request_metrics.collect().get(("jarvis_http_requests_in_flight", ""), 0),
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat(),
+            "updated_at": datetime.now().isoformat()
+        }
+
+    def publish(self, role: str) -> Dict[str, Any]:
+        stats = self.sample(role)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.directory / f"{self.pid}.json"
+            tmp = path.with_suffix('.tmp')
+            tmp.write_text(json.dumps(stats))
+            os.replace(tmp, path)
+        except OSError:
+            pass
+        return stats
+
+    def collect(self) -> List[Dict[str, Any]]:
+        """Last published stats of every live worker on this host; files of exited workers are removed"""
+        workers = []
+        for path in self.directory.glob("[0-9]*.json"):
+            pid = int(path.stem)
+            if not process_alive(pid):
+                path.unlink(missing_ok=True)
+                continue
+            try:
+                workers.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+        return sorted(workers, key=lambda worker: worker["pid"])
+
+
+metrics_lease = LeaderLease("metrics-sampler")
+metrics_sampler = MetricsSampler(metrics_lease)
+worker_stats = WorkerStats()
 
-    # Store in history for charts
-    store_metrics_history(metrics)
 
-    return metrics
+def get_system_metrics():
+    """Get real system metrics from the latest (leader-sampled) snapshot"""
+    return metrics_sampler.snapshot()
 
 
-def store_metrics_history(metrics):
+def store_metrics_history(metrics, ts: Optional[float] = None, persist: bool = True):
     """Store metrics in history for charting"""
-    global metrics_history
+    metrics_store.append(ts if ts is not None else time.time(), metrics["cpu_load"], metrics["memory_percent"],
+                         metrics["optimization_level"], persist)
 
-    metrics_history.append({
-        "timestamp": datetime.now().isoformat(),
-        "cpu": metrics["cpu_load"],
-        "memory": metrics["memory_percent"],
-        "optimization": metrics["optimization_level"]
-    })
 
-    # Keep only last MAX_HISTORY_POINTS
-    if len(metrics_history) > MAX_HISTORY_POINTS:
-        metrics_history = metrics_history[-MAX_HISTORY_POINTS:]
+# ============================================================================
+# SERVICE PORT INDEX
+# ============================================================================
+
+# Monitored services (name -> port). Override with JARVIS_SERVICES='{"name": port, ...}'
+DEFAULT_SERVICES = {
+    "workflow_studio": 8560,
+    "ultimate_hub": 8550,
+    "ai_command_center": 3000,
+}
+PORT_INDEX_TTL = float(os.environ.get('PORT_INDEX_TTL', 2))
+
+
+def load_service_registry() -> Dict[str, int]:
+    """Load the monitored service registry, falling back to the defaults"""
+    services = dict(DEFAULT_SERVICES)
+    raw = os.environ.get('JARVIS_SERVICES')
+    if raw:
+        try:
+            services.update({name: int(port) for name, port in json.loads(raw).items()})
+        except (ValueError, TypeError, AttributeError):
+            print(f"Ignoring invalid JARVIS_SERVICES: {raw!r}")
+    return services
+
+
+SERVICE_REGISTRY = load_service_registry()
+
+
+class ListeningPortIndex:
+    """Set of listening TCP ports built from one socket scan and cached for a short TTL.
+
+    Any number of service checks share the same scan; when the cache expires
+    one thread rebuilds it while concurrent readers keep using the stale copy.
+    """
+
+    def __init__(self, ttl: float = PORT_INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # (ports, built_at, error) swapped as one reference
+        self._current = None
+
+    def _scan(self):
+        return frozenset(
+            conn.laddr.port
+            for conn in psutil.net_connections(kind='tcp')
+            if conn.status == psutil.CONN_LISTEN and conn.laddr
+        )
+
+    def _rebuild(self):
+        try:
+            self._current = (self._scan(), time.monotonic(), None)
+        except Exception as e:
+            self._current = (frozenset(), time.monotonic(), e)
+
+    def _get(self):
+        current = self._current
+        if current is not None and time.monotonic() - current[1] < self.ttl:
+            return current
+
+        if not self._lock.acquire(blocking=current is None):
+            return current  # Another thread is rebuilding; serve the stale index
+        try:
+            current = self._current
+            if current is None or time.monotonic() - current[1] >= self.ttl:
+                self._rebuild()
+            return self._current
+        finally:
+            self._lock.release()
+
+    def status(self, port: int) -> str:
+        """Get 'running', 'offline' or 'error' for a port"""
+        ports, _, error = self._get()
+        if error is not None:
+            return "error"
+        return "running" if port in ports else "offline"
+
+    def invalidate(self):
+        self._current = None
+
+
+port_index = ListeningPortIndex()
 
 
 def get_running_services():
     """Get status of all JARVIS services"""
     services = {
-        "workflow_studio": {"port": 8560, "status": "unknown"},
-        "ultimate_hub": {"port": 8550, "status": "unknown"},
-        "ai_command_center": {"port": 3000, "status": "unknown"},
-        "backend": {"port": 8000, "status": "running"},
+        name: {"port": port, "status": port_index.status(port)}
+        for name, port in SERVICE_REGISTRY.items()
     }
+    services["backend"] = {"port": int(os.environ.get('PORT', 8000)), "status": "running"}
+    return services
 
-    for service, config in services.items():
-        if service == "backend":
-            continue
 
+# ============================================================================
+# SKILLS CATALOG
+# ============================================================================
+
+SKILLS_CATALOG_TTL = float(os.environ.get('SKILLS_CATALOG_TTL', 5))
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def parse_front_matter(text: str) -> Dict[str, Any]:
+    """Parse a leading ``---`` block of ``key: value`` lines (YAML when libyaml is available)"""
+    if not text.startswith("---"):
+        return {}
+    end = text.find("\n---", 3)
+    if end == -1:
+        return {}
+    block = text[3:end]
+
+    # Only the C loader; pure-Python YAML is slower than the simple parser below
+    if yaml is not None and hasattr(yaml, 'CSafeLoader'):
         try:
-            for conn in psutil.net_connections():
-                if conn.laddr.port == config["port"] and conn.status == 'LISTEN':
-                    services[service]["status"] = "running"
-                    break
+            data = yaml.load(block, Loader=yaml.CSafeLoader)
+            return data if isinstance(data, dict) else {}
+        except yaml.YAMLError:
+            return {}
+
+    data: Dict[str, Any] = {}
+    key = None
+    for line in block.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        if stripped.startswith("- ") and key is not None:
+            if not isinstance(data.get(key), list):
+                data[key] = []
+            data[key].append(stripped[2:].strip().strip("'\""))
+        elif ":" in line and not line[0].isspace():
+            key, _, value = line.partition(":")
+            key, value = key.strip(), value.strip()
+            if value.startswith("[") and value.endswith("]"):
+                data[key] = [item.strip().strip("'\"") for item in value[1:-1].split(",") if item.strip()]
             else:
-                services[service]["status"] = "offline"
-        except:
-            services[service]["status"] = "error"
+                data[key] = value.strip("'\"")
+    return data
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class SkillsCatalog:
+    """Skills in SKILLS_LIBRARY with parsed SKILL.md front-matter and a search index.
+
+    The library is scanned once; afterwards (at most every
+    SKILLS_CATALOG_TTL seconds) it is only re-listed when the library
+    directory's mtime changes, and SKILL.md files are re-parsed when their
+    own mtime changes. Directories without a SKILL.md stay candidates, since
+    adding one later does not touch the library's mtime. Searches go through an inverted token index with a
+    sorted vocabulary for prefix matches.
+    """
+
+    def __init__(self, ttl: float = SKILLS_CATALOG_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._library = None
+        self._library_mtime = None
+        self._skills: Dict[str, tuple] = {}  # id -> (SKILL.md mtime_ns, skill)
+        self._pending: set = set()  # Directories listed without a SKILL.md (yet)
+        # (sorted skills, token -> ids, sorted vocabulary) swapped as one reference
+        self._index = ([], {}, [])
+
+    def _skill_dirs(self) -> List[str]:
+        with os.scandir(SKILLS_LIBRARY) as entries:
+            return [entry.name for entry in entries if entry.is_dir() and not entry.name.startswith('.')]
+
+    def _load(self, skill_id: str, mtime_ns: int) -> Dict[str, Any]:
+        skill_dir = SKILLS_LIBRARY / skill_id
+        try:
+            with open(skill_dir / "SKILL.md", 'r', encoding='utf-8', errors='replace') as f:
+                metadata = parse_front_matter(f.read(64 * 1024))
+        except OSError:
+            metadata = {}
+        tags = metadata.get("tags") or metadata.get("keywords") or []
+        return {
+            "id": skill_id,
+            "name": skill_id.replace('-', ' ').title(),
+            "location": str(skill_dir),
+            "has_docs": True,
+            "description": str(metadata.get("description", "")),
+            "tags": [str(tag) for tag in tags] if isinstance(tags, list) else [str(tags)],
+            "metadata": metadata
+        }
 
-    return services
+    def refresh(self, force: bool = False):
+        now = time.monotonic()
+        if not force and self._checked_at is not None and now - self._checked_at < self.ttl \
+                and self._library == SKILLS_LIBRARY:
+            return
+
+        with self._lock:
+            if self._library != SKILLS_LIBRARY:
+                self._skills, self._pending, self._library_mtime, self._library = {}, set(), None, SKILLS_LIBRARY
+
+            try:
+                library_mtime = SKILLS_LIBRARY.stat().st_mtime_ns
+            except OSError:
+                if self._skills or self._checked_at is None:
+                    self._skills = {}
+                    self._rebuild()
+                self._checked_at = time.monotonic()
+                return
+
+            if library_mtime != self._library_mtime:
+                skill_ids = self._skill_dirs()
+            else:
+                skill_ids = list(self._skills) + list(self._pending)
+            changed = set(self._skills) - set(skill_ids)
+            skills = {}
+            pending = set()
+            for skill_id in skill_ids:
+                try:
+                    mtime_ns = os.stat(SKILLS_LIBRARY / skill_id / "SKILL.md").st_mtime_ns
+                except OSError:
+                    if skill_id in self._skills:
+                        changed.add(skill_id)
+                    pending.add(skill_id)
+                    continue
+                current = self._skills.get(skill_id)
+                if current is not None and current[0] == mtime_ns:
+                    skills[skill_id] = current
+                else:
+                    skills[skill_id] = (mtime_ns, self._load(skill_id, mtime_ns))
+                    changed.add(skill_id)
+
+            self._skills = skills
+            self._pending = pending
+            self._library_mtime = library_mtime
+            if changed or self._checked_at is None:
+                self._rebuild()
+            self._checked_at = time.monotonic()
+
+    def _rebuild(self):
+        skills = sorted((skill for _, skill in self._skills.values()), key=lambda x: x['name'])
+        postings: Dict[str, set] = {}
+        for skill in skills:
+            text = " ".join([skill["id"], skill["name"], skill["description"], " ".join(skill["tags"])])
+            for token in set(tokenize(text)):
+                postings.setdefault(token, set()).add(skill["id"])
+        self._index = (skills, postings, sorted(postings))
+
+    def skills(self) -> List[Dict[str, Any]]:
+        self.refresh()
+        return self._index[0]
+
+    def search(self, query: str) -> List[Dict[str, Any]]:
+        """Skills matching every query term as a token prefix, ordered by name"""
+        self.refresh()
+        skills, postings, vocabulary = self._index
+        matched = None
+        for term in tokenize(query):
+            ids = set()
+            start = bisect.bisect_left(vocabulary, term)
+            for token in itertools.islice(vocabulary, start, None):
+                if not token.startswith(term):
+                    break
+                ids |= postings[token]
+            matched = ids if matched is None else matched & ids
+            if not matched:
+                return []
+        if matched is None:
+            return skills
+        return [skill for skill in skills if skill["id"] in matched]
+
+
+skills_catalog = SkillsCatalog()
+
+
+def get_available_skills(query: Optional[str] = None):
+    """Get list of available automation skills, optionally filtered by a search query"""
+    if query:
+        return skills_catalog.search(query)
+    return skills_catalog.skills()
+
+
+# ============================================================================
+# WORKFLOW INDEX
+# ============================================================================
 
+WORKFLOW_INDEX_TTL = float(os.environ.get('WORKFLOW_INDEX_TTL', 2))
+WORKFLOW_CACHE_SIZE = int(os.environ.get('WORKFLOW_CACHE_SIZE', 128))
+
+
+class WorkflowIndex:
+    """Summaries of the workflow files in WORKFLOWS_DIR, kept current incrementally.
+
+    A refresh (at most every WORKFLOW_INDEX_TTL seconds) lists the directory
+    and stats each file; only files whose mtime or size changed are parsed
+    again. Parsed bodies are kept in an LRU cache validated against the
+    file's stat, so edits are picked up on the next read.
+    """
+
+    def __init__(self, ttl: float = WORKFLOW_INDEX_TTL, cache_size: int = WORKFLOW_CACHE_SIZE):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self._lock = threading.RLock()
+        self._entries: Dict[str, tuple] = {}  # id -> (mtime_ns, size, summary)
+        self._checked_at = None
+        self._directory = None
+        # (summaries, etag, serialized list response) swapped as one reference
+        self._listing = ([], "empty", json.dumps({"count": 0, "workflows": []}))
+        self._bodies = OrderedDict()  # id -> (mtime_ns, size, data)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def summarize(workflow_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": workflow_id,
+            "name": data.get("name", workflow_id),
+            "description": data.get("description", ""),
+            "steps": len(data.get("steps", [])),
+            "created": data.get("created", "unknown")
+        }
 
-def get_available_skills():
-    """Get list of available automation skills"""
-    skills = []
+    def _scan(self) -> Dict[str, tuple]:
+        files = {}
+        if not WORKFLOWS_DIR.exists():
+            return files
+        with os.scandir(WORKFLOWS_DIR) as entries:
+            for entry in entries:
+                if entry.name.endswith(".json") and entry.is_file():
+                    stat = entry.stat()
+                    files[entry.name[:-5]] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def _fresh(self) -> bool:
+        return (self._checked_at is not None and self._directory == WORKFLOWS_DIR
+                and time.monotonic() - self._checked_at < self.ttl)
+
+    def refresh(self, force: bool = False):
+        """Re-stat the directory and re-parse changed files"""
+        if not force and self._fresh():
+            return
+
+        with self._lock:
+            if not force and self._fresh():
+                return
+
+            if self._directory != WORKFLOWS_DIR:
+                self._entries = {}
+                self._bodies.clear()
+                self._directory = WORKFLOWS_DIR
+
+            files = self._scan()
+            changed = set(self._entries) - set(files)
+            for workflow_id in changed:
+                del self._entries[workflow_id]
+
+            for workflow_id, (mtime_ns, size) in files.items():
+                entry = self._entries.get(workflow_id)
+                if entry is not None and entry[:2] == (mtime_ns, size):
+                    continue
+                try:
+                    data = self._read(workflow_id, mtime_ns, size)
+                    self._entries[workflow_id] = (mtime_ns, size, self.summarize(workflow_id, data))
+                except Exception:
+                    self._entries.pop(workflow_id, None)
+                changed.add(workflow_id)
+
+            if changed or self._checked_at is None:
+                summaries = [self._entries[workflow_id][2] for workflow_id in sorted(self._entries)]
+                fingerprint = hashlib.sha1(json.dumps(
+                    [(workflow_id, entry[0], entry[1]) for workflow_id, entry in sorted(self._entries.items())]
+                ).encode()).hexdigest()
+                body = json.dumps({"count": len(summaries), "workflows": summaries}, sort_keys=True)
+                self._listing = (summaries, fingerprint[:20], body)
+            self._checked_at = time.monotonic()
+
+    def _read(self, workflow_id: str, mtime_ns: int, size: int) -> Dict[str, Any]:
+        with open(WORKFLOWS_DIR / f"{workflow_id}.json", 'r') as f:
+            data = json.load(f)
+        self._bodies[workflow_id] = (mtime_ns, size, data)
+        self._bodies.move_to_end(workflow_id)
+        while len(self._bodies) > self.cache_size:
+            self._bodies.popitem(last=False)
+        return data
+
+    def listing(self):
+        """Get (summaries, etag, response body) for the current directory contents"""
+        self.refresh()
+        return self._listing
+
+    def get(self, workflow_id: str) -> Optional[Dict[str, Any]]:
+        """Get a parsed workflow body (shared, do not mutate), None if missing"""
+        try:
+            stat = os.stat(WORKFLOWS_DIR / f"{workflow_id}.json")
+        except FileNotFoundError:
+            return None
 
-    if not SKILLS_LIBRARY.exists():
-        return skills
+        with self._lock:
+            cached = self._bodies.get(workflow_id)
+            if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                self._bodies.move_to_end(workflow_id)
+                self.hits += 1
+                return cached[2]
+            self.misses += 1
+            return self._read(workflow_id, stat.st_mtime_ns, stat.st_size)
 
-    for skill_dir in SKILLS_LIBRARY.iterdir():
-        if skill_dir.is_dir() and not skill_dir.name.startswith('.'):
-            skill_md = skill_dir / "SKILL.md"
-            if skill_md.exists():
-                skills.append({
-                    "id": skill_dir.name,
-                    "name": skill_dir.name.replace('-', ' ').title(),
-                    "location": str(skill_dir),
-                    "has_docs": True
-                })
 
-    return sorted(skills, key=lambda x: x['name'])
+workflow_index = WorkflowIndex()
 
 
 def get_workflows():
     """Get saved workflows"""
-    workflows = []
-
-    if not WORKFLOWS_DIR.exists():
-        return workflows
+    return workflow_index.listing()[0]
+
+
+def load_workflow(workflow_id: str) -> Optional[Dict[str, Any]]:
+    """Load a workflow definition, None if it does not exist"""
+    if not workflow_id or '/' in workflow_id or workflow_id.startswith('.'):
+        return None
+    return workflow_index.get(workflow_id)
+
+
+FALLBACK_AI_MODELS = [
+    {"id": "claude", "name": "Claude Sonnet", "provider": "Anthropic", "icon": "🎭", "contextWindow": "200k", "type": "text"},
+    {"id": "grok", "name": "Grok 2", "provider": "xAI", "icon": "🚀", "contextWindow": "128k", "type": "text"},
+    {"id": "gemini", "name": "Gemini Pro", "provider": "Google", "icon": "♊", "contextWindow": "1M", "type": "text"},
+    {"id": "chatgpt", "name": "ChatGPT 4", "provider": "OpenAI", "icon": "🤖", "contextWindow": "128k", "type": "text"},
+    {"id": "mistral", "name": "Mistral Large 3", "provider": "Mistral", "icon": "🇫🇷", "contextWindow": "256k", "type": "text"},
+    {"id": "kimi-k2", "name": "Kimi K2 Thinking", "provider": "Moonshot", "icon": "🌙", "contextWindow": "128k", "type": "text"},
+]
+
+
+def build_ai_models(config: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Turn the driver config into the model list, falling back when it is missing"""
+    if config is None:
+        return FALLBACK_AI_MODELS
+
+    models = []
+    for driver_id, driver_info in config.get("drivers", {}).items():
+        models.append({
+            "id": driver_id,
+            "name": driver_info.get("name", driver_id),
+            "provider": driver_info.get("name", "").split()[0] if driver_info.get("name") else "Unknown",
+            "icon": driver_info.get("icon", "🤖"),
+            "contextWindow": str(driver_info.get("context_window", "N/A")),
+            "type": "text"  # Can be enhanced later
+        })
+    return models
 
-    for workflow_file in WORKFLOWS_DIR.glob("*.json"):
-        try:
-            with open(workflow_file, 'r') as f:
-                workflow_data = json.load(f)
-                workflows.append({
-                    "id": workflow_file.stem,
-                    "name": workflow_data.get("name", workflow_file.stem),
-                    "description": workflow_data.get("description", ""),
-                    "steps": len(workflow_data.get("steps", [])),
-                    "created": workflow_data.get("created", "unknown")
-                })
-        except:
-            pass
 
-    return workflows
+ai_driver_config = ConfigFile(CONFIG_PATH / "ai_driver_config.json", build_ai_models)
 
 
 def get_ai_models():
     """Get available AI models from driver config"""
+    return ai_driver_config.get()
+
+
+# ============================================================================
+# WORKFLOW JOB ENGINE
+# ============================================================================
+
+WORKFLOW_WORKERS = int(os.environ.get('WORKFLOW_WORKERS', 4))
+STEP_WORKERS = int(os.environ.get('WORKFLOW_STEP_WORKERS', 8))
+JOBS_DB_PATH = Path(os.environ.get('JARVIS_JOBS_DB', DATA_DIR / "jobs.db"))
+STEP_CACHE_TTL = float(os.environ.get('STEP_CACHE_TTL', 7 * 86400))
+STEP_CACHE_MAX_ENTRIES = int(os.environ.get('STEP_CACHE_MAX_ENTRIES', 10000))
+JOB_STATES = ("queued", "running", "succeeded", "failed", "cancelled")
+ACTIVE_JOB_STATES = ("queued", "running")
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once cancellation has been requested"""
+
+    def __init__(self, result: Optional[Dict[str, Any]] = None):
+        super().__init__("Cancelled")
+        self.result = result
+
+
+class WorkflowFailed(Exception):
+    """A workflow step failed; carries the per-step records for resuming"""
+
+    def __init__(self, message: str, result: Dict[str, Any]):
+        super().__init__(message)
+        self.result = result
+
+
+def process_alive(pid: int) -> bool:
     try:
-        driver_config = CONFIG_PATH / "ai_driver_config.json"
-        if driver_config.exists():
-            with open(driver_config, 'r') as f:
-                config = json.load(f)
-                models = []
-
-                for driver_id, driver_info in config.get("drivers", {}).items():
-                    models.append({
-                        "id": driver_id,
-                        "name": driver_info.get("name", driver_id),
-                        "provider": driver_info.get("name", "").split()[0] if driver_info.get("name") else "Unknown",
-                        "icon": driver_info.get("icon", "🤖"),
-                        "contextWindow": str(driver_info.get("context_window", "N/A")),
-                        "type": "text"  # Can be enhanced later
-                    })
-
-                return models
-    except:
-        pass
+        return psutil.pid_exists(pid)
+    except Exception:
+        return False
+
+
+class JobTable:
+    """Persistent job records shared by all workers (SQLite, WAL mode).
+
+    A partial index over queued/running rows keeps active-job lookups
+    proportional to the number of active jobs.
+    """
+
+    COLUMNS = ("id", "workflow_id", "state", "priority", "progress", "message", "params",
+               "result", "error", "pid", "cancel_requested", "created_at", "started_at", "finished_at")
+    JSON_COLUMNS = ("params", "result")
+    PRUNE_EVERY = 100
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stores = 0
+        with self._conn() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    workflow_id TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    progress REAL NOT NULL DEFAULT 0,
+                    message TEXT,
+                    params TEXT,
+                    result TEXT,
+                    error TEXT,
+                    pid INTEGER,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS jobs_active ON jobs (priority DESC, created_at)
+                    WHERE state IN ('queued', 'running');
+                CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created_at DESC);
+                CREATE TABLE IF NOT EXISTS step_cache (
+                    key TEXT PRIMARY KEY, output TEXT NOT NULL, created_at REAL NOT NULL
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS step_cache_created ON step_cache (created_at);
+            """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _row_to_job(self, row) -> Dict[str, Any]:
+        job = dict(zip(self.COLUMNS, row))
+        for column in self.JSON_COLUMNS:
+            job[column] = json.loads(job[column]) if job[column] else None
+        for column in ("created_at", "started_at", "finished_at"):
+            if job[column]:
+                job[column] = datetime.fromtimestamp(job[column]).isoformat()
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def insert(self, job: Dict[str, Any]):
+        values = [json.dumps(job.get(c)) if c in self.JSON_COLUMNS else job.get(c) for c in self.COLUMNS]
+        self._conn().execute(
+            f"INSERT INTO jobs ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+            values
+        )
+
+    def update(self, job_id: str, expect_state: Optional[str] = None, **fields) -> bool:
+        """Update columns; with expect_state only if the job is still in that state"""
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        values = [json.dumps(v) if c in self.JSON_COLUMNS else v for c, v in fields.items()]
+        sql = f"UPDATE jobs SET {assignments} WHERE id = ?"
+        values.append(job_id)
+        if expect_state is not None:
+            sql += " AND state = ?"
+            values.append(expect_state)
+        return self._conn().execute(sql, values).rowcount > 0
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def cancel_requested(self, job_id: str) -> bool:
+        row = self._conn().execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def active(self) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM jobs INDEXED BY jobs_active "
+            "WHERE state IN ('queued', 'running') ORDER BY priority DESC, created_at"
+        ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def cached_output(self, key: str) -> Optional[Any]:
+        row = self._conn().execute(
+            "SELECT output FROM step_cache WHERE key = ? AND created_at >= ?", (key, time.time() - STEP_CACHE_TTL)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def store_output(self, key: str, output: Any):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO step_cache (key, output, created_at) VALUES (?, ?, ?)",
+            (key, json.dumps(output), time.time())
+        )
+        with self._lock:
+            self._stores += 1
+            prune = self._stores % self.PRUNE_EVERY == 0
+        if prune:
+            self.prune_outputs()
+
+    def prune_outputs(self):
+        """Drop expired step outputs, then the oldest beyond STEP_CACHE_MAX_ENTRIES"""
+        conn = self._conn()
+        conn.execute("DELETE FROM step_cache WHERE created_at < ?", (time.time() - STEP_CACHE_TTL,))
+        conn.execute(
+            "DELETE FROM step_cache WHERE key IN (SELECT key FROM step_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (STEP_CACHE_MAX_ENTRIES,)
+        )
+
+    def recent(self, limit: int = 20) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+
+class JobEngine:
+    """Runs workflows on a bounded pool of worker threads, highest priority first.
+
+    Jobs are persisted in the JobTable before they are queued, so HTTP
+    handlers only enqueue and return. Progress is broadcast on the
+    ``JARVIS.workflow`` topic. Jobs orphaned by a dead worker are re-queued
+    (or failed, if they were already running) by the next engine to start.
+    """
+
+    def __init__(self, table: JobTable, workers: int = WORKFLOW_WORKERS):
+        self.table = table
+        self.workers = workers
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._cancel_events: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        if self._threads:
+            return
+        self._recover_orphans()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"workflow-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _recover_orphans(self):
+        for job in self.table.active():
+            if job["pid"] == os.getpid() or process_alive(job["pid"]):
+                continue
+            if job["state"] == "queued":
+                # Claim it only if no other worker got there first
+                if self.table.update(job["id"], expect_state="queued", pid=os.getpid()):
+                    self._enqueue(job["id"], job["priority"])
+            else:
+                self.table.update(job["id"], expect_state="running", state="failed",
+                                  error="Interrupted by worker restart", finished_at=time.time())
+
+    def _enqueue(self, job_id: str, priority: int):
+        with self._lock:
+            self._cancel_events[job_id] = threading.Event()
+        self._queue.put((-priority, next(self._sequence), job_id))
+
+    def submit(self, workflow_id: str, params: Optional[Dict[str, Any]] = None, priority: int = 0) -> Dict[str, Any]:
+        """Persist and queue a workflow run"""
+        job_id = f"job_{uuid.uuid4().hex[:12]}"
+        self.table.insert({
+            "id": job_id,
+            "workflow_id": workflow_id,
+            "state": "queued",
+            "priority": priority,
+            "progress": 0.0,
+            "message": "Queued",
+            "params": params or {},
+            "pid": os.getpid(),
+            "cancel_requested": 0,
+            "created_at": time.time()
+        })
+        self._enqueue(job_id, priority)
+        self._announce(job_id, workflow_id, f"Queued workflow: {workflow_id}")
+        return self.table.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a queued job immediately or ask a running one to stop"""
+        job = self.table.get(job_id)
+        if job is None:
+            return None
+        if job["state"] in ACTIVE_JOB_STATES:
+            self.table.update(job_id, cancel_requested=1)
+            if self.table.update(job_id, expect_state="queued", state="cancelled",
+                                 message="Cancelled", finished_at=time.time()):
+                self._announce(job_id, job["workflow_id"], f"Cancelled workflow: {job['workflow_id']}", "warning")
+            event = self._cancel_events.get(job_id)
+            if event is not None:
+                event.set()
+        return self.table.get(job_id)
+
+    def check_cancelled(self, job_id: str):
+        """Raise JobCancelled if cancellation was requested from any worker"""
+        event = self._cancel_events.get(job_id)
+        if (event is not None and event.is_set()) or self.table.cancel_requested(job_id):
+            raise JobCancelled()
+
+    def report(self, job_id: str, workflow_id: str, progress: float, message: str):
+        self.table.update(job_id, progress=round(progress, 3), message=message)
+        self._announce(job_id, workflow_id, message, progress=progress)
+
+    def _announce(self, job_id: str, workflow_id: str, message: str, level: str = "info", **extra):
+        broadcast_message({
+            "id": f"workflow_{workflow_id}_{int(time.time() * 1000)}",
+            "timestamp": datetime.now().isoformat(),
+            "source": "JARVIS",
+            "message": message,
+            "level": level,
+            "job_id": job_id,
+            "workflow_id": workflow_id,
+            **extra
+        }, topic="JARVIS.workflow")
+
+    def _work(self):
+        while True:
+            _, _, job_id = self._queue.get()
+            try:
+                self._run(job_id)
+            except Exception as e:
+                print(f"Job {job_id} crashed: {e}")
+            finally:
+                with self._lock:
+                    self._cancel_events.pop(job_id, None)
+
+    def _run(self, job_id: str):
+        if not self.table.update(job_id, expect_state="queued", state="running",
+                                 started_at=time.time(), message="Running"):
+            return  # Cancelled while queued
+
+        job = self.table.get(job_id)
+        workflow_id = job["workflow_id"]
+        self._announce(job_id, workflow_id, f"Starting workflow: {workflow_id}")
+
+        try:
+            workflow = load_workflow(workflow_id)
+            if workflow is None:
+                raise FileNotFoundError(f"Workflow not found: {workflow_id}")
+            result = run_workflow(self, job, workflow)
+        except JobCancelled as e:
+            self.table.update(job_id, state="cancelled", message="Cancelled", result=e.result,
+                              finished_at=time.time())
+            self._announce(job_id, workflow_id, f"Cancelled workflow: {workflow_id}", "warning")
+        except WorkflowFailed as e:
+            self.table.update(job_id, state="failed", error=str(e), message="Failed", result=e.result,
+                              finished_at=time.time())
+            self._announce(job_id, workflow_id, f"Workflow failed: {workflow_id}: {e}", "error")
+        except Exception as e:
+            self.table.update(job_id, state="failed", error=str(e), message="Failed", finished_at=time.time())
+            self._announce(job_id, workflow_id, f"Workflow failed: {workflow_id}: {e}", "error")
+        else:
+            self.table.update(job_id, state="succeeded", progress=1.0, result=result,
+                              message="Completed", finished_at=time.time())
+            self._announce(job_id, workflow_id, f"Workflow completed: {workflow_id}", "success", progress=1.0)
+
+
+def step_log(engine: JobEngine, job: Dict[str, Any], step: Dict[str, Any], inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """Broadcast a step's message"""
+    message = step.get("message") or step.get("name", "")
+    engine._announce(job["id"], job["workflow_id"], message)
+    return {"message": message}
+
+
+def step_wait(engine: JobEngine, job: Dict[str, Any], step: Dict[str, Any], inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """Sleep for step["seconds"], checking for cancellation"""
+    deadline = time.monotonic() + min(float(step.get("seconds", 1)), 3600)
+    while time.monotonic() < deadline:
+        engine.check_cancelled(job["id"])
+        time.sleep(min(0.5, max(0.0, deadline - time.monotonic())))
+    return {"waited": step.get("seconds", 1)}
+
+
+# Step type -> handler(engine, job, step, inputs) where inputs maps dependency ids to their outputs;
+# steps of other types are recorded as skipped
+STEP_HANDLERS = {
+    "log": step_log,
+    "wait": step_wait,
+}
+# Step types whose handlers are pure (output depends only on the step and its inputs, no side effects),
+# so a fresh run reuses their cached outputs by default. log broadcasts and wait sleeps, so neither
+# is; a step of any type can still opt in (or out) with "cache": true/false.
+CACHEABLE_STEP_TYPES = frozenset()
+
+step_executor = ThreadPoolExecutor(max_workers=STEP_WORKERS, thread_name_prefix="workflow-step")
+
+
+def parse_workflow_graph(steps: List[Any]) -> Dict[str, Dict[str, Any]]:
+    """Build {step_id: {"step", "deps", "index"}} from a workflow's steps array.
+
+    A step runs after the ids in its ``depends_on`` list; without that key it
+    depends on the step before it, so plain step lists stay sequential.
+    Raises ValueError for unknown dependencies or cycles.
+    """
+    graph: Dict[str, Dict[str, Any]] = {}
+    previous = None
+    for i, step in enumerate(steps):
+        if not isinstance(step, dict):
+            step = {"name": str(step)}
+        step_id = str(step.get("id") or step.get("name") or f"step_{i + 1}")
+        if step_id in graph:
+            step_id = f"{step_id}_{i + 1}"
+        if "depends_on" in step:
+            deps = step["depends_on"]
+            deps = [deps] if isinstance(deps, str) else list(deps or [])
+        else:
+            deps = [previous] if previous else []
+        graph[step_id] = {"step": step, "deps": [str(dep) for dep in deps], "index": i}
+        previous = step_id
+
+    for step_id, node in graph.items():
+        unknown = [dep for dep in node["deps"] if dep not in graph]
+        if unknown:
+            raise ValueError(f"Step {step_id!r} depends on unknown steps: {unknown}")
+
+    topological_order(graph)
+    return graph
+
+
+def topological_order(graph: Dict[str, Dict[str, Any]]) -> List[str]:
+    """Kahn's algorithm over the step graph; raises ValueError on cycles"""
+    remaining = {step_id: len(node["deps"]) for step_id, node in graph.items()}
+    dependents = {step_id: [] for step_id in graph}
+    for step_id, node in graph.items():
+        for dep in node["deps"]:
+            dependents[dep].append(step_id)
+
+    ready = deque(step_id for step_id, count in remaining.items() if count == 0)
+    order = []
+    while ready:
+        step_id = ready.popleft()
+        order.append(step_id)
+        for dependent in dependents[step_id]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                ready.append(dependent)
+
+    if len(order) != len(graph):
+        raise ValueError(f"Workflow steps contain a cycle: {sorted(set(graph) - set(order))}")
+    return order
+
+
+def critical_path(graph: Dict[str, Dict[str, Any]], records: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Longest chain of dependent steps by measured duration"""
+    finish: Dict[str, float] = {}
+    via: Dict[str, Optional[str]] = {}
+    for step_id in topological_order(graph):
+        deps = graph[step_id]["deps"]
+        parent = max(deps, key=lambda dep: finish[dep]) if deps else None
+        via[step_id] = parent
+        finish[step_id] = (finish[parent] if parent else 0.0) + records.get(step_id, {}).get("duration_ms", 0.0)
+
+    if not finish:
+        return {"steps": [], "duration_ms": 0.0}
+    step_id = max(finish, key=finish.get)
+    total = finish[step_id]
+    path = []
+    while step_id:
+        path.append(step_id)
+        step_id = via[step_id]
+    return {"steps": path[::-1], "duration_ms": round(total, 3)}
+
+
+def step_cache_key(step: Dict[str, Any], dep_keys: List[str]) -> str:
+    """Content hash of a step definition and the hashes of its inputs"""
+    material = json.dumps({"step": step, "inputs": dep_keys}, sort_keys=True, default=str)
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def run_workflow(engine: JobEngine, job: Dict[str, Any], workflow: Dict[str, Any]) -> Dict[str, Any]:
+    """Run a workflow's step graph, independent steps in parallel.
+
+    Outputs of cacheable steps are stored by content hash, so a re-run only
+    executes changed steps and their dependents. Pure step types
+    (CACHEABLE_STEP_TYPES) are cached unless a step sets ``"cache": false``;
+    any other step opts in with ``"cache": true`` when skipping its side
+    effects on an unchanged re-run is acceptable. ``params.resume_from``
+    reuses the successful steps of an earlier job of the same workflow,
+    whatever their type. Each step record carries its timing, and the
+    result includes the critical path.
+    """
+    graph = parse_workflow_graph(workflow.get("steps", []))
+    params = job.get("params") or {}
+
+    resumed: Dict[str, Dict[str, Any]] = {}
+    if params.get("resume_from"):
+        previous = engine.table.get(params["resume_from"])
+        if previous and previous["workflow_id"] == job["workflow_id"] and previous.get("result"):
+            resumed = {
+                step_id: record for step_id, record in previous["result"].get("steps", {}).items()
+                if record.get("status") in ("succeeded", "cached", "resumed")
+            }
+
+    records: Dict[str, Dict[str, Any]] = {}
+    outputs: Dict[str, Any] = {}
+    keys: Dict[str, str] = {}
+    remaining = {step_id: len(node["deps"]) for step_id, node in graph.items()}
+    dependents = {step_id: [] for step_id in graph}
+    for step_id, node in graph.items():
+        for dep in node["deps"]:
+            dependents[dep].append(step_id)
+
+    started = time.perf_counter()
+
+    def execute(step_id: str):
+        node = graph[step_id]
+        step = node["step"]
+        inputs = {dep: outputs.get(dep) for dep in node["deps"]}
+        key = keys[step_id]
+        step_started = time.perf_counter()
+        record = {"name": step.get("name", step_id), "started_ms": round((step_started - started) * 1000, 3)}
+
+        previous = resumed.get(step_id)
+        cacheable = bool(step.get("cache", step.get("type") in CACHEABLE_STEP_TYPES))
+        cached = engine.table.cached_output(key) if cacheable else None
+        handler = STEP_HANDLERS.get(step.get("type"))
+        if previous is not None and previous.get("key") == key:
+            record.update(status="resumed", output=previous.get("output"))
+        elif cached is not None:
+            record.update(status="cached", output=cached)
+        elif handler is None:
+            record.update(status="skipped", output=None, reason=f"no handler for type {step.get('type')!r}")
+        else:
+            output = handler(engine, job, step, inputs)
+            record.update(status="succeeded", output=output)
+            if cacheable:
+                engine.table.store_output(key, output)
+
+        record["duration_ms"] = round((time.perf_counter() - step_started) * 1000, 3)
+        return record
+
+    def result():
+        for step_id in graph:
+            records.setdefault(step_id, {"name": graph[step_id]["step"].get("name", step_id), "status": "pending"})
+            records[step_id]["depends_on"] = graph[step_id]["deps"]
+        return {
+            "steps": records,
+            "wall_ms": round((time.perf_counter() - started) * 1000, 3),
+            "critical_path": critical_path(graph, records)
+        }
+
+    running = {}
+    failure = None
+
+    def schedule(step_id: str):
+        keys[step_id] = step_cache_key(graph[step_id]["step"], [keys[dep] for dep in graph[step_id]["deps"]])
+        running[step_executor.submit(execute, step_id)] = step_id
+
+    try:
+        for step_id, count in remaining.items():
+            if count == 0:
+                schedule(step_id)
+
+        while running:
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                step_id = running.pop(future)
+                try:
+                    records[step_id] = future.result()
+                except JobCancelled:
+                    failure = failure or JobCancelled()
+                    records[step_id] = {"name": step_id, "status": "cancelled"}
+                    continue
+                except Exception as e:
+                    failure = failure or WorkflowFailed(f"Step {step_id!r} failed: {e}", {})
+                    records[step_id] = {"name": graph[step_id]["step"].get("name", step_id),
+                                        "status": "failed", "error": str(e)}
+                    continue
+
+                outputs[step_id] = records[step_id]["output"]
+                records[step_id]["key"] = keys[step_id]
+                engine.report(job["id"], job["workflow_id"], len(outputs) / len(graph),
+                              f"Completed {records[step_id]['name']} ({records[step_id]['status']})")
+
+                if failure is None:
+                    engine.check_cancelled(job["id"])
+                    for dependent in dependents[step_id]:
+                        remaining[dependent] -= 1
+                        if remaining[dependent] == 0:
+                            schedule(dependent)
+    except JobCancelled:
+        failure = JobCancelled()
+        wait(list(running))
+        for future, step_id in running.items():
+            if future.exception() is None:
+                records[step_id] = dict(future.result(), key=keys[step_id])
+            else:
+                records[step_id] = {"name": step_id, "status": "cancelled"}
+
+    if failure is not None:
+        failure.result = result()
+        raise failure
+    return result()
+
+
+job_engine = JobEngine(JobTable(JOBS_DB_PATH))
+
+
+# ============================================================================
+# LLM PROVIDER CLIENTS
+# ============================================================================
+
+PROVIDER_TIMEOUT = float(os.environ.get('PROVIDER_TIMEOUT', 60))
+PROVIDER_MAX_CONNECTIONS = int(os.environ.get('PROVIDER_MAX_CONNECTIONS', 8))
+
+
+class ProviderError(Exception):
+    """An upstream provider call failed"""
+
+    def __init__(self, provider: str, message: str, status: Optional[int] = None, retryable: bool = False):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.status = status
+        self.retryable = retryable
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections to one host, at most ``max_connections`` at a time.
+
+    Idle connections are reused LIFO; a reused connection that the server
+    already closed is replaced once, transparently.
+    """
+
+    def __init__(self, base_url: str, max_connections: int = PROVIDER_MAX_CONNECTIONS,
+                 timeout: float = PROVIDER_TIMEOUT):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._idle = deque()
+        self.opened = 0
+        self.reused = 0
+        self.in_use = 0
+
+    def _connect(self) -> http.client.HTTPConnection:
+        self.opened += 1
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _checkout(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"no free connection to {self.host} within {self.timeout}s")
+        self.in_use += 1
+        try:
+            conn = self._idle.pop()
+        except IndexError:
+            return self._connect(), False
+        self.reused += 1
+        return conn, True
+
+    def _checkin(self, conn: http.client.HTTPConnection, reusable: bool):
+        if reusable:
+            self._idle.append(conn)
+        else:
+            conn.close()
+        self.in_use -= 1
+        self._slots.release()
+
+    def open(self, method: str, path: str, body: Optional[bytes] = None,
+             headers: Optional[Dict[str, str]] = None):
+        """Send a request and return (connection, response) with the body unread.
+
+        The caller must hand the connection back through ``release()``.
+        """
+        conn, reused = self._checkout()
+        try:
+            try:
+                conn.request(method, self.base_path + path, body=body, headers=headers or {})
+                response = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if not reused:
+                    raise
+                # The server dropped an idle keep-alive connection; retry once on a fresh one
+                conn.close()
+                conn = self._connect()
+                conn.request(method, self.base_path + path, body=body, headers=headers or {})
+                response = conn.getresponse()
+        except BaseException:
+            self._checkin(conn, False)
+            raise
+        return conn, response
+
+    def release(self, conn: http.client.HTTPConnection, response: http.client.HTTPResponse):
+        self._checkin(conn, response.isclosed() and not response.will_close)
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None):
+        """Send a request and return (status, body bytes)"""
+        conn, response = self.open(method, path, body, headers)
+        try:
+            data = response.read()
+        finally:
+            self.release(conn, response)
+        return response.status, data
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "host": self.host,
+            "max_connections": self.max_connections,
+            "idle": len(self._idle),
+            "in_use": self.in_use,
+            "opened": self.opened,
+            "reused": self.reused
+        }
+
+
+def iter_sse(response: http.client.HTTPResponse):
+    """Yield (event, data) pairs from a Server-Sent Events response"""
+    event, data = None, []
+    while True:
+        line = response.readline()
+        if not line:
+            break
+        line = line.decode('utf-8', errors='replace').rstrip('\r\n')
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = None, []
+        elif line.startswith('event:'):
+            event = line[6:].strip()
+        elif line.startswith('data:'):
+            data.append(line[5:].lstrip())
+    if data:
+        yield event, "\n".join(data)
+
+
+class ChatProvider:
+    """Base class for a text-generation provider with one pooled client per worker"""
+
+    name = ""
+    label = ""
+    key_env = ""
+    default_base_url = ""
+    default_model = ""
+    # USD per 1K (input, output) tokens for the default model
+    pricing = (0.0, 0.0)
+
+    def __init__(self):
+        self.api_key = os.environ.get(self.key_env, '')
+        self.base_url = os.environ.get(f"{self.name.upper()}_BASE_URL", self.default_base_url)
+        self.pool = ConnectionPool(self.base_url)
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    def cost(self, input_tokens: int, output_tokens: int) -> float:
+        return (input_tokens / 1000 * self.pricing[0]) + (output_tokens / 1000 * self.pricing[1])
+
+    def _post(self, path: str, payload: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+        headers = dict(headers, **{"Content-Type": "application/json"})
+        try:
+            status, data = self.pool.request("POST", path, json.dumps(payload).encode(), headers)
+        except (OSError, http.client.HTTPException) as e:
+            raise ProviderError(self.name, f"connection failed: {e}", retryable=True) from e
+        if status >= 400:
+            raise ProviderError(self.name, f"HTTP {status}: {data[:500].decode(errors='replace')}",
+                                status=status, retryable=status == 429 or status >= 500)
+        return json.loads(data)
+
+    def _stream(self, path: str, payload: Dict[str, Any], headers: Dict[str, str]):
+        """POST a streaming request and yield its SSE (event, data) pairs"""
+        headers = dict(headers, **{"Content-Type": "application/json", "Accept": "text/event-stream"})
+        try:
+            conn, response = self.pool.open("POST", path, json.dumps(payload).encode(), headers)
+        except (OSError, http.client.HTTPException) as e:
+            raise ProviderError(self.name, f"connection failed: {e}", retryable=True) from e
+        try:
+            if response.status >= 400:
+                body = response.read()
+                raise ProviderError(self.name, f"HTTP {response.status}: {body[:500].decode(errors='replace')}",
+                                    status=response.status, retryable=response.status == 429 or response.status >= 500)
+            yield from iter_sse(response)
+        except (OSError, http.client.HTTPException) as e:
+            raise ProviderError(self.name, f"stream interrupted: {e}", retryable=True) from e
+        finally:
+            self.pool.release(conn, response)
+
+    def _headers(self) -> Dict[str, str]:
+        raise NotImplementedError
+
+    def chat_request(self, system_prompt: str, prompt: str, model: Optional[str], temperature: float,
+                     max_tokens: int, stream: bool = False) -> tuple:
+        """(path, payload, model name) of a completion request"""
+        raise NotImplementedError
+
+    def parse_chat(self, response: Dict[str, Any], model: str) -> Dict[str, Any]:
+        """Text, model and token usage of a completion response"""
+        raise NotImplementedError
+
+    def parse_stream_event(self, usage: Dict[str, Any], event: Optional[str], data: str) -> List[Dict[str, Any]]:
+        """Text chunks of one SSE event; model and token counts are collected into ``usage``"""
+        raise NotImplementedError
+
+    def chat(self, system_prompt: str, prompt: str, model: Optional[str] = None,
+             temperature: float = 0.7, max_tokens: int = 1500) -> Dict[str, Any]:
+        """Generate a completion; returns text, model and token usage"""
+        path, payload, model = self.chat_request(system_prompt, prompt, model, temperature, max_tokens)
+        return self.parse_chat(self._post(path, payload, self._headers()), model)
+
+    def stream_chat(self, system_prompt: str, prompt: str, model: Optional[str] = None,
+                    temperature: float = 0.7, max_tokens: int = 1500):
+        """Yield {"text": delta} chunks, then one {"usage": {...}, "model": ...} item"""
+        path, payload, model = self.chat_request(system_prompt, prompt, model, temperature, max_tokens, stream=True)
+        usage = {"model": model, "input_tokens": 0, "output_tokens": 0}
+        for event, data in self._stream(path, payload, self._headers()):
+            yield from self.parse_stream_event(usage, event, data)
+        yield {"model": usage.pop("model"), "usage": usage}
+
+
+class OpenAICompatibleProvider(ChatProvider):
+    """Providers speaking the OpenAI chat completions API"""
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    def _payload(self, system_prompt, prompt, model, temperature, max_tokens) -> Dict[str, Any]:
+        return {
+            "model": model or self.default_model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+
+    def chat_request(self, system_prompt, prompt, model, temperature, max_tokens, stream=False):
+        payload = self._payload(system_prompt, prompt, model, temperature, max_tokens)
+        if stream:
+            payload.update(stream=True, stream_options={"include_usage": True})
+        return "/chat/completions", payload, payload["model"]
+
+    def parse_chat(self, response, model):
+        usage = response.get("usage") or {}
+        return {
+            "text": response["choices"][0]["message"]["content"],
+            "model": response.get("model", model),
+            "input_tokens": usage.get("prompt_tokens", 0),
+            "output_tokens": usage.get("completion_tokens", 0)
+        }
+
+    def parse_stream_event(self, usage, event, data):
+        if data == "[DONE]":
+            # The caller keeps reading to the end of the body so the connection can be reused
+            return []
+        chunk = json.loads(data)
+        usage["model"] = chunk.get("model", usage["model"])
+        if chunk.get("usage"):
+            usage["input_tokens"] = chunk["usage"].get("prompt_tokens", 0)
+            usage["output_tokens"] = chunk["usage"].get("completion_tokens", 0)
+        texts = ((choice.get("delta") or {}).get("content") for choice in chunk.get("choices") or [])
+        return [{"text": text} for text in texts if text]
+
+
+class OpenAIProvider(OpenAICompatibleProvider):
+    name = "openai"
+    label = "OpenAI"
+    key_env = "OPENAI_API_KEY"
+    default_base_url = "https://api.openai.com/v1"
+    default_model = "gpt-4"
+    pricing = (0.03, 0.06)
+
+
+class MistralProvider(OpenAICompatibleProvider):
+    name = "mistral"
+    label = "Mistral"
+    key_env = "MISTRAL_API_KEY"
+    default_base_url = "https://api.mistral.ai/v1"
+    default_model = "mistral-large-latest"
+    pricing = (0.002, 0.006)
+
+
+class XAIProvider(OpenAICompatibleProvider):
+    name = "xai"
+    label = "xAI"
+    key_env = "XAI_API_KEY"
+    default_base_url = "https://api.x.ai/v1"
+    default_model = "grok-2-latest"
+    pricing = (0.002, 0.01)
+
+
+class AnthropicProvider(ChatProvider):
+    name = "anthropic"
+    label = "Anthropic"
+    key_env = "ANTHROPIC_API_KEY"
+    default_base_url = "https://api.anthropic.com"
+    default_model = "claude-3-5-sonnet-latest"
+    pricing = (0.003, 0.015)
+
+    def _headers(self) -> Dict[str, str]:
+        return {"x-api-key": self.api_key, "anthropic-version": "2023-06-01"}
+
+    def _payload(self, system_prompt, prompt, model, temperature, max_tokens) -> Dict[str, Any]:
+        return {
+            "model": model or self.default_model,
+            "system": system_prompt,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+
+    def chat_request(self, system_prompt, prompt, model, temperature, max_tokens, stream=False):
+        payload = self._payload(system_prompt, prompt, model, temperature, max_tokens)
+        if stream:
+            payload["stream"] = True
+        return "/v1/messages", payload, payload["model"]
+
+    def parse_chat(self, response, model):
+        usage = response.get("usage") or {}
+        return {
+            "text": "".join(block.get("text", "") for block in response.get("content", [])),
+            "model": response.get("model", model),
+            "input_tokens": usage.get("input_tokens", 0),
+            "output_tokens": usage.get("output_tokens", 0)
+        }
+
+    def parse_stream_event(self, usage, event, data):
+        chunk = json.loads(data)
+        kind = chunk.get("type", event)
+        if kind == "message_start":
+            message = chunk.get("message") or {}
+            usage["model"] = message.get("model", usage["model"])
+            usage["input_tokens"] = (message.get("usage") or {}).get("input_tokens", 0)
+        elif kind == "content_block_delta":
+            text = (chunk.get("delta") or {}).get("text")
+            if text:
+                return [{"text": text}]
+        elif kind == "message_delta":
+            usage["output_tokens"] = (chunk.get("usage") or {}).get("output_tokens", usage["output_tokens"])
+        elif kind == "error":
+            raise ProviderError(self.name, str(chunk.get("error")), retryable=True)
+        return []
+
+
+class GeminiProvider(ChatProvider):
+    name = "gemini"
+    label = "Google"
+    key_env = "GOOGLE_AI_STUDIO_API_KEY"
+    default_base_url = "https://generativelanguage.googleapis.com"
+    default_model = "gemini-1.5-pro"
+    pricing = (0.00125, 0.005)
+
+    def _headers(self) -> Dict[str, str]:
+        return {"x-goog-api-key": self.api_key}
+
+    def _payload(self, system_prompt, prompt, temperature, max_tokens) -> Dict[str, Any]:
+        return {
+            "systemInstruction": {"parts": [{"text": system_prompt}]},
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": {"temperature": temperature, "maxOutputTokens": max_tokens}
+        }
+
+    def chat_request(self, system_prompt, prompt, model, temperature, max_tokens, stream=False):
+        model = model or self.default_model
+        method = "streamGenerateContent?alt=sse" if stream else "generateContent"
+        return (f"/v1beta/models/{model}:{method}",
+                self._payload(system_prompt, prompt, temperature, max_tokens), model)
+
+    def parse_chat(self, response, model):
+        candidates = response.get("candidates") or [{}]
+        parts = (candidates[0].get("content") or {}).get("parts", [])
+        usage = response.get("usageMetadata") or {}
+        return {
+            "text": "".join(part.get("text", "") for part in parts),
+            "model": model,
+            "input_tokens": usage.get("promptTokenCount", 0),
+            "output_tokens": usage.get("candidatesTokenCount", 0)
+        }
+
+    def parse_stream_event(self, usage, event, data):
+        chunk = json.loads(data)
+        if chunk.get("usageMetadata"):
+            usage["input_tokens"] = chunk["usageMetadata"].get("promptTokenCount", 0)
+            usage["output_tokens"] = chunk["usageMetadata"].get("candidatesTokenCount", 0)
+        return [
+            {"text": part["text"]}
+            for candidate in chunk.get("candidates") or []
+            for part in (candidate.get("content") or {}).get("parts", [])
+            if part.get("text")
+        ]
+
+
+PROVIDER_CLASSES = {
+    provider.name: provider
+    for provider in (OpenAIProvider, AnthropicProvider, GeminiProvider, MistralProvider, XAIProvider)
+}
+
+
+class ProviderRegistry:
+    """One lazily created, keep-alive client per provider per worker process.
+
+    Clients are dropped if the process forks, so workers never share sockets
+    inherited from a parent.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._providers: Dict[str, ChatProvider] = {}
+        self._pid = os.getpid()
+
+    def get(self, name: str) -> ChatProvider:
+        if self._pid != os.getpid():
+            with self._lock:
+                self._providers, self._pid = {}, os.getpid()
+        provider = self._providers.get(name)
+        if provider is None:
+            if name not in PROVIDER_CLASSES:
+                raise KeyError(f"Unknown provider: {name}")
+            with self._lock:
+                provider = self._providers.get(name)
+                if provider is None:
+                    provider = self._providers[name] = PROVIDER_CLASSES[name]()
+        return provider
+
+    def configured(self, name: str) -> bool:
+        return bool(os.environ.get(PROVIDER_CLASSES[name].key_env))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            name: {
+                "label": provider_class.label,
+                "configured": self.configured(name),
+                "pool": self._providers[name].pool.stats() if name in self._providers else None
+            }
+            for name, provider_class in PROVIDER_CLASSES.items()
+        }
+
+
+provider_registry = ProviderRegistry()
+
+
+# ============================================================================
+# GENERATION CACHE
+# ============================================================================
+
+GENERATION_CACHE_SIZE = int(os.environ.get('GENERATION_CACHE_SIZE', 512))
+GENERATION_CACHE_TTL = float(os.environ.get('GENERATION_CACHE_TTL', 24 * 3600))
+GENERATION_CACHE_BACKEND = os.environ.get('GENERATION_CACHE_BACKEND', 'memory')  # memory | sqlite
+GENERATION_CACHE_DB_PATH = Path(os.environ.get('JARVIS_GENERATION_CACHE_DB', DATA_DIR / "generations.db"))
+
+
+def generation_cache_key(model: str, system_prompt: str, prompt: str,
+                         temperature: float, max_tokens: int) -> str:
+    """Hash a generation request; whitespace-only differences map to the same key"""
+    normalized = [model, " ".join(system_prompt.split()), " ".join(prompt.split()),
+                  round(float(temperature), 2), int(max_tokens)]
+    return hashlib.sha256(json.dumps(normalized).encode()).hexdigest()
+
+
+def generation_cacheable(routing: Dict[str, Any]) -> bool:
+    """Whether a routed answer may be cached under its requested model's key.
+
+    Keys are built from the requested model before routing, so an answer
+    from another provider (failover, a won hedge, an unhealthy primary
+    skipped) is not that model's result and is not cached.
+    """
+    primary = MODEL_PROVIDERS.get(routing["requested_model"])
+    return primary is None or routing["provider"] == primary[0]
+
+
+class GenerationCache:
+    """LRU + TTL cache of generated content, optionally backed by SQLite.
+
+    The in-memory tier is per worker; the SQLite tier is shared by all
+    workers and promotes entries into memory on a hit. Hit/miss counts and
+    the dollars saved go to the shared state store.
+    """
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, max_entries: int = GENERATION_CACHE_SIZE, ttl: float = GENERATION_CACHE_TTL,
+                 path: Optional[Path] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = Path(path) if path else None
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._local = threading.local()
+        self._puts = 0
+        if self.path:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn().execute(
+                "CREATE TABLE IF NOT EXISTS generations ("
+                "key TEXT PRIMARY KEY, entry TEXT NOT NULL, created_at REAL NOT NULL) WITHOUT ROWID"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get a fresh entry and count the hit or miss"""
+        entry = self.peek(key)
+        if entry is None:
+            state.incr("generation_cache.misses")
+            return None
+        state.incr("generation_cache.hits")
+        state.incr("generation_cache.saved", entry["cost"])
+        return entry
+
+    def peek(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get a fresh entry without counting it"""
+        expires_before = time.time() - self.ttl
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry["created_at"] >= expires_before:
+                    self._entries.move_to_end(key)
+                    return entry
+                del self._entries[key]
+        if not self.path:
+            return None
+        row = self._conn().execute(
+            "SELECT entry FROM generations WHERE key = ? AND created_at >= ?", (key, expires_before)
+        ).fetchone()
+        if row is None:
+            return None
+        entry = json.loads(row[0])
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, text: str, model: str, input_tokens: int, output_tokens: int, cost: float):
+        entry = {
+            "text": text,
+            "model": model,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cost": cost,
+            "created_at": time.time()
+        }
+        self._remember(key, entry)
+        if self.path:
+            conn = self._conn()
+            conn.execute("INSERT OR REPLACE INTO generations (key, entry, created_at) VALUES (?, ?, ?)",
+                         (key, json.dumps(entry), entry["created_at"]))
+            self._puts += 1
+            if self._puts % self.PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM generations WHERE created_at < ?", (time.time() - self.ttl,))
+
+    def stats(self) -> Dict[str, Any]:
+        counters = state.get_many(["generation_cache.hits", "generation_cache.misses", "generation_cache.saved"])
+        hits, misses = int(counters["generation_cache.hits"]), int(counters["generation_cache.misses"])
+        return {
+            "backend": "sqlite" if self.path else "memory",
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "dollars_saved": round(counters["generation_cache.saved"], 4)
+        }
+
+
+generation_cache = GenerationCache(
+    path=GENERATION_CACHE_DB_PATH if GENERATION_CACHE_BACKEND == 'sqlite' else None
+)
+
+
+# ============================================================================
+# REQUEST COALESCING
+# ============================================================================
+
+SINGLE_FLIGHT_SCOPE = os.environ.get('SINGLE_FLIGHT_SCOPE', 'worker')  # worker | host
+SINGLE_FLIGHT_DIR = DATA_DIR / "flights"
+SINGLE_FLIGHT_LOCK_TIMEOUT = float(os.environ.get('SINGLE_FLIGHT_LOCK_TIMEOUT', PROVIDER_TIMEOUT))
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Run one call per key at a time; concurrent callers share its result.
+
+    Within a worker, duplicates wait on the in-flight call. With
+    ``scope="host"`` the leader also takes an flock per key in DATA_DIR, and
+    once it holds the lock calls ``recheck`` first, so a result another
+    worker just produced (e.g. in a shared SQLite cache) is reused instead
+    of being fetched again. Without ``recheck``, the lock holder leaves its
+    (JSON) result next to the lock file and a worker that queued behind it
+    picks that up.
+    """
+
+    PRUNE_EVERY = 100
+    STALE_AFTER = 3600
+
+    def __init__(self, name: str, scope: str = SINGLE_FLIGHT_SCOPE, lock_timeout: float = SINGLE_FLIGHT_LOCK_TIMEOUT):
+        self.name = name
+        self.scope = scope
+        self.lock_timeout = lock_timeout
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self.calls = 0
+        self.shared = 0
+        self.rechecked = 0
+        if scope == 'host':
+            SINGLE_FLIGHT_DIR.mkdir(parents=True, exist_ok=True)
+
+    def do(self, key: str, fn, recheck=None):
+        """Return (result, shared); shared is True when another caller did the work"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.waiters += 1
+        if not leader:
+            flight.done.wait()
+            with self._lock:
+                self.shared += 1
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        shared = False
+        try:
+            if self.scope == 'host':
+                flight.result, shared = self._run_locked(key, fn, recheck)
+            else:
+                flight.result = fn()
+            return flight.result, shared
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if not shared:
+                    self.calls += 1
+                prune = self.scope == 'host' and self.calls % self.PRUNE_EVERY == 0
+            flight.done.set()
+            if prune:
+                self._prune()
+
+    def _run_locked(self, key: str, fn, recheck):
+        path = SINGLE_FLIGHT_DIR / f"{self.name}-{hashlib.sha1(key.encode()).hexdigest()}.lock"
+        result_path = path.with_suffix('.json')
+        arrived = time.time()
+        handoff = recheck is None
+        if handoff:
+            recheck = lambda: self._read_result(result_path, arrived)
+        with open(path, 'a') as lock_file:
+            deadline = time.monotonic() + self.lock_timeout
+            locked = False
+            while not locked:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    locked = True
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        # Give up waiting on the other worker and do the work ourselves
+                        break
+                    time.sleep(0.01)
+            try:
+                if recheck is not None:
+                    result = recheck()
+                    if result is not None:
+                        with self._lock:
+                            self.rechecked += 1
+                        return result, True
+                result = fn()
+                if handoff:
+                    self._write_result(result_path, result)
+                return result, False
+            finally:
+                if locked:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read_result(path: Path, produced_after: float):
+        """Load a result that another worker finished after we started waiting"""
+        try:
+            if path.stat().st_mtime < produced_after:
+                return None
+            return json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_result(path: Path, result: Any):
+        try:
+            tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+            tmp.write_text(json.dumps(result))
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError):
+            pass
+
+    def _prune(self):
+        """Remove lock and result files for keys not seen in a while"""
+        cutoff = time.time() - self.STALE_AFTER
+        for path in SINGLE_FLIGHT_DIR.glob(f"{self.name}-*"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "scope": self.scope,
+                "in_flight": len(self._flights),
+                "waiting": sum(flight.waiters for flight in self._flights.values()),
+                "calls": self.calls,
+                "shared": self.shared,
+                "rechecked": self.rechecked
+            }
 
-    # Fallback models
-    return [
-        {"id": "claude", "name": "Claude Sonnet", "provider": "Anthropic", "icon": "🎭", "contextWindow": "200k", "type": "text"},
-        {"id": "grok", "name": "Grok 2", "provider": "xAI", "icon": "🚀", "contextWindow": "128k", "type": "text"},
-        {"id": "gemini", "name": "Gemini Pro", "provider": "Google", "icon": "♊", "contextWindow": "1M", "type": "text"},
-        {"id": "chatgpt", "name": "ChatGPT 4", "provider": "OpenAI", "icon": "🤖", "contextWindow": "128k", "type": "text"},
-        {"id": "mistral", "name": "Mistral Large 3", "provider": "Mistral", "icon": "🇫🇷", "contextWindow": "256k", "type": "text"},
-        {"id": "kimi-k2", "name": "Kimi K2 Thinking", "provider": "Moonshot", "icon": "🌙", "contextWindow": "128k", "type": "text"},
-    ]
+
+generation_flights = SingleFlight("generate")
+sacred_circuits_flights = SingleFlight("sacred-circuits")
+
+
+# ============================================================================
+# PROVIDER RATE LIMITS
+# ============================================================================
+
+# Per-provider defaults; override with e.g. OPENAI_RPM, OPENAI_TPM, OPENAI_MAX_IN_FLIGHT (0 = unlimited)
+PROVIDER_LIMIT_DEFAULTS = {"rpm": 60, "tpm": 90000, "max_in_flight": 8}
+RATE_LIMIT_MAX_WAIT = float(os.environ.get('RATE_LIMIT_MAX_WAIT', 30))
+RATE_LIMIT_POLL = 0.05
+# In-flight slots of a worker that died are reclaimed after this long
+RATE_LIMIT_LEASE = float(os.environ.get('RATE_LIMIT_LEASE', PROVIDER_TIMEOUT * 5))
+WAIT_HISTOGRAM_MS = (0, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class RateLimited(ProviderError):
+    """A provider's limits stayed exhausted past the queueing deadline"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return len(text) // 4 + 1
+
+
+class ProviderLease:
+    __slots__ = ("provider", "holder", "reserved_tokens", "waited_ms")
+
+    def __init__(self, provider: str, holder: Optional[str], reserved_tokens: int, waited_ms: float):
+        self.provider = provider
+        self.holder = holder
+        self.reserved_tokens = reserved_tokens
+        self.waited_ms = waited_ms
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets plus an in-flight cap per provider.
+
+    Bucket levels, in-flight slots and queued waiters live in the state
+    store, so with the SQLite backend (the Procfile's default) every worker
+    draws from the same limits and reports the same queue. Callers that hit
+    a limit wait (polling) until ``RATE_LIMIT_MAX_WAIT`` runs out, then get
+    RateLimited. Token usage is reserved up front from an estimate and
+    settled against the actual usage afterwards.
+    """
+
+    def __init__(self, max_wait: float = RATE_LIMIT_MAX_WAIT):
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._queued: Dict[str, int] = {}
+
+    @staticmethod
+    def limits(name: str) -> Dict[str, int]:
+        return {
+            limit: int(os.environ.get(f"{name.upper()}_{limit.upper()}", default))
+            for limit, default in PROVIDER_LIMIT_DEFAULTS.items()
+        }
+
+    def _buckets(self, name: str, limits: Dict[str, int], tokens: int) -> List[tuple]:
+        buckets = []
+        if limits["rpm"]:
+            buckets.append((f"limits.{name}.rpm", 1, limits["rpm"], limits["rpm"] / 60))
+        if limits["tpm"]:
+            buckets.append((f"limits.{name}.tpm", min(tokens, limits["tpm"]), limits["tpm"], limits["tpm"] / 60))
+        return buckets
+
+    def _set_queued(self, name: str, delta: int):
+        with self._lock:
+            self._queued[name] = self._queued.get(name, 0) + delta
+
+    def acquire(self, name: str, tokens: int) -> ProviderLease:
+        """Wait for capacity on a provider and reserve one request and ``tokens`` tokens"""
+        steps = self.acquire_steps(name, tokens)
+        try:
+            while True:
+                time.sleep(next(steps))
+        except StopIteration as done:
+            return done.value
+        finally:
+            steps.close()
+
+    def acquire_steps(self, name: str, tokens: int):
+        """Generator behind acquire(): yields seconds to wait, returns the lease.
+
+        Lets an event loop await the waits instead of sleeping; closing the
+        generator early gives back any in-flight slot it holds.
+        """
+        limits = self.limits(name)
+        started = time.monotonic()
+        deadline = started + self.max_wait
+        holder = None
+        waiter = None
+        try:
+            while True:
+                wait_seconds = 0.0
+                if limits["max_in_flight"] and holder is None:
+                    candidate = f"{os.getpid()}-{uuid.uuid4().hex}"
+                    if state.acquire_slot(f"limits.{name}.in_flight", candidate, limits["max_in_flight"],
+                                          RATE_LIMIT_LEASE):
+                        holder = candidate
+                    else:
+                        wait_seconds = RATE_LIMIT_POLL
+                if not wait_seconds:
+                    wait_seconds = state.take(self._buckets(name, limits, tokens))
+                    if not wait_seconds:
+                        break
+                if time.monotonic() + min(wait_seconds, RATE_LIMIT_POLL) > deadline:
+                    state.incr(f"limits.{name}.rejected")
+                    raise RateLimited(name, f"rate limited for more than {self.max_wait:g}s",
+                                      status=429, retryable=True)
+                if waiter is None:
+                    # A waiter slot (rather than a counter) so a dead worker's waiters expire
+                    waiter = f"{os.getpid()}-{uuid.uuid4().hex}"
+                    state.acquire_slot(f"limits.{name}.waiting", waiter, sys.maxsize, self.max_wait + RATE_LIMIT_POLL)
+                    self._set_queued(name, 1)
+                    state.incr(f"limits.{name}.queued")
+                yield max(RATE_LIMIT_POLL, min(wait_seconds, deadline - time.monotonic()))
+        except BaseException:
+            if holder is not None:
+                state.release_slot(f"limits.{name}.in_flight", holder)
+            raise
+        finally:
+            if waiter is not None:
+                state.release_slot(f"limits.{name}.waiting", waiter)
+                self._set_queued(name, -1)
+        waited_ms = (time.monotonic() - started) * 1000
+        self._record_wait(name, waited_ms)
+        return ProviderLease(name, holder, tokens, waited_ms)
+
+    def release(self, lease: ProviderLease, used_tokens: Optional[int] = None):
+        """Free the in-flight slot and settle the reservation against actual usage.
+
+        Unused reserved tokens (all of them if usage is unknown) go back to
+        the bucket; usage beyond the reservation is charged even if that
+        leaves the bucket in debt, so later callers wait it off.
+        """
+        if lease.holder is not None:
+            state.release_slot(f"limits.{lease.provider}.in_flight", lease.holder)
+        unused = lease.reserved_tokens - (used_tokens or 0)
+        limits = self.limits(lease.provider)
+        if limits["tpm"] and unused:
+            state.take([(f"limits.{lease.provider}.tpm", -unused, limits["tpm"], limits["tpm"] / 60)], force=True)
+
+    def _record_wait(self, name: str, waited_ms: float):
+        bucket = next((le for le in WAIT_HISTOGRAM_MS if waited_ms <= le), "inf")
+        state.incr(f"limits.{name}.wait_le.{bucket}")
+        state.incr(f"limits.{name}.wait_ms_sum", waited_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        providers = {}
+        for name in PROVIDER_CLASSES:
+            limits = self.limits(name)
+            bucket_keys = [f"limits.{name}.wait_le.{le}" for le in WAIT_HISTOGRAM_MS + ("inf",)]
+            counters = state.get_many(bucket_keys + [f"limits.{name}.wait_ms_sum", f"limits.{name}.queued",
+                                                     f"limits.{name}.rejected"])
+            histogram, cumulative = [], 0
+            for le, key in zip(WAIT_HISTOGRAM_MS + ("inf",), bucket_keys):
+                cumulative += int(counters[key])
+                histogram.append({"le": le, "count": cumulative})
+            providers[name] = {
+                "limits": limits,
+                "in_flight": state.count_slots(f"limits.{name}.in_flight"),
+                "queue_depth": state.count_slots(f"limits.{name}.waiting"),
+                "worker_queue_depth": self._queued.get(name, 0),
+                "requests_available": round(state.bucket_level(f"limits.{name}.rpm", limits["rpm"], limits["rpm"] / 60), 2)
+                if limits["rpm"] else None,
+                "tokens_available": int(state.bucket_level(f"limits.{name}.tpm", limits["tpm"], limits["tpm"] / 60))
+                if limits["tpm"] else None,
+                "queued_total": int(counters[f"limits.{name}.queued"]),
+                "rejected_total": int(counters[f"limits.{name}.rejected"]),
+                "wait_ms": {
+                    "count": cumulative,
+                    "sum": round(counters[f"limits.{name}.wait_ms_sum"], 1),
+                    "buckets": histogram
+                }
+            }
+        return {"shared": STATE_BACKEND == 'sqlite', "worker_pid": os.getpid(), "max_wait_seconds": self.max_wait,
+                "providers": providers}
+
+
+rate_limiter = RateLimiter()
+
+
+# ============================================================================
+# PROVIDER ROUTER
+# ============================================================================
+
+DEFAULT_MODEL = os.environ.get('JARVIS_DEFAULT_MODEL', 'gpt-4')
+ACTIVE_MODEL_KEY = "models.active"
+ROUTER_FAILOVER_ORDER = [name.strip() for name in os.environ.get('ROUTER_FAILOVER_ORDER', 'openai,anthropic,gemini,mistral,xai').split(',')]
+ROUTER_HEDGE = os.environ.get('ROUTER_HEDGE', '1') == '1'
+ROUTER_HEDGE_MIN_MS = float(os.environ.get('ROUTER_HEDGE_MIN_MS', 1000))
+ROUTER_WINDOW = int(os.environ.get('ROUTER_WINDOW', 100))
+ROUTER_WINDOW_SECONDS = float(os.environ.get('ROUTER_WINDOW_SECONDS', 300))
+ROUTER_MIN_SAMPLES = int(os.environ.get('ROUTER_MIN_SAMPLES', 10))
+ROUTER_MAX_ERROR_RATE = float(os.environ.get('ROUTER_MAX_ERROR_RATE', 0.5))
+ROUTER_WORKERS = int(os.environ.get('ROUTER_WORKERS', 16))
+
+# Model ids used by /api/models and /api/models/list -> (provider, upstream model; None = provider default)
+MODEL_PROVIDERS = {
+    "gpt-4": ("openai", "gpt-4"),
+    "chatgpt": ("openai", "gpt-4"),
+    "claude": ("anthropic", None),
+    "claude-sonnet": ("anthropic", None),
+    "gemini": ("gemini", None),
+    "gemini-pro": ("gemini", None),
+    "mistral": ("mistral", None),
+    "mistral-large": ("mistral", None),
+    "grok": ("xai", None),
+    "grok-2": ("xai", None),
+}
+
+router_executor = ThreadPoolExecutor(max_workers=ROUTER_WORKERS, thread_name_prefix="provider-call")
+
+
+def get_active_model() -> str:
+    """Get the model selected through /api/models/switch"""
+    selected = state.tail(ACTIVE_MODEL_KEY, 1)
+    return selected[0] if selected else DEFAULT_MODEL
+
+
+def set_active_model(model_id: str):
+    state.append(ACTIVE_MODEL_KEY, model_id, 1)
+
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class ProviderHealth:
+    """Rolling latency and error rate for one provider (this worker's calls)"""
+
+    def __init__(self, window: int = ROUTER_WINDOW, window_seconds: float = ROUTER_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        # (finished_at, latency_ms, ok)
+        self._outcomes = deque(maxlen=window)
+
+    def record(self, latency_ms: float, ok: bool):
+        with self._lock:
+            self._outcomes.append((time.time(), latency_ms, ok))
+
+    def stats(self) -> Dict[str, Any]:
+        cutoff = time.time() - self.window_seconds
+        with self._lock:
+            outcomes = [outcome for outcome in self._outcomes if outcome[0] >= cutoff]
+        latencies = sorted(latency for _, latency, ok in outcomes if ok)
+        errors = sum(1 for _, _, ok in outcomes if not ok)
+        p50, p95 = percentile(latencies, 0.5), percentile(latencies, 0.95)
+        return {
+            "samples": len(outcomes),
+            "p50_ms": round(p50, 1) if p50 is not None else None,
+            "p95_ms": round(p95, 1) if p95 is not None else None,
+            "error_rate": round(errors / len(outcomes), 4) if outcomes else 0.0
+        }
+
+
+class ProviderRouter:
+    """Pick providers for a model and fail over, or hedge, when one is slow or failing.
+
+    The requested model's provider goes first unless its recent error rate
+    is above ROUTER_MAX_ERROR_RATE; other configured providers follow,
+    fastest (by p50) first. Once the first provider has enough samples, a
+    call still running after its p95 latency is hedged with the next
+    provider and whichever answers first wins.
+    """
+
+    def __init__(self):
+        self.health = {name: ProviderHealth() for name in PROVIDER_CLASSES}
+
+    def _record(self, name: str, mode: str, seconds: float, ok: bool):
+        self.health[name].record(seconds * 1000, ok)
+        request_metrics.observe("jarvis_provider_request_duration_seconds", seconds,
+                                f'provider="{name}",mode="{mode}",outcome="{"ok" if ok else "error"}"')
+
+    def _unhealthy(self, stats: Dict[str, Any]) -> bool:
+        return stats["samples"] >= ROUTER_MIN_SAMPLES and stats["error_rate"] > ROUTER_MAX_ERROR_RATE
+
+    def plan(self, model_id: str) -> List[tuple]:
+        """Ordered (provider, upstream model) candidates for a model id"""
+        primary = MODEL_PROVIDERS.get(model_id)
+        stats = {name: health.stats() for name, health in self.health.items()}
+        order = [name for name in ROUTER_FAILOVER_ORDER if name in PROVIDER_CLASSES]
+        fallbacks = sorted(
+            (name for name in order if not primary or name != primary[0]),
+            key=lambda name: (self._unhealthy(stats[name]), stats[name]["p50_ms"] is None,
+                              stats[name]["p50_ms"] or 0, order.index(name))
+        )
+        candidates = [(name, None) for name in fallbacks]
+        if primary:
+            position = 0
+            if self._unhealthy(stats[primary[0]]):
+                position = sum(1 for name in fallbacks if not self._unhealthy(stats[name]))
+            candidates.insert(position, primary)
+        return [(name, model) for name, model in candidates if provider_registry.configured(name)]
+
+    def _call(self, name: str, model: Optional[str], system_prompt: str, prompt: str,
+              temperature: float, max_tokens: int) -> Dict[str, Any]:
+        provider = provider_registry.get(name)
+        lease = rate_limiter.acquire(name, estimate_tokens(system_prompt + prompt) + max_tokens)
+        started = time.perf_counter()
+        try:
+            response = provider.chat(system_prompt, prompt, model=model, temperature=temperature, max_tokens=max_tokens)
+        except Exception:
+            rate_limiter.release(lease)
+            self._record(name, "chat", time.perf_counter() - started, False)
+            raise
+        rate_limiter.release(lease, response["input_tokens"] + response["output_tokens"])
+        elapsed = time.perf_counter() - started
+        self._record(name, "chat", elapsed, True)
+        latency_ms = elapsed * 1000
+        return dict(response, provider=name, latency_ms=round(latency_ms, 1), queued_ms=round(lease.waited_ms, 1),
+                    cost=provider.cost(response["input_tokens"], response["output_tokens"]))
+
+    def _hedge_after(self, name: str) -> Optional[float]:
+        if not ROUTER_HEDGE:
+            return None
+        stats = self.health[name].stats()
+        if stats["samples"] < ROUTER_MIN_SAMPLES or stats["p95_ms"] is None:
+            return None
+        return max(ROUTER_HEDGE_MIN_MS, stats["p95_ms"]) / 1000
+
+    @staticmethod
+    def _charge_loser(future):
+        """A hedged call that lost the race was still billed"""
+        if not future.cancelled() and future.exception() is None:
+            add_cost("ai_apis", future.result()["cost"])
+
+    def chat(self, system_prompt: str, prompt: str, model_id: Optional[str] = None,
+             temperature: float = 0.7, max_tokens: int = 1500):
+        """Generate through the best available provider; returns (response, routing)"""
+        requested = model_id or get_active_model()
+        remaining = self.plan(requested)
+        if not remaining:
+            raise ProviderError("router", f"no configured provider for model {requested}")
+        started = time.perf_counter()
+        attempts = []
+        pending = {}
+        hedged = False
+        last_error = None
+
+        def launch():
+            name, model = remaining.pop(0)
+            future = router_executor.submit(self._call, name, model, system_prompt, prompt, temperature, max_tokens)
+            pending[future] = (name, model)
+
+        launch()
+        while pending:
+            timeout = None
+            if not hedged and remaining and len(pending) == 1:
+                timeout = self._hedge_after(next(iter(pending.values()))[0])
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                launch()
+                continue
+            for future in done:
+                name, model = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    last_error = e
+                    attempts.append({"provider": name, "status": "error", "error": str(e)})
+                    continue
+                attempts.append({"provider": name, "status": "ok", "latency_ms": response["latency_ms"],
+                                 "queued_ms": response["queued_ms"]})
+                for loser in pending:
+                    attempts.append({"provider": pending[loser][0], "status": "abandoned"})
+                    loser.add_done_callback(self._charge_loser)
+                return response, {
+                    "requested_model": requested,
+                    "provider": name,
+                    "model": response["model"],
+                    "hedged": hedged,
+                    "failover": any(attempt["status"] == "error" for attempt in attempts),
+                    "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+                    "attempts": attempts
+                }
+            if not pending and remaining:
+                launch()
+        raise last_error
+
+    def stream(self, system_prompt: str, prompt: str, model_id: Optional[str] = None,
+               temperature: float = 0.7, max_tokens: int = 1500):
+        """Stream through the best available provider, failing over until the first token.
+
+        Yields {"text": ...} chunks, then the provider's final usage item with
+        "provider", "cost" and "routing" added.
+        """
+        requested = model_id or get_active_model()
+        remaining = self.plan(requested)
+        if not remaining:
+            raise ProviderError("router", f"no configured provider for model {requested}")
+        attempts = []
+        last_error = None
+        for name, model in remaining:
+            provider = provider_registry.get(name)
+            try:
+                lease = rate_limiter.acquire(name, estimate_tokens(system_prompt + prompt) + max_tokens)
+            except RateLimited as e:
+                last_error = e
+                attempts.append({"provider": name, "status": "error", "error": str(e)})
+                continue
+            started = time.perf_counter()
+            first_token = None
+            used_tokens = None
+            try:
+                for chunk in provider.stream_chat(system_prompt, prompt, model=model,
+                                                  temperature=temperature, max_tokens=max_tokens):
+                    if "text" in chunk:
+                        if first_token is None:
+                            first_token = time.perf_counter()
+                        yield chunk
+                        continue
+                    elapsed = time.perf_counter() - started
+                    self._record(name, "stream", elapsed, True)
+                    latency_ms = elapsed * 1000
+                    attempts.append({"provider": name, "status": "ok", "latency_ms": round(latency_ms, 1),
+                                     "queued_ms": round(lease.waited_ms, 1)})
+                    usage = chunk["usage"]
+                    used_tokens = usage["input_tokens"] + usage["output_tokens"]
+                    yield dict(chunk, provider=name,
+                               cost=provider.cost(usage["input_tokens"], usage["output_tokens"]),
+                               routing={
+                                   "requested_model": requested,
+                                   "provider": name,
+                                   "model": chunk["model"],
+                                   "hedged": False,
+                                   "failover": len(attempts) > 1,
+                                   "latency_ms": round(latency_ms, 1),
+                                   "attempts": attempts
+                               })
+                    return
+            except Exception as e:
+                self._record(name, "stream", time.perf_counter() - started, False)
+                if first_token is not None:
+                    raise
+                last_error = e
+                attempts.append({"provider": name, "status": "error", "error": str(e)})
+            finally:
+                rate_limiter.release(lease, used_tokens)
+        raise last_error
+
+    def status(self) -> Dict[str, Any]:
+        active = get_active_model()
+        return {
+            "active_model": active,
+            "plan": [name for name, _ in self.plan(active)],
+            "hedging": ROUTER_HEDGE,
+            "providers": {name: health.stats() for name, health in self.health.items()}
+        }
+
+
+provider_router = ProviderRouter()
 
 
 # ============================================================================
@@ -307,6 +4305,85 @@ def system_status():
     })
 
 
+@app.route('/api/system/workers', methods=['GET'])
+def system_workers():
+    """Get per-worker process stats and which worker samples host metrics"""
+    return jsonify({
+        "leader": metrics_lease.holder(),
+        "pid": os.getpid(),
+        "role": "leader" if metrics_sampler.leading else "follower",
+        "workers": worker_stats.collect(),
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Request, WebSocket, broadcast and provider metrics of all workers in Prometheus text format"""
+    return Response(render_prometheus(request_metrics.aggregate()),
+                    content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.route('/api/admin/profiler', methods=['GET'])
+def profiler_status():
+    """Get the state of this worker's profiling session"""
+    error = admin_error()
+    if error:
+        return error
+    return jsonify(stack_profiler.status())
+
+
+@app.route('/api/admin/profiler/start', methods=['POST'])
+def start_profiler():
+    """Start sampling this worker's threads
+
+    Body: {"duration": seconds, "interval_ms": 10, "route": "/api/content/generate"};
+    with a route, samples are only taken while a request for that URL rule is running.
+    """
+    error = admin_error()
+    if error:
+        return error
+    data = request.get_json(silent=True) or {}
+    try:
+        duration = float(data.get('duration', 30))
+        interval_ms = float(data.get('interval_ms', PROFILER_DEFAULT_INTERVAL_MS))
+    except (TypeError, ValueError):
+        return jsonify({"error": "duration and interval_ms must be numbers"}), 400
+    if not 0 < duration <= PROFILER_MAX_DURATION:
+        return jsonify({"error": f"duration must be between 0 and {PROFILER_MAX_DURATION:g} seconds"}), 400
+    if interval_ms < 1:
+        return jsonify({"error": "interval_ms must be at least 1"}), 400
+    route = data.get('route')
+    if route is not None and route not in {rule.rule for rule in app.url_map.iter_rules()}:
+        return jsonify({"error": f"Unknown route: {route}"}), 400
+    try:
+        return jsonify(stack_profiler.start(duration, interval_ms, route))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+
+
+@app.route('/api/admin/profiler/stop', methods=['POST'])
+def stop_profiler():
+    """Stop the running profiling session early"""
+    error = admin_error()
+    if error:
+        return error
+    return jsonify(stack_profiler.stop())
+
+
+@app.route('/api/admin/profiler/profile', methods=['GET'])
+def export_profile():
+    """Export the last session as collapsed stacks (default) or ?format=speedscope JSON"""
+    error = admin_error()
+    if error:
+        return error
+    if stack_profiler.session is None:
+        return jsonify({"error": "No profile recorded"}), 404
+    if request.args.get('format') == 'speedscope':
+        return jsonify(stack_profiler.speedscope())
+    return Response(stack_profiler.collapsed(), content_type="text/plain; charset=utf-8")
+
+
 @app.route('/api/antigravity/status', methods=['GET'])
 def antigravity_status():
     """Get anti-gravity optimization status (V0 Cockpit compatibility)"""
@@ -318,6 +4395,7 @@ def antigravity_status():
         "memory_used": metrics["memory_used_gb"],
         "optimization_level": metrics["optimization_level"],
         "active_processes": metrics["active_processes"],
+        "metrics_age_seconds": metrics["age_seconds"],
         "antigravity_enabled": config.get("antigravity_enabled", True),
         "weightless_mode": config.get("weightless_mode", True),
         "performance_boost": config.get("performance_boost", 0.9)
@@ -326,62 +4404,112 @@ def antigravity_status():
 
 @app.route('/api/workflows/list', methods=['GET'])
 def list_workflows():
-    """Get all available workflows"""
-    workflows = get_workflows()
-    return jsonify({
-        "workflows": workflows,
-        "count": len(workflows)
-    })
+    """Get all available workflows (supports If-None-Match)"""
+    _, etag, body = workflow_index.listing()
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)
 
 
 @app.route('/api/workflows/<workflow_id>', methods=['GET'])
 def get_workflow(workflow_id):
     """Get specific workflow details"""
-    workflow_file = WORKFLOWS_DIR / f"{workflow_id}.json"
-
-    if not workflow_file.exists():
-        return jsonify({"error": "Workflow not found"}), 404
-
     try:
-        with open(workflow_file, 'r') as f:
-            workflow_data = json.load(f)
-        return jsonify(workflow_data)
+        workflow_data = load_workflow(workflow_id)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+    if workflow_data is None:
+        return jsonify({"error": "Workflow not found"}), 404
+    return jsonify(workflow_data)
+
 
 @app.route('/api/workflows/execute', methods=['POST'])
 def execute_workflow():
-    """Execute a workflow"""
+    """Queue a workflow run on the job engine"""
     data = request.json
     workflow_id = data.get('workflow_id')
 
     if not workflow_id:
         return jsonify({"error": "workflow_id required"}), 400
 
-    # Broadcast execution start
-    broadcast_message({
-        "id": f"workflow_{workflow_id}_{int(time.time())}",
-        "timestamp": datetime.now().isoformat(),
-        "source": "JARVIS",
-        "message": f"Starting workflow: {workflow_id}",
-        "level": "info"
-    })
+    try:
+        if load_workflow(workflow_id) is None:
+            return jsonify({"error": "Workflow not found"}), 404
+        priority = int(data.get('priority', 0))
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid input: {str(e)}"}), 400
+
+    params = dict(data.get('params') or {})
+    if data.get('resume_from'):
+        params['resume_from'] = data['resume_from']
+
+    job = job_engine.submit(workflow_id, params, priority)
 
     return jsonify({
-        "status": "started",
+        "status": "queued",
         "workflow_id": workflow_id,
-        "message": "Workflow execution started"
+        "job_id": job["id"],
+        "job": job,
+        "message": "Workflow execution queued"
+    }), 202
+
+
+@app.route('/api/workflows/jobs', methods=['GET'])
+def list_workflow_jobs():
+    """Get the most recent workflow jobs"""
+    jobs = job_engine.table.recent(min(int(request.args.get('limit', 20)), 200))
+    return jsonify({
+        "jobs": jobs,
+        "count": len(jobs)
     })
 
 
+@app.route('/api/workflows/jobs/<job_id>', methods=['GET'])
+def get_workflow_job(job_id):
+    """Get a workflow job"""
+    job = job_engine.table.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
+@app.route('/api/workflows/jobs/<job_id>/resume', methods=['POST'])
+def resume_workflow_job(job_id):
+    """Re-run a job's workflow, reusing the steps that already succeeded"""
+    job = job_engine.table.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    params = dict(job["params"] or {}, resume_from=job_id)
+    resumed = job_engine.submit(job["workflow_id"], params, job["priority"])
+    return jsonify({
+        "status": "queued",
+        "workflow_id": job["workflow_id"],
+        "job_id": resumed["id"],
+        "job": resumed,
+        "message": f"Resuming from {job_id}"
+    }), 202
+
+
+@app.route('/api/workflows/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_workflow_job(job_id):
+    """Cancel a queued or running workflow job"""
+    job = job_engine.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
 @app.route('/api/skills/list', methods=['GET'])
 def list_skills():
-    """Get all available skills"""
-    skills = get_available_skills()
+    """Get all available skills (?q= searches names, descriptions and tags)"""
+    query = request.args.get('q', '').strip()
+    skills = get_available_skills(query)
     return jsonify({
         "skills": skills,
-        "count": len(skills)
+        "count": len(skills),
+        "query": query or None
     })
 
 
@@ -404,6 +4532,8 @@ def switch_model():
     if not model_id:
         return jsonify({"error": "model required"}), 400
 
+    set_active_model(model_id)
+
     # Broadcast model switch
     broadcast_message({
         "id": f"model_switch_{int(time.time())}",
@@ -416,6 +4546,7 @@ def switch_model():
     return jsonify({
         "status": "success",
         "model": model_id,
+        "provider": MODEL_PROVIDERS[model_id][0] if model_id in MODEL_PROVIDERS else None,
         "message": f"Switched to {model_id}"
     })
 
@@ -423,29 +4554,27 @@ def switch_model():
 @app.route('/api/dashboards/list', methods=['GET'])
 def list_dashboards():
     """Get all available dashboards"""
-    services = get_running_services()
-
     dashboards = [
         {
             "id": "ai-command-center",
             "name": "AI Command Center",
-            "url": "http://localhost:3000",
+            "url": f"http://localhost:{SERVICE_REGISTRY['ai_command_center']}",
             "vercel_url": "https://jarvis.nikoskatsaounis.com",
-            "status": services["ai_command_center"]["status"],
+            "status": port_index.status(SERVICE_REGISTRY["ai_command_center"]),
             "type": "react"
         },
         {
             "id": "workflow-studio",
             "name": "Workflow Studio",
-            "url": "http://localhost:8560",
-            "status": services["workflow_studio"]["status"],
+            "url": f"http://localhost:{SERVICE_REGISTRY['workflow_studio']}",
+            "status": port_index.status(SERVICE_REGISTRY["workflow_studio"]),
             "type": "streamlit"
         },
         {
             "id": "ultimate-hub",
             "name": "Ultimate Dashboard Hub",
-            "url": "http://localhost:8550",
-            "status": services["ultimate_hub"]["status"],
+            "url": f"http://localhost:{SERVICE_REGISTRY['ultimate_hub']}",
+            "status": port_index.status(SERVICE_REGISTRY["ultimate_hub"]),
             "type": "streamlit"
         }
     ]
@@ -476,11 +4605,8 @@ def generate_video():
     })
 
 
-@app.route('/api/comic/create', methods=['POST'])
-def create_comic():
+def queue_comic() -> Dict[str, Any]:
     """Placeholder for comic creation"""
-    data = request.json
-
     broadcast_message({
         "id": f"comic_{int(time.time())}",
         "timestamp": datetime.now().isoformat(),
@@ -489,46 +4615,73 @@ def create_comic():
         "level": "info"
     })
 
-    return jsonify({
+    return {
         "status": "queued",
         "job_id": f"comic_{int(time.time())}",
         "message": "Comic creation queued"
-    })
+    }
+
+
+@app.route('/api/comic/create', methods=['POST'])
+def create_comic():
+    """Placeholder for comic creation"""
+    return jsonify(queue_comic())
+
+
+def parse_time_param(value: Optional[str]) -> Optional[float]:
+    """Parse an epoch-seconds or ISO 8601 query parameter"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
 
 
 @app.route('/api/metrics/history', methods=['GET'])
 def metrics_history_endpoint():
-    """Get historical metrics for charting"""
+    """Get historical metrics for charting
+
+    Query params: from/to (epoch seconds or ISO 8601), resolution (raw, 1m, 1h, 1d), limit
+    """
+    try:
+        start = parse_time_param(request.args.get('from'))
+        end = parse_time_param(request.args.get('to'))
+        resolution = request.args.get('resolution', 'raw')
+        default_limit = MAX_HISTORY_POINTS if start is None and end is None else MAX_HISTORY_QUERY_POINTS
+        limit = max(1, min(int(request.args.get('limit', default_limit)), MAX_HISTORY_QUERY_POINTS))
+        history = metrics_store.query(start, end, resolution, limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     return jsonify({
-        "history": metrics_history,
-        "count": len(metrics_history)
+        "history": history,
+        "count": len(history),
+        "resolution": resolution
     })
 
 
 @app.route('/api/workflows/active', methods=['GET'])
 def active_workflows():
-    """Get currently active/running workflows"""
-    # For now, return empty as we don't have active workflow tracking yet
-    # TODO: Implement actual workflow execution tracking
+    """Get currently queued and running workflows"""
+    jobs = job_engine.table.active()
     return jsonify({
-        "workflows": [],
-        "count": 0
+        "workflows": jobs,
+        "count": len(jobs)
     })
 
 
 @app.route('/api/costs/current', methods=['GET'])
 def current_costs():
     """Get current cost breakdown"""
-    global total_cost, cost_breakdown
-
-    # Calculate Railway hosting costs (simple estimate)
-    # Railway free tier or paid tier tracking would go here
-    cost_breakdown["infrastructure"] = 0.0  # Free tier for now
+    # Railway hosting is on the free tier; infrastructure costs only come from /api/costs/track
+    breakdown = get_cost_breakdown()
 
     # Return current costs
     return jsonify({
-        "total_cost": round(total_cost, 4),
-        "breakdown": cost_breakdown,
+        "total_cost": round(sum(breakdown.values()), 4),
+        "breakdown": breakdown,
+        "savings": get_cost_savings(),
         "currency": "USD",
         "period": "current_month"
     })
@@ -537,15 +4690,14 @@ def current_costs():
 @app.route('/api/costs/track', methods=['POST'])
 def track_cost():
     """Track an API or service cost"""
-    global total_cost, cost_breakdown
-
     data = request.json
     category = data.get('category', 'ai_apis')  # ai_apis, storage, infrastructure
     amount = float(data.get('amount', 0))
 
-    if category in cost_breakdown:
-        cost_breakdown[category] += amount
-        total_cost += amount
+    if category in COST_CATEGORIES:
+        total_cost = add_cost(category, amount)
+    else:
+        total_cost = get_total_cost()
 
     return jsonify({
         "status": "tracked",
@@ -558,19 +4710,15 @@ def track_cost():
 @app.route('/api/videos/recent', methods=['GET'])
 def recent_videos():
     """Get recent video generation history"""
-    global video_history
-
     return jsonify({
-        "videos": video_history[-10:],  # Last 10 videos
-        "count": len(video_history)
+        "videos": state.tail("video_history", 10),  # Last 10 videos
+        "count": state.length("video_history")
     })
 
 
 @app.route('/api/videos/track', methods=['POST'])
 def track_video_generation():
     """Track a video generation (placeholder for actual generation logic)"""
-    global video_history, total_cost, cost_breakdown
-
     data = request.json
     title = data.get('title', 'Untitled Video')
     style = data.get('style', 'Cinematic')
@@ -583,8 +4731,7 @@ def track_video_generation():
     total_video_cost = round(script_cost + images_cost + voice_cost, 4)
 
     # Track costs
-    cost_breakdown["ai_apis"] += total_video_cost
-    total_cost += total_video_cost
+    add_cost("ai_apis", total_video_cost)
 
     # Add to history
     video_entry = {
@@ -595,9 +4742,7 @@ def track_video_generation():
         "cost": total_video_cost
     }
 
-    video_history.append(video_entry)
-    if len(video_history) > MAX_VIDEO_HISTORY:
-        video_history = video_history[-MAX_VIDEO_HISTORY:]
+    state.append("video_history", video_entry, MAX_VIDEO_HISTORY)
 
     return jsonify({
         "status": "generated",
@@ -616,14 +4761,188 @@ def track_video_generation():
 # ============================================================================
 
 # Content drafts storage
-content_drafts = []
 MAX_DRAFTS = 50
 
+# Persona-specific system prompts
+PERSONA_PROMPTS = {
+    "Technical Writer": "You are a technical writer. Create clear, precise, well-structured technical documentation.",
+    "Creative Storyteller": "You are a creative storyteller. Craft engaging narratives with vivid imagery and emotional depth.",
+    "Academic Researcher": "You are an academic researcher. Write scholarly, well-researched content with proper citations and methodology.",
+    "Marketing Copywriter": "You are a marketing copywriter. Create persuasive, compelling copy that drives engagement and conversions.",
+    "Journalist": "You are a journalist. Write factual, balanced news articles with proper attribution and context.",
+    "Poet": "You are a poet. Create beautiful, evocative poetry with rich metaphors and emotional resonance."
+}
+
+# WebSocket streams coalesce token deltas for this long before publishing a frame
+STREAM_FLUSH_MS = int(os.environ.get('STREAM_FLUSH_MS', 50))
+STREAM_WORKERS = int(os.environ.get('STREAM_WORKERS', 8))
+
+stream_executor = ThreadPoolExecutor(max_workers=STREAM_WORKERS, thread_name_prefix="content-stream")
+
+
+# Sampling parameters for content generation
+GENERATION_TEMPERATURE = 0.7
+GENERATION_MAX_TOKENS = 1500
+
+
+def stream_generation(system_prompt: str, prompt: str, persona: str, request_id: str,
+                      cache_key: str, model_id: str):
+    """Yield start/token/done (or error) events for one streamed generation.
+
+    Cost is recorded once, from the usage the provider reports at the end of
+    the stream, and the completed text is stored in the generation cache when the
+    requested model's own provider produced it.
+    """
+    started = time.perf_counter()
+    ttft_ms = None
+    parts = []
+    yield {"event": "start", "request_id": request_id, "persona": persona, "model": model_id}
+    try:
+        for chunk in provider_router.stream(system_prompt, prompt, model_id, temperature=GENERATION_TEMPERATURE,
+                                            max_tokens=GENERATION_MAX_TOKENS):
+            if "text" in chunk:
+                if ttft_ms is None:
+                    ttft_ms = round((time.perf_counter() - started) * 1000, 1)
+                parts.append(chunk["text"])
+                yield {"event": "token", "text": chunk["text"]}
+                continue
+            usage = chunk["usage"]
+            add_cost("ai_apis", chunk["cost"])
+            if generation_cacheable(chunk["routing"]):
+                generation_cache.put(cache_key, "".join(parts), chunk["model"],
+                                     usage["input_tokens"], usage["output_tokens"], chunk["cost"])
+            yield {
+                "event": "done",
+                "request_id": request_id,
+                "model": chunk["model"],
+                "tokens_used": usage["input_tokens"] + usage["output_tokens"],
+                "cost": round(chunk["cost"], 4),
+                "cached": False,
+                "routing": chunk["routing"],
+                "ttft_ms": ttft_ms,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+    except Exception as e:
+        yield {"event": "error", "request_id": request_id, "error": str(e)}
+
+
+def replay_generation(entry: Dict[str, Any], persona: str, request_id: str):
+    """Yield the same events as stream_generation for a cached result"""
+    yield {"event": "start", "request_id": request_id, "persona": persona, "model": entry["model"]}
+    yield {"event": "token", "text": entry["text"]}
+    yield {
+        "event": "done",
+        "request_id": request_id,
+        "model": entry["model"],
+        "tokens_used": entry["input_tokens"] + entry["output_tokens"],
+        "cost": 0.0,
+        "cached": True,
+        "saved": round(entry["cost"], 4),
+        "ttft_ms": 0.0,
+        "duration_ms": 0.0
+    }
+
+
+def sse_frame(event: Dict[str, Any]) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+
+def sse_frames(events):
+    """Format generation events as Server-Sent Events"""
+    for event in events:
+        yield sse_frame(event)
+
+
+def publish_generation(events, topic: str):
+    """Publish generation events to WebSocket subscribers of ``topic``"""
+    pending, flush_at = [], 0.0
+    for event in events:
+        if event["event"] == "token":
+            if not pending:
+                flush_at = time.monotonic() + STREAM_FLUSH_MS / 1000
+            pending.append(event["text"])
+            if time.monotonic() < flush_at:
+                continue
+        if pending:
+            broadcast_message({"source": "CONTENT", "event": "token", "text": "".join(pending)}, topic)
+            pending = []
+        if event["event"] != "token":
+            broadcast_message(dict(event, source="CONTENT"), topic)
+
+
+def demo_generation(prompt: str, persona: str) -> Dict[str, Any]:
+    return {
+        "error": "No provider API key configured",
+        "generated_content": f"[Demo Mode] Generated by {persona}:\n\n{prompt}\n\n(An AI provider API key is needed for real generation)"
+    }
+
+
+def generation_failure(error: Exception) -> Dict[str, Any]:
+    return {
+        "error": str(error),
+        "generated_content": f"[Error] Failed to generate content: {str(error)}"
+    }
+
+
+def cached_generation_body(cached: Dict[str, Any], persona: str) -> Dict[str, Any]:
+    return {
+        "generated_content": cached["text"],
+        "persona": persona,
+        "tokens_used": cached["input_tokens"] + cached["output_tokens"],
+        "cost": 0.0,
+        "cached": True,
+        "saved": round(cached["cost"], 4)
+    }
+
+
+def generation_body(result: Dict[str, Any], persona: str, shared: bool) -> Dict[str, Any]:
+    return {
+        "generated_content": result["text"],
+        "persona": persona,
+        "tokens_used": result["input_tokens"] + result["output_tokens"],
+        "cost": 0.0 if shared else round(result["cost"], 4),
+        "cached": False,
+        "coalesced": shared,
+        "routing": result.get("routing")
+    }
+
+
+def generate_text(prompt: str, persona: str) -> tuple:
+    """Generate content with a persona; returns (response body, HTTP status)"""
+    try:
+        # Check that some provider can serve the active model
+        model_id = get_active_model()
+        if not provider_router.plan(model_id):
+            return demo_generation(prompt, persona), 200
+        system_prompt = PERSONA_PROMPTS.get(persona, "You are a helpful AI assistant.")
+        cache_key = generation_cache_key(model_id, system_prompt, prompt,
+                                         GENERATION_TEMPERATURE, GENERATION_MAX_TOKENS)
+        cached = generation_cache.get(cache_key)
+        if cached is not None:
+            return cached_generation_body(cached, persona), 200
+
+        def generate():
+            # Route to the active model's provider, failing over or hedging as needed
+            response, routing = provider_router.chat(system_prompt, prompt, model_id,
+                                                     temperature=GENERATION_TEMPERATURE,
+                                                     max_tokens=GENERATION_MAX_TOKENS)
+            add_cost("ai_apis", response["cost"])
+            if generation_cacheable(routing):
+                generation_cache.put(cache_key, response["text"], response["model"],
+                                     response["input_tokens"], response["output_tokens"], response["cost"])
+            return dict(response, routing=routing)
+
+        # Identical concurrent requests share one upstream call
+        result, shared = generation_flights.do(cache_key, generate, recheck=lambda: generation_cache.peek(cache_key))
+        return generation_body(result, persona, shared), 200
+
+    except Exception as e:
+        return generation_failure(e), 500
+
+
 @app.route('/api/content/generate', methods=['POST'])
 def generate_content():
     """Generate AI content with selected persona"""
-    global total_cost, cost_breakdown
-
     try:
         # Validate input with Pydantic
         validated_data = ContentGenerateRequest(**request.json)
@@ -632,77 +4951,44 @@ def generate_content():
     except Exception as e:
         return jsonify({"error": f"Invalid input: {str(e)}"}), 400
 
-    try:
-        # Check for OpenAI API key
-        openai_key = os.environ.get('OPENAI_API_KEY')
-        if not openai_key:
-            return jsonify({
-                "error": "OpenAI API key not configured",
-                "generated_content": f"[Demo Mode] Generated by {persona}:\n\n{prompt}\n\n(OpenAI API key needed for real generation)"
-            }), 200
-
-        # Import OpenAI
-        try:
-            from openai import OpenAI
-            client = OpenAI(api_key=openai_key)
-        except ImportError:
-            return jsonify({
-                "error": "OpenAI library not installed",
-                "generated_content": f"[Demo Mode] Generated by {persona}:\n\n{prompt}\n\n(Install openai library: pip install openai)"
-            }), 200
-
-        # Persona-specific system prompts
-        persona_prompts = {
-            "Technical Writer": "You are a technical writer. Create clear, precise, well-structured technical documentation.",
-            "Creative Storyteller": "You are a creative storyteller. Craft engaging narratives with vivid imagery and emotional depth.",
-            "Academic Researcher": "You are an academic researcher. Write scholarly, well-researched content with proper citations and methodology.",
-            "Marketing Copywriter": "You are a marketing copywriter. Create persuasive, compelling copy that drives engagement and conversions.",
-            "Journalist": "You are a journalist. Write factual, balanced news articles with proper attribution and context.",
-            "Poet": "You are a poet. Create beautiful, evocative poetry with rich metaphors and emotional resonance."
-        }
-
-        system_prompt = persona_prompts.get(persona, "You are a helpful AI assistant.")
+    if not validated_data.stream:
+        body, status = generate_text(prompt, persona)
+        return jsonify(body), status
 
-        # Generate content with GPT-4
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=1500
-        )
-
-        generated_content = response.choices[0].message.content
-
-        # Track cost (GPT-4 pricing: $0.03 per 1K input tokens, $0.06 per 1K output tokens)
-        input_tokens = response.usage.prompt_tokens
-        output_tokens = response.usage.completion_tokens
-        generation_cost = (input_tokens / 1000 * 0.03) + (output_tokens / 1000 * 0.06)
+    try:
+        model_id = get_active_model()
+        if not provider_router.plan(model_id):
+            return jsonify(demo_generation(prompt, persona)), 200
+        system_prompt = PERSONA_PROMPTS.get(persona, "You are a helpful AI assistant.")
+        cache_key = generation_cache_key(model_id, system_prompt, prompt,
+                                         GENERATION_TEMPERATURE, GENERATION_MAX_TOKENS)
+        cached = generation_cache.get(cache_key)
+
+        request_id = validated_data.request_id or uuid.uuid4().hex
+        if cached is not None:
+            events = replay_generation(cached, persona, request_id)
+        else:
+            events = stream_generation(system_prompt, prompt, persona, request_id, cache_key, model_id)
+        if validated_data.stream == "ws":
+            topic = f"{CONTENT_STREAM_TOPIC}.{request_id}"
+            stream_executor.submit(publish_generation, events, topic)
+            return jsonify({"status": "streaming", "request_id": request_id, "topic": topic}), 202
+        return Response(stream_with_context(sse_frames(events)), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-        cost_breakdown["ai_apis"] += generation_cost
-        total_cost += generation_cost
+    except Exception as e:
+        return jsonify(generation_failure(e)), 500
 
-        return jsonify({
-            "generated_content": generated_content,
-            "persona": persona,
-            "tokens_used": response.usage.total_tokens,
-            "cost": round(generation_cost, 4)
-        })
 
-    except Exception as e:
-        return jsonify({
-            "error": str(e),
-            "generated_content": f"[Error] Failed to generate content: {str(e)}"
-        }), 500
+@app.route('/api/content/cache', methods=['GET'])
+def content_cache_stats():
+    """Get generation cache hit rate and dollars saved"""
+    return jsonify(dict(generation_cache.stats(), single_flight=generation_flights.stats()))
 
 
 @app.route('/api/content/save', methods=['POST'])
 def save_draft():
     """Save content draft"""
-    global content_drafts
-
     data = request.json
     content = data.get('content', '')
     persona = data.get('persona', 'Unknown')
@@ -711,16 +4997,14 @@ def save_draft():
         return jsonify({"error": "Content required"}), 400
 
     draft = {
-        "id": len(content_drafts) + 1,
+        "id": int(state.incr("drafts.next_id")),
         "content": content,
         "persona": persona,
         "timestamp": datetime.now().isoformat(),
         "word_count": len(content.split())
     }
 
-    content_drafts.append(draft)
-    if len(content_drafts) > MAX_DRAFTS:
-        content_drafts = content_drafts[-MAX_DRAFTS:]
+    state.append("content_drafts", draft, MAX_DRAFTS)
 
     return jsonify({
         "status": "saved",
@@ -732,20 +5016,13 @@ def save_draft():
 def get_drafts():
     """Get all saved drafts"""
     return jsonify({
-        "drafts": content_drafts[-10:],  # Last 10 drafts
-        "count": len(content_drafts)
+        "drafts": state.tail("content_drafts", 10),  # Last 10 drafts
+        "count": state.length("content_drafts")
     })
 
 
-@app.route('/api/tools/mythic', methods=['POST'])
-def apply_mythic_structure():
+def build_mythic_structure(content: str) -> Dict[str, Any]:
     """Apply mythic storytelling structure to content"""
-    data = request.json
-    content = data.get('content', '')
-
-    if not content:
-        return jsonify({"error": "Content required"}), 400
-
     # Mythic structure transformation
     mythic_template = f"""# Hero's Journey Structure
 
@@ -789,21 +5066,26 @@ def apply_mythic_structure():
 Original content: {content[:500]}...
 """
 
-    return jsonify({
+    return {
         "transformed_content": mythic_template,
         "structure": "Hero's Journey"
-    })
+    }
 
 
-@app.route('/api/tools/condense', methods=['POST'])
-def condense_text():
-    """Condense text to key points"""
+@app.route('/api/tools/mythic', methods=['POST'])
+def apply_mythic_structure():
+    """Apply mythic storytelling structure to content"""
     data = request.json
     content = data.get('content', '')
 
     if not content:
         return jsonify({"error": "Content required"}), 400
 
+    return jsonify(build_mythic_structure(content))
+
+
+def build_condensed_content(content: str) -> Dict[str, Any]:
+    """Condense text to key points"""
     # Simple condensation (in production, use GPT-4 for intelligent summarization)
     sentences = content.split('. ')
     key_points = sentences[:5]  # Take first 5 sentences as key points
@@ -818,22 +5100,27 @@ Condensed length: {len(' '.join(key_points).split())} words
 Reduction: {round((1 - len(' '.join(key_points).split()) / len(content.split())) * 100)}%
 """
 
-    return jsonify({
+    return {
         "condensed_content": condensed,
         "original_words": len(content.split()),
         "condensed_words": len(' '.join(key_points).split())
-    })
+    }
 
 
-@app.route('/api/podcast/convert', methods=['POST'])
-def convert_to_podcast():
-    """Convert article to podcast script"""
+@app.route('/api/tools/condense', methods=['POST'])
+def condense_text():
+    """Condense text to key points"""
     data = request.json
     content = data.get('content', '')
 
     if not content:
         return jsonify({"error": "Content required"}), 400
 
+    return jsonify(build_condensed_content(content))
+
+
+def build_podcast_script(content: str) -> Dict[str, Any]:
+    """Convert article to podcast script"""
     # Generate podcast script format
     podcast_script = f"""# Podcast Script
 
@@ -857,21 +5144,26 @@ Estimated Duration: {len(content.split()) // 150} minutes
 Format: Conversational podcast script
 """
 
-    return jsonify({
+    return {
         "podcast_script": podcast_script,
         "estimated_duration": f"{len(content.split()) // 150} minutes"
-    })
+    }
 
 
-@app.route('/api/video/essay', methods=['POST'])
-def create_video_essay():
-    """Create video essay script with scene breakdowns"""
+@app.route('/api/podcast/convert', methods=['POST'])
+def convert_to_podcast():
+    """Convert article to podcast script"""
     data = request.json
     content = data.get('content', '')
 
     if not content:
         return jsonify({"error": "Content required"}), 400
 
+    return jsonify(build_podcast_script(content))
+
+
+def build_video_essay_script(content: str) -> Dict[str, Any]:
+    """Create video essay script with scene breakdowns"""
     # Generate video essay structure
     video_essay = f"""# Video Essay Script
 
@@ -901,11 +5193,158 @@ Estimated Duration: 3:30
 Visual Style: Essay documentary
 """
 
-    return jsonify({
+    return {
         "video_essay_script": video_essay,
         "total_scenes": 4,
         "estimated_duration": "3:30"
-    })
+    }
+
+
+@app.route('/api/video/essay', methods=['POST'])
+def create_video_essay():
+    """Create video essay script with scene breakdowns"""
+    data = request.json
+    content = data.get('content', '')
+
+    if not content:
+        return jsonify({"error": "Content required"}), 400
+
+    return jsonify(build_video_essay_script(content))
+
+
+# ============================================================================
+# BATCH OPERATIONS
+# ============================================================================
+
+MAX_BATCH_OPERATIONS = int(os.environ.get('MAX_BATCH_OPERATIONS', 50))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 4))
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 16))
+
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch-op")
+
+
+class GenerateOperation(ContentGenerateRequest):
+    """content.generate in a batch (never streamed)"""
+    op: Literal["content.generate"]
+    id: Optional[str] = None
+    stream: Literal[False] = False
+
+
+class TransformOperation(BaseModel):
+    """A text transform in a batch"""
+    op: Literal["tools.mythic", "tools.condense", "podcast.convert", "video.essay"]
+    id: Optional[str] = None
+    content: str = Field(..., min_length=1)
+
+
+class ComicOperation(BaseModel):
+    op: Literal["comic.create"]
+    id: Optional[str] = None
+
+
+BatchOperation = Annotated[Union[GenerateOperation, TransformOperation, ComicOperation], Field(discriminator="op")]
+
+# Compiled once; a whole batch is validated in one call
+batch_operations_adapter = TypeAdapter(List[BatchOperation])
+
+TRANSFORMS = {
+    "tools.mythic": build_mythic_structure,
+    "tools.condense": build_condensed_content,
+    "podcast.convert": build_podcast_script,
+    "video.essay": build_video_essay_script,
+}
+
+
+def run_batch_operation(operation) -> tuple:
+    """Run one validated batch operation; returns (result body, HTTP status)"""
+    if operation.op == "content.generate":
+        return generate_text(operation.prompt, operation.persona)
+    if operation.op == "comic.create":
+        return queue_comic(), 200
+    return TRANSFORMS[operation.op](operation.content), 200
+
+
+def timed_batch_operation(operation) -> tuple:
+    started = time.perf_counter()
+    try:
+        result, status = run_batch_operation(operation)
+    except Exception as e:
+        result, status = {"error": str(e)}, 500
+    return result, status, (time.perf_counter() - started) * 1000
+
+
+def run_batch(operations: List[Any], concurrency: int):
+    """Yield NDJSON lines for each operation as it completes, then a summary line"""
+    started = time.perf_counter()
+    remaining = iter(enumerate(operations))
+    pending = {}
+    failed = 0
+
+    def submit_next():
+        for index, operation in remaining:
+            pending[batch_executor.submit(timed_batch_operation, operation)] = (index, operation)
+            return
+
+    try:
+        for _ in range(concurrency):
+            submit_next()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, operation = pending.pop(future)
+                result, status, duration_ms = future.result()
+                failed += status >= 400
+                submit_next()
+                yield json.dumps({
+                    "index": index,
+                    "id": operation.id,
+                    "op": operation.op,
+                    "status": status,
+                    "duration_ms": round(duration_ms, 1),
+                    "result": result
+                }) + "\n"
+        yield json.dumps({
+            "batch": {
+                "count": len(operations),
+                "failed": failed,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+        }) + "\n"
+    finally:
+        # The client went away: drop operations that have not started yet
+        for future in pending:
+            future.cancel()
+
+
+@app.route('/api/batch', methods=['POST'])
+def batch_operations():
+    """Run a list of content operations concurrently, streaming NDJSON results in completion order
+
+    Body: {"operations": [{"op": "content.generate" | "tools.mythic" | "tools.condense" |
+    "podcast.convert" | "video.essay" | "comic.create", "id": ..., ...}], "concurrency": N}
+    """
+    data = request.get_json(silent=True) or {}
+    raw_operations = data.get('operations')
+    if not isinstance(raw_operations, list) or not raw_operations:
+        return jsonify({"error": "operations must be a non-empty list"}), 400
+    if len(raw_operations) > MAX_BATCH_OPERATIONS:
+        return jsonify({"error": f"At most {MAX_BATCH_OPERATIONS} operations per batch"}), 400
+
+    try:
+        operations = batch_operations_adapter.validate_python(raw_operations)
+    except ValidationError as e:
+        return jsonify({
+            "error": "Invalid operations",
+            "details": e.errors(include_url=False, include_context=False, include_input=False)
+        }), 400
+
+    try:
+        concurrency = max(1, min(BATCH_CONCURRENCY, int(data.get('concurrency', BATCH_CONCURRENCY))))
+    except (TypeError, ValueError):
+        return jsonify({"error": "concurrency must be an integer"}), 400
+
+    return Response(stream_with_context(run_batch(operations, concurrency)), mimetype="application/x-ndjson",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @app.route('/api/models', methods=['GET'])
@@ -933,6 +5372,24 @@ def get_models_with_status():
     return jsonify(models)
 
 
+@app.route('/api/providers/status', methods=['GET'])
+def providers_status():
+    """Get provider client configuration and connection pool stats for this worker"""
+    return jsonify(provider_registry.stats())
+
+
+@app.route('/api/providers/limits', methods=['GET'])
+def providers_limits():
+    """Get provider rate limits, in-flight calls, queue depth and queue wait histograms"""
+    return jsonify(rate_limiter.stats())
+
+
+@app.route('/api/providers/routing', methods=['GET'])
+def providers_routing():
+    """Get the active model, provider order and per-provider latency/error rate"""
+    return jsonify(provider_router.status())
+
+
 @app.route('/api/settings/api-keys', methods=['GET'])
 def get_api_keys_status():
     """Get API keys configuration status"""
@@ -976,29 +5433,30 @@ def execute_sacred_circuits_workflow():
         article_title = data['article_title']
         sources = data.get('sources', [])
 
-        # Broadcast workflow start
-        broadcast_message({
-            "id": f"sacred-circuits_{int(time.time())}",
-            "timestamp": datetime.now().isoformat(),
-            "source": "SACRED_CIRCUITS",
-            "message": f"Starting Sacred Circuits workflow for: {article_title}",
-            "level": "info"
-        })
+        def run_workflow_outputs():
+            # Broadcast workflow start
+            broadcast_message({
+                "id": f"sacred-circuits_{int(time.time())}",
+                "timestamp": datetime.now().isoformat(),
+                "source": "SACRED_CIRCUITS",
+                "message": f"Starting Sacred Circuits workflow for: {article_title}",
+                "level": "info"
+            })
 
-        # Simulate workflow execution (in production, this would call actual AI models)
-        # For now, return structured response matching what frontend expects
+            # Simulate workflow execution (in production, this would call actual AI models)
+            # For now, return structured response matching what frontend expects
 
-        # Broadcast progress
-        broadcast_message({
-            "id": f"sacred-circuits_progress_{int(time.time())}",
-            "timestamp": datetime.now().isoformat(),
-            "source": "SACRED_CIRCUITS",
-            "message": "Generating Substack article...",
-            "level": "info"
-        })
+            # Broadcast progress
+            broadcast_message({
+                "id": f"sacred-circuits_progress_{int(time.time())}",
+                "timestamp": datetime.now().isoformat(),
+                "source": "SACRED_CIRCUITS",
+                "message": "Generating Substack article...",
+                "level": "info"
+            })
 
-        # Simulate Substack article generation
-        substack_article = f"""# {article_title}
+            # Simulate Substack article generation
+            substack_article = f"""# {article_title}
 
 ## Introduction
 This is a Substack-optimized article generated from your input.
@@ -1012,17 +5470,17 @@ Thank you for reading. Subscribe for more insights!
 ---
 *Generated by Sacred Circuits Workflow*"""
 
-        # Broadcast progress
-        broadcast_message({
-            "id": f"sacred-circuits_progress2_{int(time.time())}",
-            "timestamp": datetime.now().isoformat(),
-            "source": "SACRED_CIRCUITS",
-            "message": "Generating Medium article...",
-            "level": "info"
-        })
+            # Broadcast progress
+            broadcast_message({
+                "id": f"sacred-circuits_progress2_{int(time.time())}",
+                "timestamp": datetime.now().isoformat(),
+                "source": "SACRED_CIRCUITS",
+                "message": "Generating Medium article...",
+                "level": "info"
+            })
 
-        # Simulate Medium article generation
-        medium_article = f"""# {article_title}
+            # Simulate Medium article generation
+            medium_article = f"""# {article_title}
 
 *A deeper dive into the topic*
 
@@ -1038,19 +5496,16 @@ Check out these related articles...
 ---
 *Published via Sacred Circuits*"""
 
-        # Broadcast completion
-        broadcast_message({
-            "id": f"sacred-circuits_complete_{int(time.time())}",
-            "timestamp": datetime.now().isoformat(),
-            "source": "SACRED_CIRCUITS",
-            "message": f"Workflow completed: {article_title}",
-            "level": "success"
-        })
+            # Broadcast completion
+            broadcast_message({
+                "id": f"sacred-circuits_complete_{int(time.time())}",
+                "timestamp": datetime.now().isoformat(),
+                "source": "SACRED_CIRCUITS",
+                "message": f"Workflow completed: {article_title}",
+                "level": "success"
+            })
 
-        return jsonify({
-            "status": "success",
-            "workflow_id": f"sc_{int(time.time())}",
-            "outputs": {
+            return {
                 "substack_article": substack_article,
                 "medium_article": medium_article,
                 "word_count_substack": len(substack_article.split()),
@@ -1061,7 +5516,18 @@ Check out these related articles...
                     "Sacred geometry patterns with glowing circuits",
                     "Mystical technology fusion illustration"
                 ]
-            },
+            }
+
+        # Dashboards that submit the same article at once share a single run
+        flight_key = json.dumps([input_type, input_data, article_title, sources], sort_keys=True, default=str)
+        outputs, shared = sacred_circuits_flights.do(hashlib.sha256(flight_key.encode()).hexdigest(),
+                                                     run_workflow_outputs)
+
+        return jsonify({
+            "status": "success",
+            "workflow_id": f"sc_{int(time.time())}",
+            "outputs": outputs,
+            "coalesced": shared,
             "message": "Sacred Circuits workflow completed successfully"
         })
 
@@ -1106,37 +5572,123 @@ def toggle_integration(integration_name):
 # WEBSOCKET ENDPOINT
 # ============================================================================
 
-@sock.route('/ws')
-def websocket(ws):
-    """WebSocket endpoint for real-time updates"""
-    ws_clients.add(ws)
+def split_param(value: Optional[str]) -> Optional[List[str]]:
+    """Split a comma-separated query parameter"""
+    if value is None:
+        return None
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+def configure_ws_client(client: ClientConnection, encoding: Optional[str] = None, batch_ms: Any = None):
+    """Apply compact-channel encoding and batch window options to a client"""
+    if encoding in ("json", "msgpack"):
+        client.encoding = encoding if encoding == "json" or msgpack is not None else "json"
+    if batch_ms is not None:
+        try:
+            client.batch_window = min(max(float(batch_ms), 0.0), WS_MAX_BATCH_WINDOW_MS) / 1000
+        except (TypeError, ValueError):
+            pass
+
+
+def handle_ws_control(client: ClientConnection, data: str) -> bool:
+    """Apply a subscription control message; returns False if data is not one.
+
+    Protocol (JSON text frames):
+        {"action": "subscribe", "topics": ["SYSTEM.metrics", "SACRED_CIRCUITS.*"], "levels": ["error"]}
+        {"action": "subscribe", "topics": ["SYSTEM.metrics.compact"], "encoding": "msgpack", "batch_ms": 50}
+        {"action": "unsubscribe", "topics": ["SYSTEM.metrics"]}
+        {"action": "keyframe"}
+        {"action": "ping"}
+
+    With batch_ms set, messages queued within the window arrive as one JSON
+    (or MessagePack) array frame. SYSTEM.metrics.compact replaces the full
+    SYSTEM.metrics ticks unless SYSTEM.metrics is also subscribed by name.
+    """
+    try:
+        control = json.loads(data)
+    except ValueError:
+        return False
+    if not isinstance(control, dict) or control.get("action") not in ("subscribe", "unsubscribe", "keyframe", "ping"):
+        return False
+
+    action = control["action"]
+    topics = [str(topic) for topic in control.get("topics", [])]
+    if action == "subscribe":
+        configure_ws_client(client, control.get("encoding"), control.get("batch_ms"))
+        levels = control.get("levels")
+        broadcast_hub.subscribe(client, topics, [str(level) for level in levels] if levels is not None else None)
+    elif action == "unsubscribe":
+        broadcast_hub.unsubscribe(client, topics)
+    elif action == "keyframe":
+        broadcast_hub.metrics_channel.send_keyframe(client)
+        return True
+
+    client.send(json.dumps({
+        "id": f"{action}_{int(time.time())}",
+        "timestamp": datetime.now().isoformat(),
+        "source": "SYSTEM",
+        "type": "pong" if action == "ping" else "subscriptions",
+        "topics": sorted(client.topics),
+        "levels": sorted(client.levels) if client.levels is not None else None,
+        "encoding": client.encoding,
+        "batch_ms": round(client.batch_window * 1000),
+        "level": "info"
+    }))
+    return True
 
-    # Send welcome message
-    ws.send(json.dumps({
+
+def ws_welcome_message() -> str:
+    return json.dumps({
         "id": f"connect_{int(time.time())}",
         "timestamp": datetime.now().isoformat(),
         "source": "SYSTEM",
         "message": "Connected to JARVIS Unified Backend",
         "level": "success"
-    }))
+    })
+
+
+def ws_echo_message(data: str) -> str:
+    return json.dumps({
+        "id": f"echo_{int(time.time())}",
+        "timestamp": datetime.now().isoformat(),
+        "source": "ECHO",
+        "message": f"Received: {data}",
+        "level": "info"
+    })
+
+
+@sock.route('/ws')
+def websocket(ws):
+    """WebSocket endpoint for real-time updates
+
+    Subscribes to every topic unless ?topics=A.b,C.*&levels=info,error is given
+    (plus encoding=json|msgpack and batch_ms for the compact metrics channel),
+    until the first subscribe message; see handle_ws_control() for changing
+    subscriptions on the open socket.
+    """
+    client = ClientConnection(ws)
+    configure_ws_client(client, request.args.get('encoding'), request.args.get('batch_ms'))
+    broadcast_hub.add(client, split_param(request.args.get('topics')), split_param(request.args.get('levels')))
+
+    client.send(ws_welcome_message())
 
     try:
-        while True:
+        while not client.closed:
             # Keep connection alive
             data = ws.receive(timeout=30)
-            if data:
-                # Echo back for now
-                ws.send(json.dumps({
-                    "id": f"echo_{int(time.time())}",
-                    "timestamp": datetime.now().isoformat(),
-                    "source": "ECHO",
-                    "message": f"Received: {data}",
-                    "level": "info"
-                }))
+            if data and not handle_ws_control(client, data):
+                # Echo back anything that is not a control message
+                client.send(ws_echo_message(data))
     except:
         pass
     finally:
-        ws_clients.discard(ws)
+        broadcast_hub.remove(client)
+
+
+@app.route('/api/ws/stats', methods=['GET'])
+def websocket_stats():
+    """Get WebSocket outbound queue counters for this worker"""
+    return jsonify(broadcast_hub.stats())
 
 
 # ============================================================================
@@ -1144,27 +5696,40 @@ def websocket(ws):
 # ============================================================================
 
 def system_monitor():
-    """Background task to broadcast system updates"""
+    """Background task sending each new metrics snapshot to this worker's clients.
+
+    Every worker adopts the leader's snapshots, so each delivers locally;
+    publishing through the hub would reach every client once per worker.
+    """
+    last_sequence = metrics_sampler.sequence
     while True:
         try:
-            time.sleep(5)  # Update every 5 seconds
+            # Wake up on each fresh sample rather than sampling again here
+            if not metrics_sampler.wait_for_sample(last_sequence, timeout=METRICS_SAMPLE_INTERVAL * 2):
+                continue
+            last_sequence = metrics_sampler.sequence
 
             metrics = get_system_metrics()
 
-            broadcast_message({
+            broadcast_hub.publish_local({
                 "id": f"metrics_{int(time.time())}",
                 "timestamp": datetime.now().isoformat(),
                 "source": "SYSTEM",
                 "message": f"CPU: {metrics['cpu_load']}% | RAM: {metrics['memory_percent']}% | Optimization: {metrics['optimization_level']}%",
                 "level": "info",
                 "metrics": metrics
-            })
+            }, METRICS_TOPIC)
         except:
-            pass
+            time.sleep(1)
 
 
-# Start background monitor
-monitor_thread = threading.Thread(target=system_monitor, daemon=True)
+# Start the metrics sampler (leader) or follower, monitor and workflow workers; build the file indexes off the import path
+metrics_sampler.start()
+request_metrics.start()
+job_engine.start()
+threading.Thread(target=workflow_index.refresh, kwargs={"force": True}, name="workflow-index", daemon=True).start()
+threading.Thread(target=skills_catalog.refresh, kwargs={"force": True}, name="skills-catalog", daemon=True).start()
+monitor_thread = threading.Thread(target=system_monitor, name="system-monitor", daemon=True)
 monitor_thread.start()
 
 